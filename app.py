@@ -572,6 +572,10 @@ class OrkestraDeployment(cdk.Stack):
 
 if __name__ == "__main__":
 
+    from orkestra.instrumentation import trace_from_environment
+
+    trace_from_environment()
+
     app = cdk.App()
 
     region = os.getenv("CDK_DEFAULT_REGION", "us-east-2")
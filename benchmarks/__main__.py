@@ -0,0 +1,119 @@
+"""
+Run the benchmarks and store their results as json.
+
+    python -m benchmarks --output before.json
+    python -m benchmarks --suites import_time synth --sizes 10 100 1000
+
+Compare two runs with python -m benchmarks.compare before.json after.json
+"""
+
+import argparse
+import datetime
+import importlib
+import json
+import platform
+import subprocess
+import sys
+from importlib import metadata
+from pathlib import Path
+from typing import *
+
+from benchmarks import synth
+
+SUITES = ("import_time", "compose_call", "payload_codecs", "synth")
+
+RESULTS_DIRECTORY = Path(__file__).parent / "results"
+
+
+def version() -> Optional[str]:
+    """The installed orkestra's version, if it's installed."""
+
+    try:
+        return metadata.version("orkestra")
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def commit() -> Optional[str]:
+    """The checked out commit, if any."""
+
+    process = subprocess.run(
+        ["git", "describe", "--always", "--dirty"],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+    )
+
+    return process.stdout.strip() or None
+
+
+def run(
+    suites: Sequence[str] = SUITES,
+    sizes: Sequence[int] = synth.SIZES,
+    shapes: Sequence[str] = tuple(synth.SHAPES),
+) -> dict:
+    """Run each suite and return its results, along with the environment."""
+
+    report = {
+        "orkestra": version(),
+        "commit": commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "results": {},
+    }
+
+    for suite in suites:
+
+        print(f"# {suite}\n")
+
+        module = importlib.import_module(f"benchmarks.{suite}")
+
+        kwargs = {"sizes": sizes, "shapes": shapes} if suite == "synth" else {}
+
+        report["results"][suite] = module.main(**kwargs)
+
+        print()
+
+    return report
+
+
+def main(args=None):
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="where to write the results. "
+        "Default: benchmarks/results/<version or commit>.json",
+    )
+
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=SUITES)
+
+    parser.add_argument("--sizes", nargs="+", type=int, default=synth.SIZES)
+
+    parser.add_argument(
+        "--shapes",
+        nargs="+",
+        choices=tuple(synth.SHAPES),
+        default=tuple(synth.SHAPES),
+    )
+
+    args = parser.parse_args(args)
+
+    report = run(suites=args.suites, sizes=args.sizes, shapes=args.shapes)
+
+    output = args.output or RESULTS_DIRECTORY / (
+        f"{report['orkestra'] or report['commit'] or 'results'}.json"
+    )
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+
+    output.write_text(json.dumps(report, indent=2) + "\n")
+
+    print(f"wrote {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
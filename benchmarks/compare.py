@@ -0,0 +1,89 @@
+"""
+Compare two runs of the benchmarks, e.g. of two versions of orkestra.
+
+Every measurement is lower-is-better apart from compression ratios, which
+are left out. Exits with 1 if any measurement regressed by more than the
+threshold.
+
+    python -m benchmarks.compare before.json after.json --threshold 0.1
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import *
+
+_IGNORED = {"ratio"}
+
+
+def flatten(results: dict, prefix: str = "") -> Dict[str, float]:
+    """Return the numbers in nested results, keyed by their path."""
+
+    flattened = {}
+
+    for key, value in results.items():
+
+        path = f"{prefix}/{key}" if prefix else key
+
+        if isinstance(value, dict):
+            flattened.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and key not in _IGNORED:
+            flattened[path] = value
+
+    return flattened
+
+
+def compare(before: dict, after: dict) -> Dict[str, Tuple[float, float]]:
+    """Return the measurements both runs made, as (before, after)."""
+
+    before, after = flatten(before["results"]), flatten(after["results"])
+
+    return {key: (before[key], after[key]) for key in before if key in after}
+
+
+def main(args=None) -> int:
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+
+    parser.add_argument("before", type=Path)
+
+    parser.add_argument("after", type=Path)
+
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="the relative increase that counts as a regression",
+    )
+
+    args = parser.parse_args(args)
+
+    before, after = (
+        json.loads(p.read_text()) for p in (args.before, args.after)
+    )
+
+    comparison = compare(before, after)
+
+    width = max(map(len, comparison), default=0)
+
+    regressions = 0
+
+    for key, (old, new) in comparison.items():
+
+        change = (new - old) / old if old else 0.0
+
+        regressed = change > args.threshold
+
+        regressions += regressed
+
+        print(
+            f"{key:<{width}}  {old:12.3f} {new:12.3f} {change:+8.1%}"
+            + ("  regressed" if regressed else "")
+        )
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
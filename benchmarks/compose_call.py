@@ -0,0 +1,113 @@
+"""
+Per-invocation overhead of Compose.__call__.
+
+Compares calling the bare function, a composed function without powertools,
+with and without orkestra.metrics,
+the compiled handler that Compose now builds once per container, and
+re-wrapping the function with powertools on every call (the previous
+behavior). Also measures model handlers that trust their upstream function's
+output rather than validating it again.
+
+    python -m benchmarks.compose_call
+"""
+
+import os
+import timeit
+
+os.environ.setdefault("POWERTOOLS_TRACE_DISABLED", "1")
+os.environ.setdefault("POWERTOOLS_SERVICE_NAME", "benchmark")
+
+from aws_lambda_powertools import Logger, Tracer
+from pydantic import BaseModel
+
+from orkestra import compose, generic_context, powertools
+
+logger = Logger(level="WARNING")
+
+tracer = Tracer()
+
+EVENT = {"id": "1", "name": "potato", "price": 3.14}
+
+
+class Item(BaseModel):
+    id: str
+    name: str
+    price: float
+
+
+@compose
+def plain_handler(event, context):
+    return event
+
+
+@compose(metrics=True)
+def metrics_handler(event, context):
+    return event
+
+
+@compose(enable_powertools=True)
+def handler(event, context):
+    return event
+
+
+@compose(enable_powertools=True, model=Item)
+def model_handler(item: Item, context) -> Item:
+    return item
+
+
+@compose(enable_powertools=True, model=Item, trust_upstream=True)
+def trusted_model_handler(item: Item, context):
+    return item
+
+
+model_handler >> trusted_model_handler
+
+
+def rewrapped(composed):
+    def rewrap_every_call(event, context):
+        return powertools(
+            decorated=composed.func,
+            **composed.powertools_kwargs,
+        )(event, context)
+
+    return rewrap_every_call
+
+
+def measure(fn, number: int) -> float:
+    """Return the best per-call time in microseconds."""
+
+    timer = timeit.Timer(lambda: fn(EVENT, generic_context))
+
+    best = min(timer.repeat(repeat=5, number=number))
+
+    return best / number * 1e6
+
+
+def main(number: int = 2000):
+
+    results = {
+        "bare function": measure(handler.func, number),
+        "plain": measure(plain_handler, number),
+        "plain: metrics": measure(metrics_handler, number),
+    }
+
+    for name, composed in (("powertools", handler), ("model", model_handler)):
+
+        results[f"{name}: compiled"] = measure(composed, number)
+
+        results[f"{name}: re-wrapped per call"] = measure(
+            rewrapped(composed), number
+        )
+
+    results["model: trusted upstream"] = measure(trusted_model_handler, number)
+
+    width = max(map(len, results))
+
+    for name, micros in results.items():
+        print(f"{name:<{width}}  {micros:10.2f} µs/call")
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
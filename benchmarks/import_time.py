@@ -0,0 +1,74 @@
+"""
+Cold import time of orkestra, with and without powertools.
+
+Each import runs in a fresh interpreter, as it would during a lambda's INIT
+phase, and the best of several runs is kept.
+
+    python -m benchmarks.import_time
+"""
+
+import subprocess
+import sys
+
+IMPORTS = {
+    "orkestra": "import orkestra",
+    "orkestra.compose": "from orkestra import compose",
+    "orkestra.compose + powertools": (
+        "from orkestra import compose\n"
+        "from aws_lambda_powertools import Logger, Metrics, Tracer"
+    ),
+    "orkestra.compose + powertools parser": (
+        "from orkestra import compose\n"
+        "from aws_lambda_powertools import Logger, Metrics, Tracer\n"
+        "from aws_lambda_powertools.utilities.parser import event_parser"
+    ),
+}
+
+_TIMED = (
+    "import time\n"
+    "start = time.perf_counter()\n"
+    "{source}\n"
+    "print(time.perf_counter() - start)\n"
+)
+
+
+def measure(source: str, repeat: int, python: str = sys.executable) -> float:
+    """Return the best time, in milliseconds, to run source in a new process."""
+
+    times = []
+
+    for _ in range(repeat):
+
+        process = subprocess.run(
+            [python, "-c", _TIMED.format(source=source)],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        times.append(float(process.stdout) * 1e3)
+
+    return min(times)
+
+
+def main(repeat: int = 5):
+
+    results = {}
+
+    width = max(map(len, IMPORTS))
+
+    for name, source in IMPORTS.items():
+
+        try:
+            results[name] = millis = measure(source, repeat)
+        except subprocess.CalledProcessError as e:
+            print(f"{name:<{width}}  skipped: {e.stderr.splitlines()[-1]}")
+            continue
+
+        print(f"{name:<{width}}  {millis:10.2f} ms")
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
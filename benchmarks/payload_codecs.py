@@ -0,0 +1,87 @@
+"""
+Size and encode/decode time of inter-step payloads under each codec.
+
+Uses the payloads of examples/hello_orkestra.py's copy_item and a list of
+floats like the ones map jobs pass around.
+
+    python -m benchmarks.payload_codecs
+"""
+
+import json
+import random
+import timeit
+
+from orkestra.codecs import Codec, decode
+
+CODECS = (
+    "json",
+    "json+gzip",
+    "columnar+json+gzip",
+    "msgpack",
+    "msgpack+zstd",
+    "columnar+msgpack+zstd",
+)
+
+PAYLOADS = {
+    "records": [
+        {
+            "id": "5f1d7e0e-5b2a-4c63-9d3c-2f6a3c1b9e47",
+            "name": random.choice(["potato", "moon rock", "hat"]),
+            "price": random.random() * 10,
+        }
+        for _ in range(1000)
+    ],
+    "floats": [random.random() for _ in range(10_000)],
+}
+
+
+def measure(fn, number: int) -> float:
+    """Return the best per-call time in microseconds."""
+
+    best = min(timeit.Timer(fn).repeat(repeat=5, number=number))
+
+    return best / number * 1e6
+
+
+def main(number: int = 50):
+
+    results = {}
+
+    for payload_name, payload in PAYLOADS.items():
+
+        size = len(json.dumps(payload))
+
+        print(f"{payload_name}: {size:,} bytes as json")
+
+        for name in CODECS:
+
+            try:
+                codec = Codec.from_string(name)
+                envelope = codec.encode(payload)
+            except ImportError as e:
+                print(f"  {name:<24} skipped: {e}")
+                continue
+
+            encoded_size = len(json.dumps(envelope))
+
+            results[f"{payload_name}: {name}"] = result = {
+                "bytes": encoded_size,
+                "ratio": size / encoded_size,
+                "encode_us": measure(lambda: codec.encode(payload), number),
+                "decode_us": measure(lambda: decode(envelope), number),
+            }
+
+            print(
+                f"  {name:<24} {encoded_size:>10,} bytes "
+                f"{result['ratio']:6.1f}x "
+                f"{result['encode_us']:10.1f} µs encode "
+                f"{result['decode_us']:10.1f} µs decode"
+            )
+
+        print()
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Time and memory of rendering synthetic DAGs as they grow.
+
+Builds chain, fan-out, diamond and map-heavy compositions of 10 to 10,000
+functions, and measures definition(), state_machine() and to_asl() for each.
+Bundling is skipped, so this measures orkestra and the cdk, not docker.
+
+Memory is the peak of python's own allocations, from tracemalloc. The jsii
+runtime's node process isn't counted.
+
+    python -m benchmarks.synth --sizes 10 100 1000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import *
+
+from orkestra import compose
+from orkestra.decorators import Compose
+
+SIZES = (10, 100, 1000, 10_000)
+
+
+def step(name: str, **kwargs) -> Compose:
+    """Compose a do-nothing function named name, as if defined here."""
+
+    def fn(event, context):
+        return event
+
+    fn.__name__ = fn.__qualname__ = name
+
+    # so its lambda's index is this file, even when run with python -m
+    fn.__module__ = "benchmarks.synth"
+
+    return compose(**kwargs)(fn) if kwargs else compose(fn)
+
+
+def chain(n: int) -> Compose:
+    """a >> b >> c >> ..."""
+
+    head, *rest = [step(f"chain_{i}") for i in range(n)]
+
+    last = head
+
+    for composable in rest:
+        last = last >> composable
+
+    return head
+
+
+def fan_out(n: int) -> Compose:
+    """a >> [b, c, d, ...]"""
+
+    head = step("fan_out_0")
+
+    head >> [step(f"fan_out_{i}") for i in range(1, n)]
+
+    return head
+
+
+def diamond(n: int) -> Compose:
+    """a >> [b, c] >> d >> [e, f] >> g ..."""
+
+    head = last = step("diamond_0")
+
+    for i in range(1, n - 2, 3):
+        last = (
+            last
+            >> [step(f"diamond_{i}"), step(f"diamond_{i + 1}")]
+            >> step(f"diamond_{i + 2}")
+        )
+
+    return head
+
+
+def map_heavy(n: int) -> Compose:
+    """Alternating map jobs and the functions that split their input."""
+
+    head = last = step("map_heavy_0")
+
+    for i in range(1, n):
+        composable = (
+            step(f"map_heavy_{i}", is_map_job=True)
+            if i % 2
+            else step(f"map_heavy_{i}")
+        )
+        last = last >> composable
+
+    return head
+
+
+SHAPES = {
+    "chain": chain,
+    "fan_out": fan_out,
+    "diamond": diamond,
+    "map_heavy": map_heavy,
+}
+
+
+def measure(fn: Callable) -> Dict[str, float]:
+    """Call fn once and return its time in seconds and peak memory in MiB."""
+
+    tracemalloc.start()
+
+    start = time.perf_counter()
+
+    try:
+        fn()
+    finally:
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {"seconds": seconds, "peak_mib": peak / 2 ** 20}
+
+
+def render(root: Compose, method: str, outdir: str):
+    """Render root with method in a stack of its own."""
+
+    from aws_cdk import core as cdk
+
+    app = cdk.App(
+        outdir=outdir,
+        context={"aws:cdk:bundling-stacks": []},
+    )
+
+    stack = cdk.Stack(app, "benchmark")
+
+    if method == "definition":
+        root.definition(stack)
+    else:
+        root.state_machine(stack, "benchmark")
+
+    return stack
+
+
+def main(
+    sizes: Sequence[int] = SIZES,
+    shapes: Sequence[str] = tuple(SHAPES),
+):
+
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        # keep bundles out of the real asset cache
+        os.environ.setdefault("ORKESTRA_ASSET_CACHE", directory)
+
+        # start jsii's node process, so that the first render doesn't pay
+        render(chain(2), "definition", directory)
+
+        for shape in shapes:
+
+            for size in sizes:
+
+                root = SHAPES[shape](size)
+
+                results[f"{shape}: {size}"] = result = {
+                    "to_asl": measure(root.to_asl),
+                    **{
+                        method: measure(
+                            lambda: render(root, method, directory)
+                        )
+                        for method in ("definition", "state_machine")
+                    },
+                }
+
+                print(
+                    f"{shape:<10} {size:>6,} functions "
+                    + " ".join(
+                        f"{method} {r['seconds']:8.3f}s "
+                        f"{r['peak_mib']:8.1f} MiB"
+                        for method, r in result.items()
+                    )
+                )
+
+    return results
+
+
+def parse_args(args=None) -> argparse.Namespace:
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES)
+
+    parser.add_argument(
+        "--shapes", nargs="+", choices=tuple(SHAPES), default=tuple(SHAPES)
+    )
+
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(sizes=args.sizes, shapes=args.shapes)
@@ -38,3 +38,92 @@ def invalid_composition(event, context):
 
 
 invalid_composition >> invalid_composition
+
+
+@compose(is_map_job=True, batch_size=100, items_path="$.items")
+def batched_double(n, context):
+    return n * 2
+
+
+@compose(
+    is_map_job=True,
+    item_source="s3",
+    items_location="s3://orkestra-example-items/items",
+    result_location="s3://orkestra-example-items/results",
+    max_concurrency=1000,
+)
+def distributed_double(n, context):
+    return n * 2
+
+
+@compose(
+    is_map_job=True,
+    item_source="auto",
+    items_location="s3://orkestra-example-items/staged",
+    distributed_threshold=5,
+    batch_size=2,
+    capture_map_errors=True,
+)
+def auto_invert(n, context):
+    return 1 / n
+
+
+@compose(offload_location="s3://orkestra-example-items/offloaded")
+def large_output(event, context):
+    return ["x" * 1024] * 1024
+
+
+@compose
+def output_size(event, context):
+    return sum(map(len, event))
+
+
+large_output >> output_size
+
+
+@compose(offload_location="s3://orkestra-example-items/offloaded")
+def offloaded_numbers(event, context):
+    return list(range(event))
+
+
+@compose(is_map_job=True)
+def double_offloaded(n, context):
+    return n * 2
+
+
+offloaded_numbers >> double_offloaded
+
+
+@compose(
+    comment="select the order's items",
+    output_path="$.order",
+    retry_on_service_exceptions=False,
+)
+def select_items(event, context):
+    return {"order": event}
+
+
+@compose(
+    is_map_job=True,
+    items_path="$.items",
+    max_concurrency=3,
+    result_path="$.prices",
+    capture_map_errors=True,
+)
+def price_item(item, context):
+    return item["price"]
+
+
+select_items >> price_item
+
+
+def state_machine_stack(scope, id, root="large_output", **kwargs):
+    """A stack of the state machine of the function named root in this module."""
+
+    from aws_cdk import core as cdk
+
+    stack = cdk.Stack(scope, id, **kwargs)
+
+    globals()[root].state_machine(stack, "state_machine", fuse=True)
+
+    return stack
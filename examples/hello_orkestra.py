@@ -62,7 +62,7 @@ def generate_item(event, context):
 
 
 @compose(model=Item, **default_args)
-def add_price(item: Item, context):
+def add_price(item: Item, context) -> Item:
     price = 3.14
     logger.info(
         "adding price to item",
@@ -72,19 +72,23 @@ def add_price(item: Item, context):
         },
     )
     item.price = price
-    return item.dict()
+    return item
 
 
-@compose(model=Item, **default_args)
-def copy_item(item: Item, context) -> list:
+# add_price and copy_item are annotated to return the model, so their output
+# needn't be validated again
+
+
+@compose(model=Item, trust_upstream=True, **default_args)
+def copy_item(item: Item, context) -> List[Item]:
     logger.info(item.dict())
-    return [item.dict()] * 10
+    return [item] * 10
 
 
-@compose(model=Item, is_map_job=True, **default_args)
+@compose(model=Item, trust_upstream=True, is_map_job=True, **default_args)
 def double_price(item: Item, context):
     item.price = item.price * 2
-    return item.dict()
+    return item
 
 
 @compose(**default_args)
@@ -1,3 +1,4 @@
+import importlib
 import logging
 
 logger = logging.getLogger(__name__)
@@ -5,5 +6,33 @@ logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
 
-from orkestra.decorators import compose, powertools
-from orkestra.utils import coerce, generic_context
+# public names are resolved on first access so that a lambda only pays,
+# during INIT, for the modules its handler actually touches
+
+_lazy_attributes = {
+    "compose": "orkestra.decorators",
+    "powertools": "orkestra.decorators",
+    "coerce": "orkestra.utils",
+    "generic_context": "orkestra.utils",
+}
+
+__all__ = list(_lazy_attributes)
+
+
+def __getattr__(name):
+
+    if name not in _lazy_attributes:
+
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    module = importlib.import_module(_lazy_attributes[name])
+
+    value = getattr(module, name)
+
+    globals()[name] = value
+
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attributes))
@@ -0,0 +1,663 @@
+"""
+Render a composition's Amazon States Language without cdk.
+
+Compose.definition builds cdk constructs, which needs aws_cdk and the jsii
+runtime. This renders the same states as plain dicts, with a placeholder
+for each lambda's ARN, for diffing definitions, tests, or local runners.
+"""
+
+from dataclasses import dataclass
+from typing import *
+
+from orkestra.decorators import (
+    _BATCH_KEY,
+    _ITEMS_KEY,
+    _LAMBDA_SERVICE_RETRY,
+    _OUTPUT_PATHS,
+    _omit,
+    _seconds,
+)
+from orkestra.graph import Graph
+from orkestra.utils import _coalesce
+
+# lambda_invoke_kwargs and map_job_kwargs, by the field they render to
+
+_TASK_FIELDS = (
+    ("comment", "Comment"),
+    ("input_path", "InputPath"),
+    ("output_path", "OutputPath"),
+    ("result_path", "ResultPath"),
+    ("result_selector", "ResultSelector"),
+)
+
+_MAP_FIELDS = (
+    *_TASK_FIELDS,
+    ("parameters", "Parameters"),
+    ("items_path", "ItemsPath"),
+    ("max_concurrency", "MaxConcurrency"),
+)
+
+_INVOCATION_TYPES = {
+    "DRY_RUN": "DryRun",
+    "EVENT": "Event",
+    "REQUEST_RESPONSE": "RequestResponse",
+}
+
+_TERMINAL_TYPES = ("Choice", "Succeed", "Fail")
+
+
+class Placeholders:
+    """
+    Give each function rendered a ${name}, as substituted by a state machine's DefinitionSubstitutions.
+
+    A function is named for its __name__, numbered from 2 if an earlier
+    function in the definition has the same name, e.g. a.handler and
+    b.handler are ${handler} and ${handler2}.
+    """
+
+    def __init__(self):
+
+        # the function each name stands for, in the order they're rendered
+
+        self.functions: Dict[str, "Compose"] = {}
+
+        self._names: Dict["Compose", str] = {}
+
+    def __call__(self, composable: "Compose") -> str:
+
+        name = self._names.get(composable)
+
+        if name is None:
+
+            base = composable.func.__name__
+
+            name, number = base, 2
+
+            while name in self.functions:
+
+                name = f"{base}{number}"
+
+                number += 1
+
+            self.functions[name] = composable
+
+            self._names[composable] = name
+
+        return "${" + name + "}"
+
+
+def _fields(kwargs: dict, fields: Sequence[Tuple[str, str]]) -> dict:
+
+    return {
+        field: kwargs[key]
+        for key, field in fields
+        if kwargs.get(key) is not None
+    }
+
+
+def _name(value) -> str:
+    """The name of an orkestra or cdk enum member, or a string."""
+    return getattr(value, "name", value)
+
+
+@dataclass
+class _Fragment:
+    """Rendered states, entered at start, and left from ends."""
+
+    start: str
+    ends: List[str]
+
+
+class _Renderer:
+    """
+    Render states into one graph, i.e. a state machine, iterator, or branch.
+
+    States are named by graph.state_ids, as Compose.definition names its
+    construct ids, so a composition gets the same names from both.
+    """
+
+    def __init__(
+        self,
+        function_arn: Callable[["Compose"], Any],
+        ids: Optional[Dict["Compose", str]] = None,
+    ):
+
+        self.function_arn = function_arn
+
+        self.ids = ids if ids is not None else {}
+
+        self.states = {}
+
+    def child(self) -> "_Renderer":
+        return _Renderer(self.function_arn, self.ids)
+
+    def add(self, name: str, state: dict) -> _Fragment:
+
+        self.states[name] = state
+
+        return _Fragment(name, [name])
+
+    def link(self, fragment: _Fragment, following: _Fragment):
+
+        for end in fragment.ends:
+
+            self.states[end]["Next"] = following.start
+
+    def graph(self, start: str) -> dict:
+        """Return the rendered graph, ending the states that lead nowhere."""
+
+        for state in self.states.values():
+
+            if "Next" not in state and state["Type"] not in _TERMINAL_TYPES:
+
+                state.setdefault("End", True)
+
+        return {"StartAt": start, "States": self.states}
+
+    def invoke(
+        self,
+        composable: "Compose",
+        invoke_kwargs: dict,
+        payload: Optional[dict] = None,
+    ) -> dict:
+        """A task state that invokes composable's lambda, like LambdaInvoke."""
+
+        state = {"Type": "Task", **_fields(invoke_kwargs, _TASK_FIELDS)}
+
+        for key, field in (
+            ("timeout", "TimeoutSeconds"),
+            ("heartbeat", "HeartbeatSeconds"),
+        ):
+
+            if invoke_kwargs.get(key) is not None:
+
+                state[field] = _seconds(invoke_kwargs[key])
+
+        if invoke_kwargs.get("retry_on_service_exceptions", True):
+
+            state["Retry"] = [dict(_LAMBDA_SERVICE_RETRY)]
+
+        function_arn = self.function_arn(composable)
+
+        if invoke_kwargs.get("payload_response_only"):
+
+            state["Resource"] = function_arn
+
+            if payload is not None:
+
+                state["Parameters"] = payload
+
+            return state
+
+        resource = "arn:aws:states:::lambda:invoke"
+
+        if _name(invoke_kwargs.get("integration_pattern")) == (
+            "WAIT_FOR_TASK_TOKEN"
+        ):
+
+            resource += ".waitForTaskToken"
+
+        parameters = {"FunctionName": function_arn}
+
+        if payload is None:
+
+            parameters["Payload.$"] = "$"
+
+        else:
+
+            parameters["Payload"] = payload
+
+        if invoke_kwargs.get("invocation_type") is not None:
+
+            parameters["InvocationType"] = _INVOCATION_TYPES[
+                _name(invoke_kwargs["invocation_type"])
+            ]
+
+        for key, field in (
+            ("client_context", "ClientContext"),
+            ("qualifier", "Qualifier"),
+        ):
+
+            if invoke_kwargs.get(key) is not None:
+
+                parameters[field] = invoke_kwargs[key]
+
+        state.update(Resource=resource, Parameters=parameters)
+
+        return state
+
+    @staticmethod
+    def catch(state: dict, handler: str):
+
+        state["Catch"] = [{"ErrorEquals": ["States.ALL"], "Next": handler}]
+
+    def composition(
+        self,
+        root: "Compose",
+        payload_response_only: bool,
+        fuse: bool,
+    ) -> str:
+        """Render root and everything downstream of it, like Compose.definition."""
+
+        graph = Graph(root)
+
+        self.ids = graph.ids
+
+        chains = {}
+
+        fragments = {}
+
+        for node in graph:
+
+            node._check_renderable(graph.upstream[node])
+
+            if node in chains:
+                continue
+
+            if node.is_map_job:
+
+                chain = node.fusible_maps()
+
+                fragment = (
+                    self.fused_map(chain)
+                    if len(chain) > 1
+                    else self.task(node, payload_response_only)
+                )
+
+            else:
+
+                chain = node.fusible_chain() if fuse else [node]
+
+                fragment = (
+                    self.fused_task(chain)
+                    if len(chain) > 1
+                    else self.task(node, payload_response_only)
+                )
+
+            for c in chain:
+                chains[c] = chain
+
+            fragments[node] = fragment
+
+        for node, fragment in fragments.items():
+
+            for upstream in graph.upstream[node]:
+
+                self.link(fragments[chains[upstream][0]], fragment)
+
+        return fragments[root].start
+
+    def task(
+        self,
+        composable: "Compose",
+        payload_response_only: bool,
+    ) -> _Fragment:
+        """Render a single step, like Compose.task."""
+
+        if composable.is_map_job:
+
+            id = self.ids[composable]
+
+            if composable.item_source == "auto":
+
+                return self.auto_map(composable, id)
+
+            elif composable.item_source == "s3":
+
+                return self.distributed_map(
+                    composable, id, composable.map_job_kwargs
+                )
+
+            elif composable.batch_size:
+
+                return self.batched_map(composable, id)
+
+            return self.map_state(
+                composable,
+                id,
+                map_kwargs=_coalesce(composable.map_job_kwargs),
+                invoke_kwargs=_coalesce(
+                    composable.lambda_invoke_kwargs,
+                    payload_response_only=payload_response_only,
+                ),
+            )
+
+        elif isinstance(composable.func, (list, tuple)):
+
+            id = self.ids[composable]
+
+            branches = []
+
+            for fn in composable.func:
+
+                branch = self.child()
+
+                name = self.ids[fn]
+
+                state = branch.invoke(
+                    fn,
+                    _coalesce(
+                        composable.lambda_invoke_kwargs,
+                        payload_response_only=payload_response_only,
+                    ),
+                )
+
+                branch.add(name, state)
+
+                if isinstance(composable.func, tuple):
+
+                    failed = f"{name}_failed"
+
+                    self.catch(state, failed)
+
+                    branch.add(failed, {"Type": "Pass"})
+
+                branches.append(branch.graph(name))
+
+            return self.add(id, {"Type": "Parallel", "Branches": branches})
+
+        return self.add(
+            self.ids[composable],
+            self.invoke(
+                composable,
+                _coalesce(
+                    composable.lambda_invoke_kwargs,
+                    payload_response_only=payload_response_only,
+                ),
+            ),
+        )
+
+    def map_state(
+        self,
+        composable: "Compose",
+        id: str,
+        map_kwargs: dict,
+        invoke_kwargs: dict,
+    ) -> _Fragment:
+
+        iterator = self.child()
+
+        task_id = f"invoke_{id}"
+
+        state = iterator.invoke(composable, invoke_kwargs)
+
+        iterator.add(task_id, state)
+
+        if composable.capture_map_errors:
+
+            self.catch(state, f"{task_id}_failed")
+
+            iterator.add(f"{task_id}_failed", {"Type": "Pass"})
+
+        return self.add(
+            id,
+            {
+                "Type": "Map",
+                "Iterator": iterator.graph(task_id),
+                **_fields(map_kwargs, _MAP_FIELDS),
+            },
+        )
+
+    def flatten(
+        self,
+        composable: "Compose",
+        id: str,
+        invoke_kwargs: dict,
+    ) -> _Fragment:
+
+        return self.add(
+            f"flatten_{id}",
+            self.invoke(
+                composable,
+                _coalesce(
+                    invoke_kwargs,
+                    output_path=composable.map_job_kwargs["output_path"],
+                    result_selector=composable.map_job_kwargs[
+                        "result_selector"
+                    ],
+                ),
+                payload={_BATCH_KEY: "flatten", "items.$": "$"},
+            ),
+        )
+
+    def batched_map(
+        self,
+        composable: "Compose",
+        id: str,
+        select_items: bool = True,
+    ) -> _Fragment:
+
+        invoke_kwargs = composable._batch_invoke_kwargs(None)
+
+        map_job_kwargs = composable.map_job_kwargs
+
+        items_path, input_path = (
+            (map_job_kwargs["items_path"], map_job_kwargs["input_path"])
+            if select_items
+            else (None, None)
+        )
+
+        split = self.add(
+            f"split_{id}",
+            self.invoke(
+                composable,
+                _coalesce(invoke_kwargs, input_path=input_path),
+                payload={_BATCH_KEY: "split", "items.$": items_path or "$"},
+            ),
+        )
+
+        task = self.map_state(
+            composable,
+            id,
+            map_kwargs=_omit(
+                _coalesce(map_job_kwargs),
+                "input_path",
+                "items_path",
+                "output_path",
+                "result_selector",
+            ),
+            invoke_kwargs=invoke_kwargs,
+        )
+
+        flatten = self.flatten(composable, id, invoke_kwargs)
+
+        self.link(split, task)
+
+        self.link(task, flatten)
+
+        return _Fragment(split.start, flatten.ends)
+
+    def distributed_map(
+        self,
+        composable: "Compose",
+        id: str,
+        map_kwargs: dict,
+    ) -> _Fragment:
+
+        task = self.add(
+            id,
+            composable._distributed_map_json(
+                self.function_arn(composable), id, map_kwargs
+            ),
+        )
+
+        if composable.batch_size and composable.result_location is None:
+
+            flatten = self.flatten(
+                composable, id, composable._batch_invoke_kwargs(None)
+            )
+
+            self.link(task, flatten)
+
+            return _Fragment(task.start, flatten.ends)
+
+        return task
+
+    def auto_map(self, composable: "Compose", id: str) -> _Fragment:
+
+        map_job_kwargs = composable.map_job_kwargs
+
+        stage = self.add(
+            f"stage_{id}",
+            self.invoke(
+                composable,
+                _coalesce(
+                    composable._batch_invoke_kwargs(None),
+                    input_path=map_job_kwargs["input_path"],
+                ),
+                payload={
+                    _ITEMS_KEY: "stage",
+                    "items.$": map_job_kwargs["items_path"] or "$",
+                },
+            ),
+        )
+
+        map_kwargs = _omit(
+            _coalesce(map_job_kwargs),
+            "input_path",
+            "items_path",
+        )
+
+        distributed = self.distributed_map(
+            composable, f"{id}_distributed", map_kwargs
+        )
+
+        if composable.batch_size:
+
+            inline = self.batched_map(
+                composable, f"{id}_inline", select_items=False
+            )
+
+        else:
+
+            inline = self.map_state(
+                composable,
+                f"{id}_inline",
+                map_kwargs=map_kwargs,
+                invoke_kwargs=_coalesce(composable.lambda_invoke_kwargs),
+            )
+
+        choice = self.add(
+            f"{id}_item_source",
+            {
+                "Type": "Choice",
+                "Choices": [
+                    {
+                        "Variable": "$.bucket",
+                        "IsPresent": True,
+                        "Next": distributed.start,
+                    }
+                ],
+                "Default": inline.start,
+            },
+        )
+
+        self.link(stage, choice)
+
+        return _Fragment(stage.start, [*distributed.ends, *inline.ends])
+
+    def fused_map(self, chain: List["Compose"]) -> _Fragment:
+        """Render one map state for a chain of map jobs, like Compose._fused_map."""
+
+        first, last = chain[0], chain[-1]
+
+        concurrency = [
+            c.map_job_kwargs["max_concurrency"]
+            for c in chain
+            if c.map_job_kwargs.get("max_concurrency")
+        ]
+
+        map_kwargs = _coalesce(
+            {
+                k: first.map_job_kwargs.get(k)
+                for k in ("comment", "input_path", "items_path", "parameters")
+            },
+            {k: last.map_job_kwargs.get(k) for k in _OUTPUT_PATHS},
+            max_concurrency=min(concurrency) if concurrency else None,
+        )
+
+        id = "_".join(self.ids[c] for c in chain)
+
+        iterator = self.child()
+
+        invocations = [
+            iterator.add(
+                f"invoke_{self.ids[c]}",
+                iterator.invoke(c, _coalesce(c.lambda_invoke_kwargs)),
+            )
+            for c in chain
+        ]
+
+        for c, invoke, following in zip(
+            chain,
+            invocations,
+            [*invocations[1:], None],
+        ):
+
+            if following is not None:
+                iterator.link(invoke, following)
+
+            if c.capture_map_errors:
+
+                failed = iterator.add(
+                    f"{invoke.start}_failed", {"Type": "Pass"}
+                )
+
+                if following is not None:
+                    iterator.link(failed, following)
+
+                self.catch(iterator.states[invoke.start], failed.start)
+
+        return self.add(
+            id,
+            {
+                "Type": "Map",
+                "Iterator": iterator.graph(invocations[0].start),
+                **_fields(map_kwargs, _MAP_FIELDS),
+            },
+        )
+
+    def fused_task(self, chain: List["Compose"]) -> _Fragment:
+        """Render one invocation for a chain of functions, like Compose._fused_task."""
+
+        first, last = chain[0], chain[-1]
+
+        return self.add(
+            "_".join(self.ids[c] for c in chain),
+            self.invoke(
+                first,
+                _coalesce(
+                    _omit(first.lambda_invoke_kwargs, *_OUTPUT_PATHS),
+                    {
+                        k: last.lambda_invoke_kwargs.get(k)
+                        for k in _OUTPUT_PATHS
+                    },
+                ),
+            ),
+        )
+
+
+def render(
+    composable: "Compose",
+    payload_response_only: bool = True,
+    fuse: bool = False,
+    function_arn: Optional[Callable[["Compose"], Any]] = None,
+) -> dict:
+    """
+    Render composable's state machine definition.
+
+    Args:
+        composable: the first step
+        payload_response_only: as in Compose.task
+        fuse: as in Compose.definition
+        function_arn: returns the ARN to invoke for each function. Default: Placeholders()
+
+    Returns: the definition, as a dict ready to be dumped to json
+
+    """
+
+    renderer = _Renderer(function_arn or Placeholders())
+
+    start = renderer.composition(composable, payload_response_only, fuse)
+
+    return renderer.graph(start)
@@ -0,0 +1,242 @@
+"""
+Hash lambda entry directories and cache their bundles between synths.
+
+Every function composed in a module shares the module's directory as its
+entry, so a stack of them bundles the same directory again and again.
+Giving each function the hash of its entry's contents lets cdk bundle it
+once per synth; keeping the bundles in a cache directory, outside cdk.out,
+lets later synths skip bundling entirely while nothing has changed.
+
+Bundles are only cached when the ORKESTRA_ASSET_CACHE environment variable
+names a directory to keep them in. A cached bundle is restored for as long
+as its entry and runtime are unchanged, so one that was built wrong stays
+until the directory is cleared.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import *
+
+ASSET_CACHE_ENV = "ORKESTRA_ASSET_CACHE"
+
+# never bundled in a way that matters, or too large and volatile to hash
+
+_IGNORED_DIRECTORIES = frozenset(
+    ("__pycache__", ".git", ".venv", "node_modules", "cdk.out")
+)
+
+_IGNORED_SUFFIXES = (".pyc",)
+
+
+def _files(entry: Path) -> Iterator[Path]:
+    """The files under entry that are hashed, in a stable order."""
+
+    for root, directories, files in os.walk(entry):
+
+        directories[:] = sorted(
+            d for d in directories if d not in _IGNORED_DIRECTORIES
+        )
+
+        for name in sorted(files):
+
+            if not name.endswith(_IGNORED_SUFFIXES):
+
+                yield Path(root, name)
+
+
+def _signature(entry: Path) -> Tuple[Tuple[str, int, int], ...]:
+    """What's cheap to know about entry's files without reading them."""
+
+    signature = []
+
+    for path in _files(entry):
+
+        stat = path.stat()
+
+        signature.append(
+            (
+                path.relative_to(entry).as_posix(),
+                stat.st_size,
+                stat.st_mtime_ns,
+            )
+        )
+
+    return tuple(signature)
+
+
+@functools.lru_cache()
+def _content_hash(entry: Path, signature: tuple) -> str:
+
+    digest = hashlib.sha256()
+
+    for relative_path, *_ in signature:
+
+        digest.update(relative_path.encode() + b"\0")
+
+        digest.update(
+            hashlib.sha256((entry / relative_path).read_bytes()).digest()
+        )
+
+    return digest.hexdigest()
+
+
+def entry_hash(entry: Union[str, Path]) -> str:
+    """
+    Hash the contents of a lambda's entry directory.
+
+    The directory's requirements.txt, Pipfile, or pyproject.toml is what its
+    bundle installs, so it's hashed along with the code. Files are only
+    read again once their size or modification time changes.
+
+    Args:
+        entry: the directory
+
+    Returns: a hex digest
+
+    """
+
+    entry = Path(entry).resolve()
+
+    return _content_hash(entry, _signature(entry))
+
+
+def bundle_hash(entry: Union[str, Path], runtime) -> str:
+    """
+    Hash everything a lambda's bundle is built from.
+
+    That's its entry's contents, dependency files included, and the runtime
+    and docker image it's bundled for.
+
+    Args:
+        entry: the directory
+        runtime: an aws_lambda.Runtime
+
+    Returns: a hex digest
+
+    """
+
+    digest = hashlib.sha256(entry_hash(entry).encode())
+
+    image = getattr(runtime, "bundling_docker_image", None)
+
+    digest.update(
+        json.dumps(
+            [
+                getattr(runtime, "name", str(runtime)),
+                getattr(image, "image", None),
+            ]
+        ).encode()
+    )
+
+    return digest.hexdigest()
+
+
+def _copy(source: Path, destination: Path):
+    """Copy a directory, writing it under a temporary name and renaming it."""
+
+    temporary = destination.with_name(f"{destination.name}.{uuid.uuid4()}")
+
+    shutil.copytree(source, temporary, symlinks=True)
+
+    try:
+
+        temporary.rename(destination)
+
+    except OSError:
+
+        # another synth got there first
+
+        shutil.rmtree(temporary, ignore_errors=True)
+
+
+class AssetCache:
+    """
+    Bundled lambda assets, kept between synths.
+
+    Bundles are stored under the name cdk staged them with, and found again
+    by the key of the entry they were bundled from.
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        """
+        Args:
+            directory: where to keep bundles
+        """
+
+        self.directory = Path(directory)
+
+    @classmethod
+    def from_environment(cls) -> Optional["AssetCache"]:
+        """The cache in $ORKESTRA_ASSET_CACHE, or None if it isn't set."""
+
+        directory = os.environ.get(ASSET_CACHE_ENV)
+
+        return cls(directory) if directory else None
+
+    def _reference(self, key: str) -> Path:
+        return self.directory / f"{key}.ref"
+
+    def restore(self, key: str, outdir: Union[str, Path]) -> bool:
+        """
+        Copy the bundle cached for key into outdir, where cdk will find it staged.
+
+        Returns: whether there was a bundle to restore
+        """
+
+        reference = self._reference(key)
+
+        if not reference.exists():
+            return False
+
+        name = reference.read_text().strip()
+
+        bundle = self.directory / name
+
+        if not bundle.is_dir():
+            return False
+
+        staged = Path(outdir, name)
+
+        if not staged.exists():
+
+            staged.parent.mkdir(parents=True, exist_ok=True)
+
+            _copy(bundle, staged)
+
+        return True
+
+    def save(
+        self,
+        key: str,
+        staged_path: Union[str, Path],
+        outdir: Union[str, Path],
+    ):
+        """
+        Keep the bundle cdk staged for key, if it bundled one.
+
+        Stacks that skip bundling are staged from their source directory,
+        rather than a bundle in outdir, and have nothing to keep.
+        """
+
+        staged_path = Path(staged_path).resolve()
+
+        if staged_path.parent != Path(outdir).resolve():
+            return
+
+        if not staged_path.is_dir():
+            return
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        bundle = self.directory / staged_path.name
+
+        if not bundle.exists():
+
+            _copy(staged_path, bundle)
+
+        self._reference(key).write_text(staged_path.name)
@@ -0,0 +1,221 @@
+"""
+Encode the payloads passed between steps more compactly than plain json.
+
+An encoded payload is a json envelope naming the codec it was encoded with,
+
+    {"__orkestra_codec__": "columnar+msgpack+zstd", "data": "<base64>"}
+
+so any step can decode it, whether or not it has a codec of its own.
+
+msgpack and zstd require the msgpack and zstandard packages.
+"""
+
+import base64
+import json
+from dataclasses import dataclass
+from typing import *
+
+CODEC_KEY = "__orkestra_codec__"
+
+FORMATS = ("json", "msgpack")
+
+COMPRESSIONS = ("gzip", "zstd")
+
+
+def _is_records(value) -> bool:
+    """Whether value is a non-empty list of dicts that all have the same keys."""
+
+    if not isinstance(value, list) or not value:
+        return False
+
+    if not all(isinstance(v, dict) for v in value):
+        return False
+
+    keys = value[0].keys()
+
+    return bool(keys) and all(v.keys() == keys for v in value)
+
+
+def _to_columns(records: List[dict]) -> dict:
+
+    keys = list(records[0])
+
+    return {
+        "keys": keys,
+        "columns": [[r[k] for r in records] for k in keys],
+    }
+
+
+def _from_columns(table: dict) -> List[dict]:
+
+    keys = table["keys"]
+
+    return [dict(zip(keys, row)) for row in zip(*table["columns"])]
+
+
+@dataclass(frozen=True)
+class Codec:
+    """
+    How a step encodes its output.
+
+    Args:
+        format: "json" or "msgpack"
+        columnar: store lists of records as a list of keys and a list per column,
+            rather than repeating the keys in every record
+        compression: None, "gzip", or "zstd"
+    """
+
+    format: str = "json"
+    columnar: bool = False
+    compression: Optional[str] = None
+
+    def __post_init__(self):
+
+        if self.format not in FORMATS:
+
+            raise ValueError(f"codec format must be one of {FORMATS}")
+
+        if self.compression not in (None, *COMPRESSIONS):
+
+            raise ValueError(
+                f"codec compression must be None or one of {COMPRESSIONS}"
+            )
+
+    @classmethod
+    def from_string(cls, name: str) -> "Codec":
+        """
+        Parse a codec name, such as "msgpack+zstd" or "columnar+json+gzip".
+        """
+
+        parts = name.split("+")
+
+        columnar = "columnar" in parts
+
+        if columnar:
+            parts.remove("columnar")
+
+        formats = [p for p in parts if p in FORMATS]
+
+        compressions = [p for p in parts if p in COMPRESSIONS]
+
+        if (
+            len(formats) > 1
+            or len(compressions) > 1
+            or (len(formats) + len(compressions) != len(parts))
+        ):
+
+            raise ValueError(f"invalid codec {name!r}")
+
+        return cls(
+            format=formats[0] if formats else "json",
+            columnar=columnar,
+            compression=compressions[0] if compressions else None,
+        )
+
+    @property
+    def name(self) -> str:
+
+        parts = ["columnar"] if self.columnar else []
+
+        parts.append(self.format)
+
+        if self.compression is not None:
+            parts.append(self.compression)
+
+        return "+".join(parts)
+
+    def encode(self, value) -> dict:
+        """Return value's envelope."""
+
+        # only lists of records are stored by column, so only their
+        # envelopes name the columnar codec
+
+        codec = self
+
+        if self.columnar:
+
+            if _is_records(value):
+
+                value = _to_columns(value)
+
+            else:
+
+                codec = Codec(format=self.format, compression=self.compression)
+
+        if self.format == "msgpack":
+
+            import msgpack
+
+            data = msgpack.packb(value, use_bin_type=True)
+
+        else:
+
+            data = json.dumps(value, separators=(",", ":")).encode()
+
+        if self.compression == "gzip":
+
+            import gzip
+
+            data = gzip.compress(data, mtime=0)
+
+        elif self.compression == "zstd":
+
+            import zstandard
+
+            data = zstandard.ZstdCompressor().compress(data)
+
+        return {
+            CODEC_KEY: codec.name,
+            "data": base64.b64encode(data).decode(),
+        }
+
+    def _decode(self, data: str):
+
+        data = base64.b64decode(data)
+
+        if self.compression == "gzip":
+
+            import gzip
+
+            data = gzip.decompress(data)
+
+        elif self.compression == "zstd":
+
+            import zstandard
+
+            data = zstandard.ZstdDecompressor().decompress(data)
+
+        if self.format == "msgpack":
+
+            import msgpack
+
+            value = msgpack.unpackb(data, raw=False)
+
+        else:
+
+            value = json.loads(data)
+
+        return _from_columns(value) if self.columnar else value
+
+
+def is_encoded(value) -> bool:
+    return isinstance(value, dict) and CODEC_KEY in value
+
+
+def decode(value):
+    """
+    Decode an envelope, or the envelopes in a list, with the codecs they name.
+
+    Lists are the outputs of parallel and map states, any of whose
+    branches or items may have been encoded.
+    """
+
+    if is_encoded(value):
+
+        return Codec.from_string(value[CODEC_KEY])._decode(value["data"])
+
+    if isinstance(value, list) and any(map(is_encoded, value)):
+
+        return [decode(v) if is_encoded(v) else v for v in value]
+
+    return value
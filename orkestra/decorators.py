@@ -1,10 +1,18 @@
 import functools
-from collections import defaultdict
+import importlib
+import inspect
+import os
+import random
+import sys
+import threading
+import uuid
 from logging import getLogger
 from pathlib import Path
 from typing import *
 
+from orkestra.codecs import Codec, decode
 from orkestra.exceptions import CompositionError
+from orkestra.metrics import in_map_item, measure
 from orkestra.interfaces import (
     Duration,
     Runtime,
@@ -14,7 +22,14 @@ from orkestra.interfaces import (
     StateMachineType as SfnType,
     PythonLayerVersion,
 )
-from orkestra.utils import coerce, _coalesce
+from orkestra.storage import (
+    ITEM_FORMATS,
+    S3Location,
+    dump_items,
+    offload,
+    resolve,
+)
+from orkestra.utils import coerce, _coalesce, _error_output, _stack_state
 
 logger = getLogger(__name__)
 
@@ -22,20 +37,333 @@ logger = getLogger(__name__)
 OptionalFn = Optional[Union[Callable, Iterable[Callable]]]
 
 
-_id_map = defaultdict(lambda: 1)
+_event_loops = threading.local()
+
+
+def _incremental_id(scope, id):
+    """
+    Return id, numbered if need be to be unique among scope's children.
+
+    A state's id is its name from graph.state_ids, which orkestra.asl names
+    it by too. It's only numbered here if scope already has a construct of
+    that id, e.g. when the same composition is rendered twice in one stack.
+    """
 
+    result = id
 
-def _incremental_id(id):
+    number = 2
 
-    mapped = _id_map[id]
+    while scope.node.try_find_child(result) is not None:
 
-    result = id if mapped == 1 else f"{id}{mapped}"
+        result = f"{id}{number}"
 
-    _id_map[id] += 1
+        number += 1
 
     return result
 
 
+def _event_loop() -> "asyncio.AbstractEventLoop":
+    """
+    Return the calling thread's event loop.
+
+    The loop is created on first use and left open, so warm invocations
+    in the same container reuse it rather than starting a new one.
+    """
+
+    # asyncio imports ssl, socket, and subprocess, which synchronous
+    # handlers shouldn't pay for at import time
+
+    import asyncio
+
+    loop = getattr(_event_loops, "loop", None)
+
+    if loop is None or loop.is_closed():
+
+        loop = _event_loops.loop = asyncio.new_event_loop()
+
+    return loop
+
+
+def _synchronize(func: Callable) -> Callable:
+    """Wrap a coroutine function so that it runs to completion when called."""
+
+    @functools.wraps(func)
+    def synchronized(event, context):
+        return _event_loop().run_until_complete(func(event, context))
+
+    return synchronized
+
+
+_BATCH_KEY = "__orkestra_batch__"
+
+
+_ITEMS_KEY = "__orkestra_items__"
+
+# a map item, and its index, as the map states of jobs with metrics pass them
+
+_MAP_ITEM_KEY = "__orkestra_map_item__"
+
+_MAP_ITEM_INDEX_KEY = "__orkestra_map_item_index__"
+
+_MAP_ITEM_PARAMETERS = {
+    f"{_MAP_ITEM_KEY}.$": "$$.Map.Item.Value",
+    f"{_MAP_ITEM_INDEX_KEY}.$": "$$.Map.Item.Index",
+}
+
+# set on a fused lambda to the steps it runs, starting with its own handler
+
+_FUSED_STEPS_ENV = "ORKESTRA_FUSED_STEPS"
+
+# paths step functions applies around a lambda invocation, which a fused
+# lambda can only apply before its first step or after its last
+
+_INPUT_PATHS = ("input_path",)
+
+_OUTPUT_PATHS = ("output_path", "result_path", "result_selector")
+
+# the retry LambdaInvoke adds when retry_on_service_exceptions is true
+
+_LAMBDA_SERVICE_RETRY = {
+    "ErrorEquals": [
+        "Lambda.ServiceException",
+        "Lambda.AWSLambdaException",
+        "Lambda.SdkClientException",
+    ],
+    "IntervalSeconds": 2,
+    "MaxAttempts": 6,
+    "BackoffRate": 2,
+}
+
+
+def _omit(dictionary: dict, *keys) -> dict:
+    return {k: v for k, v in dictionary.items() if k not in keys}
+
+
+def _item_reader_config(item_format: str) -> dict:
+
+    if item_format == "csv":
+        return {"InputType": "CSV", "CSVHeaderLocation": "FIRST_ROW"}
+
+    return {"InputType": item_format.upper()}
+
+
+def _is_batch(event) -> bool:
+    return isinstance(event, dict) and (
+        _BATCH_KEY in event or _BATCH_KEY in event.get("BatchInput", ())
+    )
+
+
+def _is_staging(event) -> bool:
+    return isinstance(event, dict) and _ITEMS_KEY in event
+
+
+def _is_map_item(event) -> bool:
+    return isinstance(event, dict) and _MAP_ITEM_KEY in event
+
+
+def _is_item_location(event) -> bool:
+    return isinstance(event, dict) and {"bucket", "key"} <= event.keys()
+
+
+def _dump_models(output):
+    """Serialize a pydantic model, or a list of them, returned by a handler."""
+
+    # if pydantic hasn't been imported, the output can't be a model
+
+    if "pydantic" not in sys.modules:
+        return output
+
+    from pydantic import BaseModel
+
+    def dump(value):
+
+        if not isinstance(value, BaseModel):
+            return value
+
+        return (
+            value.model_dump()
+            if hasattr(value, "model_dump")
+            else value.dict()
+        )
+
+    if isinstance(output, (list, tuple)):
+
+        return [dump(v) for v in output]
+
+    return dump(output)
+
+
+# what a field can be for its value to arrive as json parses it
+
+_JSON_TYPES = (str, int, float, bool, type(None), list, dict, Any)
+
+
+def _is_json_type(annotation) -> bool:
+
+    origin = get_origin(annotation)
+
+    if origin is None:
+        return annotation in _JSON_TYPES
+
+    return origin in (list, dict, Union) and all(
+        map(_is_json_type, get_args(annotation))
+    )
+
+
+def _check_trustable(model: "pydantic.BaseModel"):
+    """
+    Raise ValueError unless model can be constructed from json without validation.
+
+    Construction neither converts values, builds nested models, nor renames
+    aliases, so only flat models of json types can be trusted.
+    """
+
+    fields = getattr(model, "model_fields", None) or model.__fields__
+
+    for name, field in fields.items():
+
+        annotation = getattr(field, "annotation", None) or field.outer_type_
+
+        alias = getattr(field, "alias", None)
+
+        if (alias is not None and alias != name) or not _is_json_type(
+            annotation
+        ):
+
+            raise ValueError(
+                f"{model.__name__} can't be trusted: its field {name} is "
+                "a nested model, aliased, or not a json type"
+            )
+
+
+@functools.lru_cache(maxsize=None)
+def _model_parser(
+    model: "pydantic.BaseModel",
+    envelope: Optional["pydantic.BaseModel"] = None,
+    trusted: bool = False,
+) -> Callable:
+    """
+    Return a function that parses events into model, built once per model.
+
+    Trusted events are constructed without being validated.
+    """
+
+    from aws_lambda_powertools.utilities.parser import BaseModel
+    from aws_lambda_powertools.utilities.parser.exceptions import (
+        InvalidEnvelopeError,
+        InvalidModelTypeError,
+    )
+
+    if not (isinstance(model, type) and issubclass(model, BaseModel)):
+
+        raise InvalidModelTypeError(
+            f"Input model must implement BaseModel, model={model}"
+        )
+
+    if envelope is not None:
+
+        if not callable(envelope) or not hasattr(envelope, "parse"):
+
+            raise InvalidEnvelopeError(
+                f"Envelope must implement BaseEnvelope, envelope={envelope}"
+            )
+
+        extract = envelope().parse
+
+        return functools.partial(extract, model=model)
+
+    if hasattr(model, "model_validate"):
+
+        validate, validate_json, construct = (
+            model.model_validate,
+            model.model_validate_json,
+            model.model_construct,
+        )
+
+    else:
+
+        validate, validate_json, construct = (
+            model.parse_obj,
+            model.parse_raw,
+            model.construct,
+        )
+
+    def parse(event):
+
+        if isinstance(event, str):
+            return validate_json(event)
+
+        return validate(event)
+
+    if trusted:
+
+        _check_trustable(model)
+
+        def construct_trusted(event):
+
+            if isinstance(event, dict):
+                return construct(**event)
+
+            return parse(event)
+
+        return construct_trusted
+
+    return parse
+
+
+def _importable(composable: "Compose") -> bool:
+    """Whether composable is reachable as an attribute of its function's module."""
+
+    module = getattr(composable.func, "__module__", None)
+
+    name = getattr(composable.func, "__qualname__", None)
+
+    if module is None or name is None:
+        return False
+
+    return getattr(sys.modules.get(module), name, None) is composable
+
+
+def _fused_steps(head: "Compose") -> List["Compose"]:
+    """
+    Return the steps fused after head, if head is the handler of a fused lambda.
+
+    Steps are named by module relative to the lambda's entry directory, so
+    they're imported from the same package as head.
+    """
+
+    steps = os.environ.get(_FUSED_STEPS_ENV)
+
+    if not steps:
+        return []
+
+    (head_module, head_name), *rest = (
+        step.split(":") for step in steps.split(",")
+    )
+
+    package, _, module = head.func.__module__.rpartition(".")
+
+    if (module, head.func.__qualname__) != (head_module, head_name):
+        return []
+
+    prefix = f"{package}." if package else ""
+
+    return [
+        getattr(importlib.import_module(prefix + module), name)
+        for module, name in rest
+    ]
+
+
+def _seconds(duration) -> float:
+
+    return getattr(duration, "cdk_construct", duration).to_seconds()
+
+
+def _unwrap(event):
+    """Resolve offloaded pointers and decode encoded payloads."""
+    return decode(resolve(event))
+
+
 class Compose:
     _powertools_defaults = {
         "log_event": True,
@@ -64,6 +392,19 @@ class Compose:
         enable_powertools: bool = False,
         is_map_job: bool = False,
         capture_map_errors: bool = False,
+        batch_size: Optional[int] = None,
+        item_source: Optional[str] = None,
+        item_format: str = "jsonl",
+        items_location: Optional[str] = None,
+        result_location: Optional[str] = None,
+        distributed_threshold: int = 10_000,
+        offload_location: Optional[str] = None,
+        offload_threshold: int = 64 * 1024,
+        codec: Optional[Union[str, Codec]] = None,
+        trust_upstream: bool = False,
+        metrics: bool = False,
+        profile_sample_rate: float = 0.0,
+        profile_location: Optional[str] = None,
         log_event: Optional[bool] = None,
         capture_response: Optional[bool] = None,
         capture_error: Optional[bool] = None,
@@ -100,7 +441,7 @@ class Compose:
         Container for functions meant to be composed.
 
         Args:
-            func: a function or list or tuple of functions
+            func: a function, coroutine function, or list or tuple of functions
             timeout: the timeout duration of the lambda
             enable_powertools: if true, enables powertools
             log_event: passed to aws_lambda_powertools.Logger
@@ -111,10 +452,23 @@ class Compose:
             default_dimensions: passed to aws_lambda_powertools.Metrics
             model: passed to aws_lambda_powertools.utilities.parser.event_parser
             envelope: passed to aws_lambda_powertools.utilities.parser.event_parser
+            trust_upstream: if true, events from functions composed upstream that are annotated to return the model, or a list of it for map jobs, are constructed without being validated again. Events from anywhere else are still validated. Construction doesn't convert values, build nested models, or apply aliases, so the model's fields must be json types without aliases; otherwise ValueError is raised
+            metrics: if true, record the function's duration, event and response sizes, and cold starts as CloudWatch embedded metrics, without powertools. A map job's state passes each item's index along with it, unless it's given parameters or a batch_size. See orkestra.metrics
+            profile_sample_rate: the fraction of invocations, between 0 and 1, to run under a statistical profiler and tracemalloc. See orkestra.profiling
+            profile_location: s3 uri of the bucket and prefix profiles are written to, under <function name>/<request id>/. Required by profile_sample_rate
             runtime: the python runtime to use for the lambda
             layers: A list of layers to add to the function’s execution environment. You can configure your Lambda function to pull in additional code during initialization in the form of layers. Layers are packages of libraries or other dependencies that can be used by multiple functions. Default: - No layers.
             is_map_job: whether the lambda is a map job
             capture_map_errors: set true to add guarantee successful map job execution
+            batch_size: if set, a map job invokes its lambda once per batch of this many items rather than once per item. The function is still called once per item. Can't be combined with result_path or parameters.
+            item_source: "s3" to render a map job as a distributed map that reads its items from the s3 object described by its input, {"bucket": ..., "key": ...}. "auto" to run inline unless the input has more than distributed_threshold items, in which case they're written to items_location and read by a distributed map. Default: inline
+            item_format: format of the items object; "jsonl", "csv" (with a header row), or "json"
+            items_location: s3 uri of the bucket and prefix items are read from. Required by item_source
+            result_location: s3 uri a distributed map writes its results to. Default: results are returned in the state
+            distributed_threshold: number of items above which item_source="auto" uses a distributed map
+            offload_location: s3 uri of the bucket and prefix outputs larger than offload_threshold are written to. The output is replaced by a pointer that the next function resolves before it's called. Default: outputs are never offloaded
+            offload_threshold: size in bytes of an output's json above which it's offloaded
+            codec: encode outputs compactly, e.g. "msgpack+zstd" or "columnar+json+gzip". See orkestra.codecs.Codec. Encoded inputs are decoded before func is called whether or not a codec is set. Default: outputs are plain json
             comment: An optional description for this state. Default: No comment
             input_path: JSONPath expression to select part of the state to be the input to this state. May also be the special value JsonPath.DISCARD, which will cause the effective input to be the empty object {}. Default: $
             items_path:  JSONPath expression to select the array to iterate over. Default: $
@@ -142,12 +496,87 @@ class Compose:
 
         self.func = func
         self.downstream = []
+        self.upstream = []
 
         self.is_map_job = is_map_job
         self.capture_map_errors = capture_map_errors
+        self.batch_size = batch_size
+
+        if batch_size is not None:
+
+            if not is_map_job:
+
+                raise ValueError("batch_size only applies to map jobs")
+
+            if batch_size < 1:
+
+                raise ValueError("batch_size must be a positive integer")
+
+            if result_path is not None or parameters is not None:
+
+                raise ValueError(
+                    "result_path and parameters can't be used with batch_size"
+                )
+
+        self.item_source = item_source
+        self.item_format = item_format
+        self.items_location = items_location
+        self.result_location = result_location
+        self.distributed_threshold = distributed_threshold
+
+        if item_source not in (None, "inline", "s3", "auto"):
+
+            raise ValueError(
+                f'item_source must be "inline", "s3", or "auto", not {item_source!r}'
+            )
+
+        if item_format not in ITEM_FORMATS:
+
+            raise ValueError(f"item_format must be one of {ITEM_FORMATS}")
+
+        if self.is_distributed:
+
+            if not is_map_job:
+
+                raise ValueError("item_source only applies to map jobs")
+
+            if items_location is None:
+
+                raise ValueError(
+                    f"item_source={item_source!r} requires items_location"
+                )
+
+        if item_source == "auto" and result_path is not None:
+
+            raise ValueError(
+                "result_path can't be used with item_source='auto'"
+            )
+
+        self.offload_location = offload_location
+        self.offload_threshold = offload_threshold
+
+        if offload_location is not None:
+
+            # fail at import rather than on the first large output
+
+            S3Location.from_uri(offload_location)
+
+            if offload_threshold < 0:
+
+                raise ValueError("offload_threshold must not be negative")
+
+        self.codec = (
+            Codec.from_string(codec) if isinstance(codec, str) else codec
+        )
 
         self.aws_lambda_constructor_kwargs = aws_lambda_constructor_kwargs
 
+        # a lambda only learns its map item's index from the map state
+
+        if metrics and is_map_job and not batch_size and parameters is None:
+
+            parameters = dict(_MAP_ITEM_PARAMETERS)
+
         self.map_job_kwargs = {
             "comment": comment,
             "input_path": input_path,
@@ -204,8 +633,36 @@ class Compose:
 
         self.enable_powertools = enable_powertools
 
+        self.trust_upstream = trust_upstream
+
+        if trust_upstream and model is not None:
+
+            _check_trustable(model)
+
+        self.metrics = metrics
+
+        if not 0 <= profile_sample_rate <= 1:
+
+            raise ValueError("profile_sample_rate must be between 0 and 1")
+
+        if profile_sample_rate and profile_location is None:
+
+            raise ValueError("profile_sample_rate requires profile_location")
+
+        if profile_location is not None:
+
+            S3Location.from_uri(profile_location)
+
+        self.profile_sample_rate = profile_sample_rate
+
+        self.profile_location = profile_location
+
         self._lambda_function = None
 
+        self._handler = None
+
+        self._fused = None
+
         self._update_metadata()
 
     def _update_metadata(self):
@@ -217,290 +674,1505 @@ class Compose:
                 handler=self.func.__name__,
             )
 
+    def _compile(self) -> Callable:
+        """
+        Build the wrapper chain around func.
+
+        This happens once per container, on first invocation, so that
+        warm invocations don't pay for re-wrapping the function.
+        """
+
+        handler = self.func
+
+        if self.enable_powertools:
+
+            handler = powertools(
+                decorated=handler,
+                trusted=self._trusts_upstream,
+                **self.powertools_kwargs,
+            )
+
+        elif self.is_async:
+
+            handler = _synchronize(handler)
+
+        return handler
+
+    @property
+    def _trusts_upstream(self) -> bool:
+        """Whether every event comes from an upstream function declared to return the model."""
+
+        model = self.powertools_kwargs.get("model")
+
+        return (
+            self.trust_upstream
+            and model is not None
+            and self.powertools_kwargs.get("envelope") is None
+            and bool(self.upstream)
+            and all(
+                u._returns(model, many=self.is_map_job) for u in self.upstream
+            )
+        )
+
+    def _returns(self, model: "pydantic.BaseModel", many: bool) -> bool:
+        """Whether func's return annotation is model, or a list of it if many."""
+
+        try:
+
+            declared = get_type_hints(self.func).get("return")
+
+        except Exception:
+
+            # not a function, or an annotation that can't be resolved
+
+            return False
+
+        if many:
+
+            return get_origin(declared) is list and get_args(declared) == (
+                model,
+            )
+
+        return declared is model
+
+    @property
+    def is_async(self) -> bool:
+        """Whether func is a coroutine function."""
+        return inspect.iscoroutinefunction(self.func)
+
+    @property
+    def handler(self) -> Callable:
+        """The compiled handler, built on first access."""
+
+        if self._handler is None:
+
+            self._handler = self._compile()
+
+        return self._handler
+
     def __call__(self, event, context=None):
 
         if self.func is not None and not callable(self.func):
 
-            raise TypeError(f"{self.func} is not callable")
+            raise TypeError(f"{self.func} is not callable")
+
+        if self.func is not None:
+
+            if _is_map_item(event):
+
+                return in_map_item(
+                    event[_MAP_ITEM_INDEX_KEY],
+                    self,
+                    event[_MAP_ITEM_KEY],
+                    context,
+                )
+
+            if (
+                self.profile_sample_rate
+                and random.random() < self.profile_sample_rate
+            ):
+
+                from orkestra.profiling import profile
+
+                return profile(self, self._measure, event, context)
+
+            return self._measure(event, context)
+
+        else:
+
+            self.func = event
+
+            self._handler = None
+
+            self._update_metadata()
+
+            return self
+
+    def _measure(self, event, context):
+
+        if self.metrics:
+
+            return measure(self, self._invoke, event, context)
+
+        return self._invoke(event, context)
+
+    def _invoke(self, event, context):
+
+        if self.batch_size and _is_batch(event):
+
+            return self._run_batch(event, context)
+
+        if self.item_source == "auto" and _is_staging(event):
+
+            return self._stage_items(_unwrap(event["items"]))
+
+        output = self._wrap(self.handler(_unwrap(event), context))
+
+        if self._fused is None:
+
+            self._fused = _fused_steps(self)
+
+        for step in self._fused:
+
+            output = step(output, context)
+
+        return output
+
+    async def _invoke_async(self, event, context):
+        """
+        As _invoke, awaiting func on the running event loop.
+
+        Only for async functions that don't use powertools, batch, stage
+        items, record metrics, or profile, which are called as usual.
+        """
+
+        output = self._wrap(await self.func(_unwrap(event), context))
+
+        if self._fused is None:
+
+            self._fused = _fused_steps(self)
+
+        for step in self._fused:
+
+            output = step(output, context)
+
+        return output
+
+    def _run_batch(self, event: dict, context):
+        """
+        Handle one of the batched map job's operations.
+
+        split: break the items into batches
+        process: call the function on each item of a batch
+        flatten: join the processed batches back into one list
+        """
+
+        if "BatchInput" in event:
+
+            # batches from a distributed map's item batcher
+
+            operation, items = event["BatchInput"][_BATCH_KEY], event["Items"]
+
+        else:
+
+            operation, items = event[_BATCH_KEY], event["items"]
+
+        items = _unwrap(items)
+
+        if operation == "split":
+
+            return [
+                {
+                    _BATCH_KEY: "process",
+                    "items": items[i : i + self.batch_size],
+                }
+                for i in range(0, len(items), self.batch_size)
+            ]
+
+        elif operation == "process":
+
+            results = []
+
+            for item in items:
+
+                try:
+
+                    results.append(self.handler(item, context))
+
+                except Exception as e:
+
+                    if not self.capture_map_errors:
+                        raise
+
+                    results.append(_error_output(e))
+
+            return self._wrap(results)
+
+        elif operation == "flatten":
+
+            results = []
+
+            # a batch that failed as a whole is a single error output
+
+            for batch in items:
+
+                if isinstance(batch, list):
+                    results.extend(batch)
+                else:
+                    results.append(batch)
+
+            return self._wrap(results)
+
+        raise ValueError(f"unknown batch operation {operation!r}")
+
+    def _wrap(self, output):
+        """Encode output, then replace it with a pointer if it's too large to pass on."""
+
+        output = _dump_models(output)
+
+        if self.codec is not None:
+
+            output = self.codec.encode(output)
+
+        if self.offload_location is None:
+
+            return output
+
+        return offload(
+            output,
+            S3Location.from_uri(self.offload_location),
+            self.offload_threshold,
+        )
+
+    @property
+    def _has_opaque_output(self) -> bool:
+        """Whether step functions may only see an envelope or pointer in place of the output."""
+        return self.codec is not None or self.offload_location is not None
+
+    @property
+    def is_distributed(self) -> bool:
+        """Whether this map job can read its items from s3."""
+        return self.item_source in ("s3", "auto")
+
+    def _stage_items(self, items: Union[list, dict]) -> Union[list, dict]:
+        """
+        Write items to items_location if there are too many to map over inline.
+
+        Returns the items, or the location of the object they were written to.
+        """
+
+        if (
+            _is_item_location(items)
+            or len(items) <= self.distributed_threshold
+        ):
+
+            return items
+
+        location = S3Location.from_uri(self.items_location).join(
+            f"{uuid.uuid4()}.{self.item_format}"
+        )
+
+        location.put(dump_items(items, self.item_format))
+
+        return {"bucket": location.bucket, "key": location.key}
+
+    def run_local(
+        self,
+        event,
+        context=None,
+        max_workers: Optional[int] = None,
+        map_backend: str = "thread",
+        chunksize: Optional[int] = None,
+        s3_root: Optional[str] = None,
+    ):
+        """
+        Run this function and everything downstream of it in-process.
+
+        Parallel branches and map items run concurrently on a thread pool.
+        As in step functions, errors in tuple branches and in map jobs that
+        capture_map_errors are returned as outputs rather than raised.
+
+        Args:
+            event: the input to this function
+            context: lambda context passed to each function. Default: orkestra.generic_context
+            max_workers: upper bound on threads or processes used by any one parallel or map step
+            map_backend: "thread", or "process" to run CPU-bound map jobs on a process pool. Functions a worker process can't import fall back to threads.
+            chunksize: how many map items to send to a worker process at once
+            s3_root: a directory to stand in for s3, laid out as <s3_root>/<bucket>/<key>
+
+        Returns: the output of the last function
+
+        """
+
+        from orkestra.local import LocalExecutor
+
+        return LocalExecutor(
+            max_workers=max_workers,
+            context=context,
+            map_backend=map_backend,
+            chunksize=chunksize,
+            s3_root=s3_root,
+        ).run(self, event)
+
+    def __repr__(self) -> str:
+
+        if hasattr(self.func, "__name__"):
+            func = self.func.__name__
+        else:
+            func = repr(self.func)
+
+        return f"Compose(func={func})"
+
+    def __rshift__(self, right):
+        right = (
+            Compose(func=right) if isinstance(right, (list, tuple)) else right
+        )
+
+        # composing the same edge again, e.g. by calling a function that
+        # composes a dag twice, returns the edge already in the graph
+
+        for existing in self.downstream:
+
+            if existing._same_step(right):
+                return existing
+
+        self.downstream.append(right)
+
+        # each branch of a parallel step gets the same input
+
+        branches = right.func if isinstance(right.func, (list, tuple)) else ()
+
+        for composable in (right, *branches):
+            composable.upstream.append(self)
+            composable._handler = None
+
+        return right
+
+    def _same_step(self, other: "Compose") -> bool:
+        """Whether other is self, or a parallel step of the same functions."""
+
+        if other is self:
+            return True
+
+        return (
+            isinstance(self.func, (list, tuple))
+            and type(self.func) is type(other.func)
+            and len(self.func) == len(other.func)
+            and all(a is b for a, b in zip(self.func, other.func))
+        )
+
+    @staticmethod
+    def _render_lambda(
+        composable: "Compose",
+        scope,
+        id=None,
+        **kwargs,
+    ):
+
+        from aws_cdk import core as cdk
+        from aws_cdk.aws_lambda_python import PythonFunction
+
+        from orkestra.assets import AssetCache, bundle_hash
+        from orkestra.layers import shared_dependencies
+
+        id = id or _incremental_id(scope, composable.func.__name__ + "_fn")
+
+        layers = composable.aws_lambda_constructor_kwargs.get("layers")
+
+        if layers is not None:
+
+            runtime = _coalesce(
+                composable._aws_lambda_defaults,
+                composable.aws_lambda_constructor_kwargs,
+            )["runtime"]
+
+            layers = [
+                l.cdk_construct(
+                    scope,
+                    _incremental_id(scope, f"{id}_layer"),
+                    compatible_runtimes=[runtime],
+                )
+                for l in layers
+            ]
+
+            if kwargs.get("layers") is not None:
+
+                kwargs["layers"].extend(layers)
+
+            else:
+
+                kwargs["layers"] = layers
+
+        kwargs = _coalesce(
+            composable._aws_lambda_defaults,
+            composable.aws_lambda_constructor_kwargs,
+            kwargs,
+        )
+
+        shared = shared_dependencies(scope)
+
+        if shared is not None and kwargs["entry"] in shared.entries:
+
+            kwargs["entry"] = shared.entries[kwargs["entry"]]
+
+            kwargs["layers"] = [*(kwargs.get("layers") or []), shared.layer]
+
+        # functions with the same entry share a bundle, built once
+        # per synth, and kept between synths if there's an asset cache
+
+        if kwargs.get("asset_hash") is not None:
+
+            return PythonFunction(scope, id, **kwargs)
+
+        kwargs.update(
+            asset_hash=bundle_hash(kwargs["entry"], kwargs["runtime"]),
+            asset_hash_type=cdk.AssetHashType.CUSTOM,
+        )
+
+        cache = AssetCache.from_environment()
+
+        if cache is None:
+
+            return PythonFunction(scope, id, **kwargs)
+
+        key = kwargs["asset_hash"]
+
+        outdir = cdk.Stage.of(scope).asset_outdir
+
+        cache.restore(key, outdir)
+
+        lambda_function = PythonFunction(
+            scope,
+            id,
+            **kwargs,
+        )
+
+        code = lambda_function.node.try_find_child("Code")
+
+        staging = code and code.node.try_find_child("Stage")
+
+        # bundled some other way, so there's nothing of ours to keep
+
+        if staging is not None:
+
+            cache.save(key, staging.absolute_staged_path, outdir)
+
+        return lambda_function
+
+    def aws_lambda(
+        self,
+        scope: "aws_cdk.core.Construct",
+        id: Optional[str] = None,
+        **kwargs,
+    ):
+        """
+        Return lambda cdk construct.
+
+        Without an id, the function is rendered once per stack and set of
+        kwargs, and shared by every state machine and schedule in the stack.
+
+        Args:
+            scope: cdk construct
+            id: construct id. If given, a new function is always rendered
+            **kwargs: to be passed to aws_cdk.aws_lambda_python.PythonFunction
+
+        Returns (aws_cdk.aws_lambda_python.PythonFunction): python lambda
+
+        """
+
+        # functions already rendered in the stack
+
+        rendered = _stack_state(scope, "lambda_functions")
+
+        key = self._lambda_key(kwargs) if id is None else None
+
+        if key in rendered:
+
+            return rendered[key]
+
+        lambda_function = self._render_lambda(
+            self,
+            scope,
+            id=id,
+            **kwargs,
+        )
+
+        if self.offload_location is not None:
+
+            self._offload_bucket(scope).grant_read_write(
+                lambda_function,
+                f"{S3Location.from_uri(self.offload_location).key}*",
+            )
+
+        if self.profile_location is not None:
+
+            self._grant_profile_writes(scope, lambda_function)
+
+        if key is not None:
+
+            rendered[key] = lambda_function
+
+        return lambda_function
+
+    def _lambda_key(self, kwargs: dict) -> Optional[tuple]:
+        """Key a function by itself and kwargs, or None if kwargs can't be hashed."""
+
+        try:
+
+            return (
+                self,
+                frozenset((k, v) for k, v in kwargs.items() if v is not None),
+            )
+
+        except TypeError:
+
+            return None
+
+    def _offload_bucket(self, scope) -> "aws_cdk.aws_s3.IBucket":
+
+        from aws_cdk import aws_s3 as s3
+
+        return s3.Bucket.from_bucket_name(
+            scope,
+            _incremental_id(scope, f"{self.func.__name__}_offload_bucket"),
+            S3Location.from_uri(self.offload_location).bucket,
+        )
+
+    def _grant_staging(self, scope, id: str, lambda_function):
+        """Let lambda_function write the items it stages to items_location."""
+
+        from aws_cdk import aws_s3 as s3
+
+        items_location = S3Location.from_uri(self.items_location)
+
+        s3.Bucket.from_bucket_name(
+            scope,
+            _incremental_id(scope, f"{id}_staging_bucket"),
+            items_location.bucket,
+        ).grant_put(lambda_function, f"{items_location.key}*")
+
+    def _grant_profile_writes(self, scope, lambda_function):
+
+        from aws_cdk import aws_s3 as s3
+
+        location = S3Location.from_uri(self.profile_location)
+
+        s3.Bucket.from_bucket_name(
+            scope,
+            _incremental_id(scope, f"{self.func.__name__}_profile_bucket"),
+            location.bucket,
+        ).grant_put(lambda_function, f"{location.key}*")
+
+    def task(
+        self,
+        scope: "aws_cdk.core.Construct",
+        id: Optional[str] = None,
+        payload_response_only: bool = True,
+        function_name: Optional[str] = None,
+        **kwargs,
+    ):
+        """
+        Return cdk step function task construct.
+        """
+
+        from orkestra.graph import state_ids
+
+        return self._task(
+            scope,
+            id,
+            state_ids([self]),
+            payload_response_only=payload_response_only,
+            function_name=function_name,
+            **kwargs,
+        )
+
+    def _task(
+        self,
+        scope: "aws_cdk.core.Construct",
+        id: Optional[str],
+        ids: Dict["Compose", str],
+        payload_response_only: bool = True,
+        function_name: Optional[str] = None,
+        **kwargs,
+    ):
+        """Render the task, naming its states by ids. See graph.state_ids."""
+
+        from aws_cdk import aws_stepfunctions as sfn
+        from aws_cdk import aws_stepfunctions_tasks as sfn_tasks
+
+        if self.is_map_job:
+
+            id = id or _incremental_id(scope, ids[self])
+
+            lambda_function = self.aws_lambda(
+                scope,
+                function_name=function_name,
+            )
+
+            self._lambda_function = lambda_function
+
+            if self.item_source == "auto":
+
+                task = self._auto_map(
+                    scope,
+                    id,
+                    lambda_function,
+                    **kwargs,
+                )
+
+            elif self.item_source == "s3":
+
+                task = self._distributed_map(
+                    scope,
+                    id,
+                    lambda_function,
+                    map_kwargs=self.map_job_kwargs,
+                )
+
+            elif self.batch_size:
+
+                task = self._batched_map(
+                    scope,
+                    id,
+                    lambda_function,
+                    **kwargs,
+                )
+
+            else:
+
+                task = self._map_state(
+                    scope,
+                    id,
+                    map_kwargs=_coalesce(self.map_job_kwargs),
+                    invoke_kwargs=_coalesce(
+                        self.lambda_invoke_kwargs,
+                        lambda_function=lambda_function,
+                        payload_response_only=payload_response_only,
+                        **kwargs,
+                    ),
+                )
+
+        elif isinstance(self.func, (list, tuple)):
+
+            task = sfn.Parallel(
+                scope,
+                id or _incremental_id(scope, ids[self]),
+            )
+
+            for fn in self.func:
+
+                lambda_fn = fn.aws_lambda(scope)
+
+                fn._lambda_function = lambda_fn
+
+                keyword_args = _coalesce(
+                    self.lambda_invoke_kwargs,
+                    lambda_function=lambda_fn,
+                    payload_response_only=payload_response_only,
+                    **kwargs,
+                )
+
+                branch = sfn_tasks.LambdaInvoke(
+                    scope,
+                    _incremental_id(scope, ids[fn]),
+                    **keyword_args,
+                )
+
+                if isinstance(self.func, tuple):
+
+                    branch.add_catch(
+                        sfn.Pass(
+                            scope,
+                            f"{branch.node.id}_failed",
+                        )
+                    )
+
+                task.branch(branch)
+
+        else:
+
+            id = id or _incremental_id(scope, ids[self])
+
+            lambda_function = self.aws_lambda(
+                scope,
+                function_name=function_name,
+            )
+
+            keyword_args = _coalesce(
+                self.lambda_invoke_kwargs,
+                lambda_function=lambda_function,
+                payload_response_only=payload_response_only,
+                **kwargs,
+            )
+
+            task = sfn_tasks.LambdaInvoke(
+                scope,
+                id,
+                **keyword_args,
+            )
+
+            task.lambda_function = lambda_function
+
+            self._lambda_function = lambda_function
+
+        return coerce(task)
+
+    def _map_state(
+        self,
+        scope: "aws_cdk.core.Construct",
+        id: str,
+        map_kwargs: dict,
+        invoke_kwargs: dict,
+    ) -> "aws_cdk.aws_stepfunctions.Map":
+        """Render an inline map state that invokes the lambda once per item."""
+
+        from aws_cdk import aws_stepfunctions as sfn
+        from aws_cdk import aws_stepfunctions_tasks as sfn_tasks
+
+        task = sfn.Map(scope, id, **map_kwargs)
+
+        task_id = f"invoke_{id}"
+
+        invoke_lambda = sfn_tasks.LambdaInvoke(
+            scope,
+            task_id,
+            **invoke_kwargs,
+        )
+
+        invoke_lambda.lambda_function = invoke_kwargs["lambda_function"]
+
+        if self.capture_map_errors:
+            invoke_lambda.add_catch(
+                sfn.Pass(
+                    scope,
+                    f"{task_id}_failed",
+                )
+            )
+
+        task.iterator(invoke_lambda)
+
+        return task
+
+    def _batch_invoke_kwargs(self, lambda_function, **kwargs) -> dict:
+        """
+        Keyword arguments for the invocations orkestra adds around a map state.
+
+        These select nothing from their input or output, since the map job's
+        paths are applied where they're rendered.
+        """
+
+        # orkestra's protocols rely on the plain lambda response
+
+        return _omit(
+            _coalesce(
+                self.lambda_invoke_kwargs,
+                lambda_function=lambda_function,
+                **kwargs,
+                payload_response_only=True,
+            ),
+            "input_path",
+            "output_path",
+            "result_path",
+            "result_selector",
+        )
+
+    def _flatten(
+        self,
+        scope: "aws_cdk.core.Construct",
+        id: str,
+        invoke_kwargs: dict,
+    ) -> "aws_cdk.aws_stepfunctions_tasks.LambdaInvoke":
+        """Render the invocation that joins processed batches into one list."""
+
+        from aws_cdk import aws_stepfunctions as sfn
+        from aws_cdk import aws_stepfunctions_tasks as sfn_tasks
+
+        return sfn_tasks.LambdaInvoke(
+            scope,
+            f"flatten_{id}",
+            payload=sfn.TaskInput.from_object(
+                {
+                    _BATCH_KEY: "flatten",
+                    "items": sfn.JsonPath.string_at("$"),
+                }
+            ),
+            **_coalesce(
+                invoke_kwargs,
+                output_path=self.map_job_kwargs["output_path"],
+                result_selector=self.map_job_kwargs["result_selector"],
+            ),
+        )
+
+    def _batched_map(
+        self,
+        scope: "aws_cdk.core.Construct",
+        id: str,
+        lambda_function,
+        select_items: bool = True,
+        **kwargs,
+    ) -> "aws_cdk.aws_stepfunctions.Chain":
+        """
+        Render a map job that invokes its lambda once per batch of items.
+
+        The lambda is invoked once to split the items into batches, once per
+        batch by the map state, and once more to flatten the results.
+        input_path and items_path apply to the first invocation (unless
+        select_items is false) and output_path and result_selector to the last.
+        """
+
+        from aws_cdk import aws_stepfunctions as sfn
+        from aws_cdk import aws_stepfunctions_tasks as sfn_tasks
+
+        invoke_kwargs = self._batch_invoke_kwargs(lambda_function, **kwargs)
+
+        items_path, input_path = (
+            (
+                self.map_job_kwargs["items_path"],
+                self.map_job_kwargs["input_path"],
+            )
+            if select_items
+            else (None, None)
+        )
+
+        split = sfn_tasks.LambdaInvoke(
+            scope,
+            f"split_{id}",
+            payload=sfn.TaskInput.from_object(
+                {
+                    _BATCH_KEY: "split",
+                    "items": sfn.JsonPath.string_at(items_path or "$"),
+                }
+            ),
+            **_coalesce(invoke_kwargs, input_path=input_path),
+        )
+
+        task = self._map_state(
+            scope,
+            id,
+            map_kwargs=_omit(
+                _coalesce(self.map_job_kwargs),
+                "input_path",
+                "items_path",
+                "output_path",
+                "result_selector",
+            ),
+            invoke_kwargs=invoke_kwargs,
+        )
+
+        return (
+            sfn.Chain.start(split)
+            .next(task)
+            .next(self._flatten(scope, id, invoke_kwargs))
+        )
+
+    def _distributed_map_json(
+        self,
+        function_arn,
+        id: str,
+        map_kwargs: dict,
+    ) -> dict:
+        """The amazon states language of a distributed map state, which cdk doesn't model."""
+
+        task_id = f"invoke_{id}"
+
+        invoke_state = {
+            "Type": "Task",
+            "Resource": function_arn,
+            "End": True,
+        }
+
+        if self.lambda_invoke_kwargs.get("retry_on_service_exceptions", True):
+
+            invoke_state["Retry"] = [_LAMBDA_SERVICE_RETRY]
+
+        states = {task_id: invoke_state}
+
+        if self.capture_map_errors:
+
+            invoke_state["Catch"] = [
+                {"ErrorEquals": ["States.ALL"], "Next": f"{task_id}_failed"}
+            ]
+
+            states[f"{task_id}_failed"] = {"Type": "Pass", "End": True}
+
+        state_json = {
+            "Type": "Map",
+            "ItemProcessor": {
+                "ProcessorConfig": {
+                    "Mode": "DISTRIBUTED",
+                    "ExecutionType": "STANDARD",
+                },
+                "StartAt": task_id,
+                "States": states,
+            },
+            "ItemReader": {
+                "Resource": "arn:aws:states:::s3:getObject",
+                "ReaderConfig": _item_reader_config(self.item_format),
+                "Parameters": {"Bucket.$": "$.bucket", "Key.$": "$.key"},
+            },
+        }
+
+        if self.batch_size:
+
+            state_json["ItemBatcher"] = {
+                "MaxItemsPerBatch": self.batch_size,
+                "BatchInput": {_BATCH_KEY: "process"},
+            }
+
+        if self.result_location is not None:
+
+            result_location = S3Location.from_uri(self.result_location)
+
+            state_json["ResultWriter"] = {
+                "Resource": "arn:aws:states:::s3:putObject",
+                "Parameters": {
+                    "Bucket": result_location.bucket,
+                    "Prefix": result_location.key,
+                },
+            }
+
+        for key, field in (
+            ("comment", "Comment"),
+            ("input_path", "InputPath"),
+            ("max_concurrency", "MaxConcurrency"),
+            ("output_path", "OutputPath"),
+            ("result_path", "ResultPath"),
+            ("result_selector", "ResultSelector"),
+            ("parameters", "ItemSelector"),
+        ):
+
+            if map_kwargs.get(key) is not None:
+
+                state_json[field] = map_kwargs[key]
+
+        return state_json
+
+    def _distributed_map(
+        self,
+        scope: "aws_cdk.core.Construct",
+        id: str,
+        lambda_function,
+        map_kwargs: dict,
+    ) -> "aws_cdk.aws_stepfunctions.IChainable":
+        """
+        Render a distributed map state that reads its items from s3.
+
+        Its input must be the location of the items object,
+        {"bucket": ..., "key": ...}.
+        """
+
+        from aws_cdk import aws_stepfunctions as sfn
+
+        state_json = self._distributed_map_json(
+            lambda_function.function_arn,
+            id,
+            map_kwargs,
+        )
+
+        task = sfn.CustomState(scope, id, state_json=state_json)
+
+        if self.batch_size and self.result_location is None:
+
+            return sfn.Chain.start(task).next(
+                self._flatten(
+                    scope,
+                    id,
+                    self._batch_invoke_kwargs(lambda_function),
+                )
+            )
+
+        return task
+
+    def _auto_map(
+        self,
+        scope: "aws_cdk.core.Construct",
+        id: str,
+        lambda_function,
+        **kwargs,
+    ) -> "aws_cdk.aws_stepfunctions.Chain":
+        """
+        Render a map job that runs inline or distributed depending on its input size.
+
+        The lambda is first invoked to write the items to items_location
+        if there are more than distributed_threshold of them.
+        """
+
+        from aws_cdk import aws_stepfunctions as sfn
+        from aws_cdk import aws_stepfunctions_tasks as sfn_tasks
+
+        invoke_kwargs = self._batch_invoke_kwargs(lambda_function, **kwargs)
+
+        self._grant_staging(scope, id, lambda_function)
+
+        stage = sfn_tasks.LambdaInvoke(
+            scope,
+            f"stage_{id}",
+            payload=sfn.TaskInput.from_object(
+                {
+                    _ITEMS_KEY: "stage",
+                    "items": sfn.JsonPath.string_at(
+                        self.map_job_kwargs["items_path"] or "$"
+                    ),
+                }
+            ),
+            **_coalesce(
+                invoke_kwargs,
+                input_path=self.map_job_kwargs["input_path"],
+            ),
+        )
+
+        # the items have already been selected by the staging invocation
+
+        map_kwargs = _omit(
+            _coalesce(self.map_job_kwargs),
+            "input_path",
+            "items_path",
+        )
+
+        distributed = self._distributed_map(
+            scope,
+            f"{id}_distributed",
+            lambda_function,
+            map_kwargs=map_kwargs,
+        )
+
+        if self.batch_size:
+
+            inline = self._batched_map(
+                scope,
+                f"{id}_inline",
+                lambda_function,
+                select_items=False,
+                **kwargs,
+            )
+
+        else:
+
+            inline = self._map_state(
+                scope,
+                f"{id}_inline",
+                map_kwargs=map_kwargs,
+                invoke_kwargs=_coalesce(
+                    self.lambda_invoke_kwargs,
+                    lambda_function=lambda_function,
+                    **kwargs,
+                ),
+            )
+
+        choice = (
+            sfn.Choice(scope, f"{id}_item_source")
+            .when(sfn.Condition.is_present("$.bucket"), distributed)
+            .otherwise(inline)
+        )
+
+        return sfn.Chain.start(stage).next(choice.afterwards())
+
+    def definition(
+        self,
+        scope: "aws_cdk.core.Construct",
+        previous_definition: Optional[
+            "aws_cdk.aws_stepfunctions.IChainable"
+        ] = None,
+        previously_composed: Optional["Compose"] = None,
+        fuse: bool = False,
+    ):
+        """
+        Return automagically composed cdk state machine definition.
+
+        Args:
+            scope: cdk scope
+            previous_definition: the previous definition
+            previously_composed: functions already composed upstream of this one, which mustn't be downstream of it
+            fuse: if true, run each linear chain of compatible functions in a single lambda. See Compose.fusible_chain
+
+        Returns:
+
+        """
+        from orkestra.graph import Graph
+
+        previously_composed = previously_composed or []
+
+        graph = Graph(self)
+
+        if any(c in graph for c in previously_composed):
+
+            raise CompositionError(
+                f"Failed to compose {self}. Composition using >> must be acyclic."
+            )
+
+        # each function is rendered once, however many paths lead to it
+
+        chains = {}
+
+        tasks = {}
+
+        for node in graph:
+
+            node._check_renderable(graph.upstream[node])
+
+            if node in chains:
+                continue
+
+            if node.is_map_job:
+
+                chain = node.fusible_maps()
+
+                task = (
+                    node._fused_map(scope, chain, graph.ids)
+                    if len(chain) > 1
+                    else node._task(scope, None, graph.ids)
+                )
+
+            else:
+
+                chain = node.fusible_chain() if fuse else [node]
+
+                task = (
+                    node._fused_task(scope, chain, graph.ids)
+                    if len(chain) > 1
+                    else node._task(scope, None, graph.ids)
+                )
+
+            for c in chain:
+                chains[c] = chain
+
+            tasks[node] = task
+
+        for node, task in tasks.items():
+
+            for upstream in graph.upstream[node]:
+
+                tasks[chains[upstream][0]].next(task)
+
+        return (
+            tasks[self]
+            if previous_definition is None
+            else previous_definition.next(tasks[self])
+        )
+
+    def to_asl(
+        self,
+        payload_response_only: bool = True,
+        fuse: bool = False,
+        function_arn: Optional[Callable[["Compose"], Any]] = None,
+    ) -> dict:
+        """
+        Return the state machine definition, in amazon states language, without cdk.
+
+        Renders the same states as Compose.definition, but as plain dicts,
+        without aws_cdk or the jsii runtime.
+
+        Args:
+            payload_response_only: as in Compose.task
+            fuse: as in Compose.definition
+            function_arn: returns the ARN of each function's lambda. Default: a ${function_name} placeholder, for DefinitionSubstitutions. See orkestra.asl.Placeholders
+
+        Returns: the definition, ready to be dumped to json
 
-        if self.func is not None:
+        """
 
-            if self.enable_powertools:
+        from orkestra.asl import render
 
-                return powertools(
-                    decorated=self.func,
-                    **self.powertools_kwargs,
-                )(event, context)
+        return render(
+            self,
+            payload_response_only=payload_response_only,
+            fuse=fuse,
+            function_arn=function_arn,
+        )
 
-            else:
+    def _check_renderable(self, upstream: List["Compose"]):
+        """Raise CompositionError if this can't be rendered downstream of upstream."""
 
-                return self.func(event, context)
+        if len(self.downstream) > 1:
 
-        else:
+            raise CompositionError(
+                f"{self} has more than one downstream step. "
+                f"Group them in a list or tuple to run them in parallel."
+            )
 
-            self.func = event
+        for composable in upstream:
 
-            self._update_metadata()
+            if (
+                self.is_map_job
+                and not (self.batch_size or self.is_distributed)
+                and composable._has_opaque_output
+            ):
 
-            return self
+                raise CompositionError(
+                    f"{self} can't map over the encoded or offloaded output of {composable}. "
+                    f"Set batch_size or item_source so that a lambda reads it."
+                )
 
-    def __repr__(self) -> str:
+    def _fusible_with(self, other: "Compose") -> bool:
+        """Whether other can run in the same lambda, right after this."""
 
-        if hasattr(self.func, "__name__"):
-            func = self.func.__name__
-        else:
-            func = repr(self.func)
+        def lambda_config(composable):
+            return _omit(
+                composable.aws_lambda_constructor_kwargs,
+                "index",
+                "handler",
+                "timeout",
+            )
 
-        return f"Compose(func={func})"
+        def invoke_config(composable):
+            return _omit(
+                composable.lambda_invoke_kwargs,
+                *_INPUT_PATHS,
+                *_OUTPUT_PATHS,
+            )
 
-    def __rshift__(self, right):
-        right = (
-            Compose(func=right) if isinstance(right, (list, tuple)) else right
+        return (
+            self.downstream == [other]
+            and other.upstream == [self]
+            and not other.is_map_job
+            and callable(other.func)
+            and _importable(other)
+            and lambda_config(other) == lambda_config(self)
+            and invoke_config(other) == invoke_config(self)
+            and other.profile_location in (None, self.profile_location)
+            and not any(
+                self.lambda_invoke_kwargs.get(k) for k in _OUTPUT_PATHS
+            )
+            and not any(
+                other.lambda_invoke_kwargs.get(k) for k in _INPUT_PATHS
+            )
         )
-        self.downstream.append(right)
-        return right
 
-    @staticmethod
-    def _render_lambda(
-        composable: "Compose",
-        scope,
-        id=None,
-        **kwargs,
-    ):
+    def fusible_chain(self) -> List["Compose"]:
+        """
+        Return the linear run of functions starting here that can share a lambda.
 
-        from aws_cdk.aws_lambda_python import PythonFunction
+        Functions can be fused if each is the only one downstream of the last,
+        none is a map job or parallel step, and their lambdas differ only in
+        handler and timeout. JSONPath fields can only be applied before the
+        first function and after the last.
+        """
 
-        id = id or _incremental_id(composable.func.__name__ + "_fn")
+        chain = [self]
 
-        layers = composable.aws_lambda_constructor_kwargs.get("layers")
+        if self.is_map_job or not callable(self.func) or not _importable(self):
+            return chain
 
-        if layers is not None:
+        members = {self}
 
-            runtime = _coalesce(
-                composable._aws_lambda_defaults,
-                composable.aws_lambda_constructor_kwargs,
-            )["runtime"]
+        while len(chain[-1].downstream) == 1:
 
-            layers = [
-                l.cdk_construct(
-                    scope,
-                    _incremental_id(f"{id}_layer"),
-                    compatible_runtimes=[runtime],
-                )
-                for l in layers
-            ]
+            step = chain[-1].downstream[0]
 
-            if kwargs.get("layers") is not None:
+            if step in members or not chain[-1]._fusible_with(step):
+                break
 
-                kwargs["layers"].extend(layers)
+            chain.append(step)
 
-            else:
+            members.add(step)
 
-                kwargs["layers"] = layers
+        return chain
 
-        kwargs = _coalesce(
-            composable._aws_lambda_defaults,
-            composable.aws_lambda_constructor_kwargs,
-            kwargs,
+    @property
+    def _is_inline_map(self) -> bool:
+        """Whether this is a map job invoked once per item by a plain map state."""
+        return (
+            self.is_map_job
+            and not self.batch_size
+            and not self.is_distributed
+            and callable(self.func)
         )
 
-        return PythonFunction(
-            scope,
-            id,
-            **kwargs,
+    def _map_fusible_with(self, other: "Compose") -> bool:
+        """Whether other's map can be merged into this one's, item by item."""
+
+        return (
+            self.downstream == [other]
+            and other.upstream == [self]
+            and other._is_inline_map
+            and not any(
+                self.map_job_kwargs.get(k) is not None for k in _OUTPUT_PATHS
+            )
+            and not any(
+                other.map_job_kwargs.get(k) is not None
+                for k in ("input_path", "items_path")
+            )
+            and other.map_job_kwargs.get("parameters")
+            in (None, _MAP_ITEM_PARAMETERS)
         )
 
-    def aws_lambda(
-        self,
-        scope: "aws_cdk.core.Construct",
-        id: Optional[str] = None,
-        **kwargs,
-    ):
+    def fusible_maps(self) -> List["Compose"]:
         """
-        Return lambda cdk construct.
+        Return the run of map jobs starting here that can share a map state.
 
-        Args:
-            scope: cdk construct
-            id: construct id
-            **kwargs: to be passed to aws_cdk.aws_lambda_python.PythonFunction
+        Each item then goes through every map job in turn, without waiting for
+        the other items to finish the one before. Only map jobs invoked once
+        per item can be merged, and only the first may select its items
+        and only the last its output.
+        """
 
-        Returns (aws_cdk.aws_lambda_python.PythonFunction): python lambda
+        chain = [self]
 
-        """
+        if not self._is_inline_map:
+            return chain
 
-        return self._render_lambda(
-            self,
-            scope,
-            id=id,
-            **kwargs,
-        )
+        members = {self}
 
-    def task(
+        while len(chain[-1].downstream) == 1:
+
+            step = chain[-1].downstream[0]
+
+            if step in members or not chain[-1]._map_fusible_with(step):
+                break
+
+            chain.append(step)
+
+            members.add(step)
+
+        return chain
+
+    def _fused_map(
         self,
         scope: "aws_cdk.core.Construct",
-        id: Optional[str] = None,
-        payload_response_only: bool = True,
-        function_name: Optional[str] = None,
-        **kwargs,
-    ):
+        chain: List["Compose"],
+        ids: Dict["Compose", str],
+    ) -> "aws_cdk.aws_stepfunctions.Map":
         """
-        Return cdk step function task construct.
+        Render one map state whose iterator invokes each map job in chain in turn.
+
+        A map job that captures its errors passes them on to the next, as it
+        would if their map states were separate.
         """
 
         from aws_cdk import aws_stepfunctions as sfn
         from aws_cdk import aws_stepfunctions_tasks as sfn_tasks
 
-        if self.is_map_job:
+        first, last = chain[0], chain[-1]
 
-            id = id or _incremental_id(self.func.__name__)
+        concurrency = [
+            c.map_job_kwargs["max_concurrency"]
+            for c in chain
+            if c.map_job_kwargs.get("max_concurrency")
+        ]
 
-            map_kwargs = _coalesce(self.map_job_kwargs)
+        task = sfn.Map(
+            scope,
+            _incremental_id(scope, "_".join(ids[c] for c in chain)),
+            **_coalesce(
+                {
+                    k: first.map_job_kwargs.get(k)
+                    for k in (
+                        "comment",
+                        "input_path",
+                        "items_path",
+                        "parameters",
+                    )
+                },
+                {k: last.map_job_kwargs.get(k) for k in _OUTPUT_PATHS},
+                max_concurrency=min(concurrency) if concurrency else None,
+            ),
+        )
 
-            task = sfn.Map(scope, id, **map_kwargs)
+        invocations = []
 
-            lambda_function = self.aws_lambda(
-                scope,
-                function_name=function_name,
-            )
+        for c in chain:
 
-            keyword_args = _coalesce(
-                self.lambda_invoke_kwargs,
-                lambda_function=lambda_function,
-                payload_response_only=payload_response_only,
-                **kwargs,
-            )
+            lambda_function = c.aws_lambda(scope)
 
-            task_id = f"invoke_{id}"
+            c._lambda_function = lambda_function
 
-            invoke_lambda = sfn_tasks.LambdaInvoke(
+            invoke = sfn_tasks.LambdaInvoke(
                 scope,
-                task_id,
-                **keyword_args,
+                _incremental_id(scope, f"invoke_{ids[c]}"),
+                **_coalesce(
+                    c.lambda_invoke_kwargs,
+                    lambda_function=lambda_function,
+                ),
             )
 
-            invoke_lambda.lambda_function = lambda_function
+            invoke.lambda_function = lambda_function
 
-            if self.capture_map_errors:
-                invoke_lambda.add_catch(
-                    sfn.Pass(
-                        scope,
-                        f"{task_id}_failed",
-                    )
-                )
+            invocations.append(invoke)
 
-            task.iterator(invoke_lambda)
-
-        elif isinstance(self.func, (list, tuple)):
+        for c, invoke, following in zip(
+            chain,
+            invocations,
+            [*invocations[1:], None],
+        ):
 
-            id = "parallelize " + (
-                "".join([c.func.__name__ for c in self.func])
-            )
+            if following is not None:
+                invoke.next(following)
 
-            task = sfn.Parallel(
-                scope,
-                _incremental_id(id),
-            )
+            if c.capture_map_errors:
 
-            for fn in self.func:
+                failed = sfn.Pass(scope, f"{invoke.node.id}_failed")
 
-                lambda_fn = fn.aws_lambda(scope)
+                if following is not None:
+                    failed.next(following)
 
-                keyword_args = _coalesce(
-                    self.lambda_invoke_kwargs,
-                    lambda_function=lambda_fn,
-                    payload_response_only=payload_response_only,
-                    **kwargs,
-                )
+                invoke.add_catch(failed)
 
-                branch = sfn_tasks.LambdaInvoke(
-                    scope,
-                    _incremental_id(fn.func.__name__),
-                    **keyword_args,
-                )
+        task.iterator(invocations[0])
 
-                if isinstance(self.func, tuple):
+        return coerce(task)
 
-                    branch.add_catch(
-                        sfn.Pass(
-                            scope,
-                            f"{fn.func.__name__}_failed",
-                        )
-                    )
+    def _fused_task(
+        self,
+        scope: "aws_cdk.core.Construct",
+        chain: List["Compose"],
+        ids: Dict["Compose", str],
+    ) -> "aws_cdk.aws_stepfunctions_tasks.LambdaInvoke":
+        """
+        Render one lambda invocation that runs each function in chain in turn.
 
-                task.branch(branch)
+        The lambda's handler is this function, which calls the rest in-process.
+        Its timeout is the sum of theirs, and an error in any of them fails it
+        the way it would have failed its own invocation.
+        """
 
-        else:
+        from aws_cdk import aws_stepfunctions_tasks as sfn_tasks
 
-            id = id or _incremental_id(self.func.__name__)
+        lambda_function = self._fused_lambda(scope, chain)
 
-            lambda_function = self.aws_lambda(
-                scope,
-                function_name=function_name,
-            )
+        last = chain[-1]
 
-            keyword_args = _coalesce(
-                self.lambda_invoke_kwargs,
+        task = sfn_tasks.LambdaInvoke(
+            scope,
+            _incremental_id(scope, "_".join(ids[c] for c in chain)),
+            **_coalesce(
+                _omit(self.lambda_invoke_kwargs, *_OUTPUT_PATHS),
+                {k: last.lambda_invoke_kwargs.get(k) for k in _OUTPUT_PATHS},
                 lambda_function=lambda_function,
-                payload_response_only=payload_response_only,
-                **kwargs,
-            )
-
-            task = sfn_tasks.LambdaInvoke(
-                scope,
-                id,
-                **keyword_args,
-            )
+            ),
+        )
 
-            task.lambda_function = lambda_function
+        task.lambda_function = lambda_function
 
         return coerce(task)
 
-    def definition(
+    def _fused_lambda(
         self,
         scope: "aws_cdk.core.Construct",
-        previous_definition: Optional[
-            "aws_cdk.aws_stepfunctions.IChainable"
-        ] = None,
-        previously_composed: Optional["Compose"] = None,
-    ):
-        """
-        Return automagically composed cdk state machine definition.
+        chain: List["Compose"],
+    ) -> "aws_cdk.aws_lambda_python.PythonFunction":
+        """Render the lambda that runs each function in chain in turn."""
 
-        Args:
-            scope: cdk scope
-            previous_definition: the previous definition
-            previously_composed: the previously composed
-
-        Returns:
-
-        """
-        previously_composed = previously_composed or []
+        from aws_cdk import core as cdk
 
-        if self in previously_composed:
+        name = "_".join(c.func.__name__ for c in chain)
 
-            raise CompositionError(
-                f"Failed to compose {self}. Composition using >> must be acyclic."
+        timeout = sum(
+            (
+                _seconds(c.aws_lambda_constructor_kwargs["timeout"])
+                if c.aws_lambda_constructor_kwargs.get("timeout") is not None
+                else 3
             )
+            for c in chain
+        )
 
-        task = self.task(scope)
+        environment = {
+            **(self.aws_lambda_constructor_kwargs.get("environment") or {}),
+            _FUSED_STEPS_ENV: ",".join(
+                f"{c.func.__module__.rpartition('.')[2]}:{c.func.__qualname__}"
+                for c in chain
+            ),
+        }
 
-        definition = (
-            task
-            if previous_definition is None
-            else previous_definition.next(task)
+        lambda_function = self._render_lambda(
+            self,
+            scope,
+            id=_incremental_id(scope, f"{name}_fn"),
+            timeout=cdk.Duration.seconds(min(timeout, 900)),
+            environment=environment,
         )
 
-        if self.downstream:
+        for c in chain:
 
-            for c in self.downstream:
+            c._lambda_function = lambda_function
 
-                c.definition(
-                    scope,
-                    previous_definition=definition,
-                    previously_composed=previously_composed + [self],
+            if c.offload_location is not None:
+
+                c._offload_bucket(scope).grant_read_write(
+                    lambda_function,
+                    f"{S3Location.from_uri(c.offload_location).key}*",
                 )
 
-        return definition
+        return lambda_function
 
     def state_machine(
         self,
@@ -511,6 +2183,7 @@ class Compose:
         state_machine_type: Optional[
             Union[SfnType, "aws_cdk.aws_stepfunctions.StateMachineType"]
         ] = None,
+        fuse: bool = False,
         **kwargs,
     ):
         """
@@ -522,6 +2195,7 @@ class Compose:
             tracing_enabled: xray tracing
             state_machine_name: name of state machine
             state_machine_type: express or standard
+            fuse: if true, run each linear chain of compatible functions in a single lambda
             **kwargs:
 
         Returns:
@@ -530,7 +2204,7 @@ class Compose:
 
         from aws_cdk.aws_stepfunctions import StateMachine
 
-        id = id or _incremental_id(f"{self.func.__name__}_sfn")
+        id = id or _incremental_id(scope, f"{self.func.__name__}_sfn")
 
         state_machine_kwargs = _coalesce(
             self.state_machine_kwargs,
@@ -539,14 +2213,155 @@ class Compose:
             **kwargs,
         )
 
-        return StateMachine(
+        state_machine = StateMachine(
             scope,
             id,
-            definition=self.definition(scope),
+            definition=self.definition(scope, fuse=fuse),
             tracing_enabled=tracing_enabled,
             **state_machine_kwargs,
         )
 
+        self._grant_distributed_maps(scope, state_machine)
+
+        self._grant_offloaded_reads(scope)
+
+        return state_machine
+
+    def _walk(self) -> Iterator["Compose"]:
+        """Yield this and everything composed downstream of it, once each."""
+
+        seen = set()
+
+        stack = [self]
+
+        while stack:
+
+            node = stack.pop()
+
+            if node in seen:
+                continue
+
+            seen.add(node)
+
+            yield node
+
+            stack.extend(node.downstream)
+
+            if isinstance(node.func, (list, tuple)):
+                stack.extend(node.func)
+
+    def _grant_distributed_maps(self, scope, state_machine):
+        """
+        Grant state_machine what its distributed maps need.
+
+        Distributed maps are rendered as custom states, so cdk doesn't know to
+        let the state machine invoke their lambdas, read their items, write
+        their results, or start the child executions that run them.
+        """
+
+        from aws_cdk import aws_iam as iam
+        from aws_cdk import aws_s3 as s3
+        from aws_cdk import core as cdk
+
+        distributed = [
+            node
+            for node in self._walk()
+            if node.is_map_job
+            and node.is_distributed
+            and node._lambda_function is not None
+        ]
+
+        if not distributed:
+            return
+
+        stack = cdk.Stack.of(scope)
+
+        state_machine.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["states:StartExecution"],
+                resources=[
+                    stack.format_arn(
+                        service="states",
+                        resource="stateMachine",
+                        resource_name="*",
+                        sep=":",
+                    )
+                ],
+            )
+        )
+
+        state_machine.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["states:DescribeExecution", "states:StopExecution"],
+                resources=[
+                    stack.format_arn(
+                        service="states",
+                        resource="execution",
+                        resource_name="*",
+                        sep=":",
+                    )
+                ],
+            )
+        )
+
+        for node in distributed:
+
+            node._lambda_function.grant_invoke(state_machine)
+
+            name = node.func.__name__
+
+            s3.Bucket.from_bucket_name(
+                scope,
+                _incremental_id(scope, f"{name}_items_bucket"),
+                S3Location.from_uri(node.items_location).bucket,
+            ).grant_read(state_machine)
+
+            if node.result_location is not None:
+
+                s3.Bucket.from_bucket_name(
+                    scope,
+                    _incremental_id(scope, f"{name}_results_bucket"),
+                    S3Location.from_uri(node.result_location).bucket,
+                ).grant_read_write(state_machine)
+
+    def _grant_offloaded_reads(self, scope):
+        """
+        Let each lambda read the outputs offloaded by those upstream of it.
+
+        Writers are granted access to their own offload_location when
+        their lambda is rendered.
+        """
+
+        for node in self._walk():
+
+            writers = (
+                list(node.func)
+                if isinstance(node.func, (list, tuple))
+                else [node]
+            )
+
+            writers = [w for w in writers if w.offload_location is not None]
+
+            if not writers:
+                continue
+
+            readers = [
+                r._lambda_function
+                for d in node.downstream
+                for r in d._walk()
+                if r._lambda_function is not None
+            ]
+
+            for writer in writers:
+
+                bucket = writer._offload_bucket(scope)
+
+                key = S3Location.from_uri(writer.offload_location).key
+
+                for reader in readers:
+
+                    bucket.grant_read(reader, f"{key}*")
+
     def schedule(
         self,
         scope: "aws_cdk.core.Construct",
@@ -560,6 +2375,7 @@ class Compose:
         year: Optional[str] = None,
         state_machine_name: Optional[str] = None,
         state_machine_type: Optional[SfnType] = None,
+        fuse: bool = False,
         **kwargs,
     ) -> tuple:
         """
@@ -577,6 +2393,7 @@ class Compose:
             year: year
             state_machine_name: the state machine name, if downstream
             state_machine_type: type of state machine; express or standard
+            fuse: if true, run each linear chain of compatible functions in a single lambda
             **kwargs:
 
         Returns (tuple): EventBridge schedule rule, SFN State Machine
@@ -585,7 +2402,7 @@ class Compose:
         from aws_cdk import aws_events as eventbridge
         from aws_cdk import aws_events_targets as eventbridge_targets
 
-        id = id or _incremental_id(f"{self.func.__name__}_sched")
+        id = id or _incremental_id(scope, f"{self.func.__name__}_sched")
 
         if expression is not None:
             schedule = eventbridge.Schedule.expression(expression)
@@ -610,6 +2427,7 @@ class Compose:
             scope,
             state_machine_name=state_machine_name,
             state_machine_type=state_machine_type,
+            fuse=fuse,
             **kwargs,
         )
 
@@ -630,6 +2448,7 @@ def powertools(
     default_dimensions: Optional[dict] = None,
     model: Optional["pydantic.BaseModel"] = None,
     envelope: Optional["pydantic.BaseModel"] = None,
+    trusted: bool = False,
 ):
     """
     AWS lambda powertools shortcut.
@@ -644,13 +2463,11 @@ def powertools(
         default_dimensions: passed to aws_lambda_powertools.Metrics
         model: passed to aws_lambda_powertools.utilities.parser.event_parser
         envelope: passed to aws_lambda_powertools.utilities.parser.event_parser
+        trusted: if true, events are constructed as model without being validated
 
     For further descriptions, see https://awslabs.github.io/aws-lambda-powertools-python/latest/
     """
 
-    from aws_lambda_powertools import Logger, Tracer, Metrics
-    from aws_lambda_powertools.utilities.parser import parse
-
     def decorator(func):
 
         if isinstance(func, Compose):
@@ -668,6 +2485,23 @@ def powertools(
             )
         )
 
+        # powertools' wrappers are synchronous
+
+        if inspect.iscoroutinefunction(func):
+
+            func = _synchronize(func)
+
+        # if powertools hasn't been imported, the function's module can't
+        # hold a Logger, Tracer, or Metrics instance, so skip importing it
+
+        if "aws_lambda_powertools" in sys.modules:
+
+            from aws_lambda_powertools import Logger, Tracer, Metrics
+
+        else:
+
+            Logger = Tracer = Metrics = ()
+
         if isinstance(logger, Logger):
 
             func = logger.inject_lambda_context(
@@ -694,21 +2528,15 @@ def powertools(
 
         if model is not None:
 
+            parse = _model_parser(model, envelope, trusted)
+
             @functools.wraps(func)
             def mini_decorator(event, context):
                 """
                 Exists because event_parser expects the function it wraps to be named "handler".
                 """
 
-                logger.debug(f"parsing {event = }")
-
-                parsed_event = parse(
-                    event=event,
-                    model=model,
-                    envelope=envelope,
-                )
-
-                return func(parsed_event, context)
+                return func(parse(event), context)
 
             return mini_decorator
 
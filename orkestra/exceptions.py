@@ -1,2 +1,14 @@
 class CompositionError(Exception):
     ...
+
+
+class ExecutionFailed(Exception):
+    """A state machine execution failed with an error it didn't catch."""
+
+    def __init__(self, error: str, cause: str = ""):
+
+        super().__init__(error, cause)
+
+        self.error = error
+
+        self.cause = cause
@@ -0,0 +1,142 @@
+"""
+The graph of functions composed with >>, built once per render.
+"""
+
+from typing import *
+
+from orkestra.exceptions import CompositionError
+
+_UNVISITED, _VISITING, _VISITED = range(3)
+
+
+def state_ids(nodes: Iterable["Compose"]) -> Dict["Compose", str]:
+    """
+    Name the state of each of nodes, in order, by its position.
+
+    A node is named for its function, numbered from 2 if an earlier node
+    has the same name, e.g. handler, handler2. A parallel node is named for
+    its branches, which are named in turn after it.
+    """
+
+    ids = {}
+
+    taken = set()
+
+    def allocate(base: str) -> str:
+
+        name, number = base, 2
+
+        while name in taken:
+
+            name = f"{base}{number}"
+
+            number += 1
+
+        taken.add(name)
+
+        return name
+
+    for node in nodes:
+
+        if isinstance(node.func, (list, tuple)):
+
+            ids[node] = allocate(
+                "parallelize " + "".join(c.func.__name__ for c in node.func)
+            )
+
+            for branch in node.func:
+
+                if branch not in ids:
+                    ids[branch] = allocate(branch.func.__name__)
+
+        elif node not in ids:
+
+            ids[node] = allocate(node.func.__name__)
+
+    return ids
+
+
+class Graph:
+    """
+    Functions reachable downstream of a root, and the edges between them.
+
+    Parallel branches are part of the node that contains them rather than
+    nodes of their own, the way they're rendered.
+    """
+
+    def __init__(self, root: "Compose"):
+
+        self.root = root
+
+        self.upstream: Dict["Compose", List["Compose"]] = {root: []}
+
+        self.order = self._topological_order()
+
+        # the name of each node's state, by its position in the graph
+
+        self.ids = state_ids(self.order)
+
+    def _topological_order(self) -> List["Compose"]:
+        """
+        Return the nodes in topological order, collecting edges along the way.
+
+        A depth-first search that raises CompositionError on reaching a node
+        that is still being visited, i.e. a cycle. O(V+E).
+        """
+
+        state = {self.root: _VISITING}
+
+        postorder = []
+
+        stack = [(self.root, iter(self.root.downstream))]
+
+        while stack:
+
+            node, children = stack[-1]
+
+            child = next(children, None)
+
+            if child is None:
+
+                stack.pop()
+
+                state[node] = _VISITED
+
+                postorder.append(node)
+
+                continue
+
+            self.upstream.setdefault(child, []).append(node)
+
+            child_state = state.get(child, _UNVISITED)
+
+            if child_state == _VISITING:
+
+                raise CompositionError(
+                    f"Failed to compose {child}. Composition using >> must be acyclic."
+                )
+
+            if child_state == _UNVISITED:
+
+                state[child] = _VISITING
+
+                stack.append((child, iter(child.downstream)))
+
+        return postorder[::-1]
+
+    def __iter__(self) -> Iterator["Compose"]:
+        return iter(self.order)
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __contains__(self, node) -> bool:
+        return node in self.upstream
+
+    @property
+    def edges(self) -> List[Tuple["Compose", "Compose"]]:
+        return [
+            (upstream, node)
+            for node in self.order
+            for upstream in self.upstream[node]
+        ]
@@ -0,0 +1,376 @@
+"""
+Measure where synth spends its time in orkestra.
+
+While a SynthTracer is running, each call to
+
+* Compose.definition
+* Compose._task, which renders each task, for Compose.task or definition
+* Compose._render_lambda
+* PythonLayerVersion.cdk_construct
+* _coalesce
+
+is timed and counted, and the outermost of them also count the constructs
+they add to their stack, by the dag (the function the composition starts
+with) and the stack they were called for.
+
+    from orkestra.instrumentation import SynthTracer
+
+    with SynthTracer("synth-trace.json") as tracer:
+        app.synth()
+
+    print(tracer.summary())
+
+The trace is in Chrome's trace event format, as read by chrome://tracing
+and https://ui.perfetto.dev. Time a call spends outside the functions it
+calls is its "self" time: for _render_lambda, mostly jsii creating the
+function's constructs, and bundling its assets. _coalesce is called too
+often to be worth drawing, so it's only summarized.
+
+An app can call trace_from_environment before constructing its stacks, so
+that setting the ORKESTRA_SYNTH_TRACE environment variable to a path traces
+the rest of the process, writing the trace there and the summary to stderr
+on exit.
+"""
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import *
+
+SYNTH_TRACE_ENV = "ORKESTRA_SYNTH_TRACE"
+
+# only summarized, not written as trace events
+
+_SUMMARIZED_ONLY = frozenset(("_coalesce",))
+
+
+@dataclass
+class CallStats:
+    calls: int = 0
+    total: float = 0.0
+    self_time: float = 0.0
+    constructs: int = 0
+
+
+def _targets() -> List[Tuple[Any, str]]:
+    """The (owner, attribute) of each function traced."""
+
+    from orkestra import asl, layers, utils
+    from orkestra.decorators import Compose
+    from orkestra.interfaces import PythonLayerVersion
+
+    targets = [
+        (Compose, "definition"),
+        (Compose, "_task"),
+        (Compose, "_render_lambda"),
+        (PythonLayerVersion, "cdk_construct"),
+    ]
+
+    # modules that imported _coalesce by name have a binding of their own
+
+    for module in list(sys.modules.values()):
+
+        namespace = getattr(module, "__dict__", {})
+
+        if namespace.get("_coalesce") is utils._coalesce:
+            targets.append((module, "_coalesce"))
+
+    return targets
+
+
+def _label(target) -> str:
+    """The dag a call was made for, or what else it rendered."""
+
+    from orkestra.decorators import Compose
+    from orkestra.metrics import dag_name
+
+    if isinstance(target, Compose):
+        return dag_name(target)
+
+    return f"layer {target.entry or target._arn}"
+
+
+def _children(scope) -> Optional[int]:
+    """How many children scope has, or None if it isn't a construct."""
+
+    try:
+
+        return len(scope.node.children)
+
+    except Exception:
+
+        # not a construct, e.g. when rendering fails
+
+        return None
+
+
+def _created(scope, before: int) -> Optional[Tuple[str, int]]:
+    """
+    The path of scope's stack, and how many constructs were added under
+    scope since it had before children.
+
+    Children are kept in the order they're added, so only the new ones, and
+    what's under them, are counted, rather than the whole stack.
+    """
+
+    from aws_cdk import core as cdk
+
+    try:
+
+        children = scope.node.children[before:]
+
+        return (
+            cdk.Stack.of(scope).node.path,
+            sum(len(child.node.find_all()) for child in children),
+        )
+
+    except Exception:
+
+        return None
+
+
+class SynthTracer:
+    """Record calls to orkestra's rendering functions, while running."""
+
+    def __init__(self, path: Optional[Union[str, Path]] = None):
+        """
+        Args:
+            path: where to write the trace when stopped. Default: nowhere
+        """
+
+        self.path = path
+
+        self.events: List[dict] = []
+
+        self.stats: Dict[str, CallStats] = {}
+
+        self.dag_constructs: Counter = Counter()
+
+        self.stack_constructs: Counter = Counter()
+
+        self._local = threading.local()
+
+        self._originals: List[Tuple[Any, str, Any]] = []
+
+        self._origin = time.perf_counter()
+
+    def __enter__(self) -> "SynthTracer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+
+        if self._originals:
+            raise RuntimeError("the tracer is already running")
+
+        for owner, attribute in _targets():
+
+            original = vars(owner)[attribute]
+
+            if isinstance(original, staticmethod):
+                traced = staticmethod(self._traced(original.__func__))
+            else:
+                traced = self._traced(original)
+
+            self._originals.append((owner, attribute, original))
+
+            setattr(owner, attribute, traced)
+
+    def stop(self):
+
+        for owner, attribute, original in reversed(self._originals):
+            setattr(owner, attribute, original)
+
+        self._originals.clear()
+
+        if self.path is not None:
+            self.write(self.path)
+
+    def _traced(self, func: Callable) -> Callable:
+
+        name = func.__name__
+
+        summarized_only = name in _SUMMARIZED_ONLY
+
+        def traced(*args, **kwargs):
+
+            # the time spent in traced calls made by each call in progress
+
+            calls = self._local.__dict__.setdefault("calls", [])
+
+            counting = not calls and not summarized_only
+
+            if counting:
+
+                scope = kwargs.get("scope", args[1] if len(args) > 1 else None)
+
+                before = _children(scope)
+
+            calls.append(0.0)
+
+            start = time.perf_counter()
+
+            try:
+
+                return func(*args, **kwargs)
+
+            finally:
+
+                duration = time.perf_counter() - start
+
+                children = calls.pop()
+
+                if calls:
+                    calls[-1] += duration
+
+                stats = self.stats.setdefault(name, CallStats())
+
+                stats.calls += 1
+                stats.total += duration
+                stats.self_time += duration - children
+
+                event_args = {}
+
+                if counting:
+
+                    label = _label(args[0])
+
+                    after = None if before is None else _created(scope, before)
+
+                    event_args["dag"] = label
+
+                    if after is not None:
+
+                        stack, created = after
+
+                        stats.constructs += created
+
+                        self.dag_constructs[label] += created
+
+                        self.stack_constructs[stack] += created
+
+                        event_args.update(stack=stack, constructs=created)
+
+                if not summarized_only:
+
+                    self.events.append(
+                        {
+                            "name": name,
+                            "cat": "orkestra",
+                            "ph": "X",
+                            "ts": (start - self._origin) * 1e6,
+                            "dur": duration * 1e6,
+                            "pid": os.getpid(),
+                            "tid": threading.get_ident(),
+                            "args": event_args,
+                        }
+                    )
+
+        traced.__wrapped__ = func
+
+        return traced
+
+    def chrome_trace(self) -> dict:
+        """The calls recorded, in Chrome's trace event format."""
+
+        return {
+            "traceEvents": sorted(self.events, key=lambda e: e["ts"]),
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "dag_constructs": dict(self.dag_constructs),
+                "stack_constructs": dict(self.stack_constructs),
+            },
+        }
+
+    def write(self, path: Union[str, Path]):
+
+        path = Path(path)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        path.write_text(json.dumps(self.chrome_trace()))
+
+    def summary(self) -> str:
+        """A table of calls, slowest first, then constructs by dag and stack."""
+
+        rows = [
+            (
+                name,
+                str(stats.calls),
+                f"{stats.total * 1e3:.1f}",
+                f"{stats.self_time * 1e3:.1f}",
+                str(stats.constructs),
+            )
+            for name, stats in sorted(
+                self.stats.items(), key=lambda item: -item[1].total
+            )
+        ]
+
+        lines = _table(
+            ("function", "calls", "total ms", "self ms", "constructs"), rows
+        )
+
+        for title, counter in (
+            ("dag", self.dag_constructs),
+            ("stack", self.stack_constructs),
+        ):
+
+            if counter:
+
+                lines.append("")
+
+                lines.extend(
+                    _table(
+                        (title, "constructs"),
+                        [(k, str(v)) for k, v in counter.most_common()],
+                    )
+                )
+
+        return "\n".join(lines)
+
+
+def _table(header: Sequence[str], rows: Sequence[Sequence[str]]) -> List[str]:
+
+    widths = [
+        max(len(row[i]) for row in [header, *rows]) for i in range(len(header))
+    ]
+
+    def line(row):
+        return "  ".join(
+            cell.ljust(width) if i == 0 else cell.rjust(width)
+            for i, (cell, width) in enumerate(zip(row, widths))
+        )
+
+    return [line(header), *map(line, rows)]
+
+
+def trace_from_environment() -> Optional[SynthTracer]:
+    """Trace the rest of the process, if $ORKESTRA_SYNTH_TRACE names a path."""
+
+    path = os.environ.get(SYNTH_TRACE_ENV)
+
+    if not path:
+        return None
+
+    tracer = SynthTracer(path)
+
+    tracer.start()
+
+    def stop():
+
+        tracer.stop()
+
+        print(tracer.summary(), file=sys.stderr)
+
+    atexit.register(stop)
+
+    return tracer
@@ -139,11 +139,34 @@ class PythonLayerVersion:
         id,
         compatible_runtimes=None,
     ) -> "aws_cdk.aws_lambda_python.PythonLayerVersion":
+        """
+        Return the layer's cdk construct.
+
+        A layer is rendered once per stack, and shared by every function in
+        the stack that lists it, rather than built and published once each.
+        """
         from aws_cdk.aws_lambda_python import PythonLayerVersion
 
+        from orkestra.utils import _stack_state
+
+        # layers already rendered in the stack
+
+        layers = _stack_state(scope, "layers")
+
+        key = (
+            self.entry,
+            self.description,
+            self._arn,
+            tuple(r.name for r in compatible_runtimes or ()),
+        )
+
+        if key in layers:
+
+            return layers[key]
+
         if self._arn is None:
 
-            return PythonLayerVersion(
+            layer = PythonLayerVersion(
                 scope,
                 id,
                 entry=self.entry,
@@ -153,13 +176,17 @@ class PythonLayerVersion:
 
         else:
 
-            return PythonLayerVersion.from_layer_version_attributes(
+            layer = PythonLayerVersion.from_layer_version_attributes(
                 scope,
                 id,
                 layer_version_arn=self._arn,
                 compatible_runtimes=compatible_runtimes,
             )
 
+        layers[key] = layer
+
+        return layer
+
     @classmethod
     def from_layer_version_arn(cls, layer_version_arn):
         """
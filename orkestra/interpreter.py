@@ -0,0 +1,832 @@
+"""
+Run amazon states language definitions in-process.
+
+Where LocalExecutor walks a composition, this executes the definition
+itself, e.g. the one Compose.to_asl renders, so that the JSONPath fields,
+retries, catches, and concurrency limits it declares are exercised too.
+
+    interpreter = Interpreter.from_composition(ones_and_zeros)
+    interpreter.run({})
+
+Intrinsic functions and task timeouts aren't supported.
+"""
+
+import datetime
+import json
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import *
+
+from orkestra.exceptions import ExecutionFailed
+from orkestra.metrics import in_map_item
+from orkestra.storage import (
+    S3Location,
+    dump_items,
+    load_items,
+    local_s3,
+)
+from orkestra.utils import _error_output, generic_context
+
+_LAMBDA_INVOKE = "arn:aws:states:::lambda:invoke"
+
+_READER_FORMATS = {"JSONL": "jsonl", "CSV": "csv", "JSON": "json"}
+
+_PATH_PART = re.compile(r"\.([^.\[]+)|\[(\d+)\]|\['([^']*)'\]")
+
+_MISSING = object()
+
+
+class RealClock:
+    """Sleep for as long as the definition says to wait."""
+
+    def now(self) -> float:
+        return time.time()
+
+    def sleep(self, seconds: float):
+        time.sleep(max(seconds, 0))
+
+
+class VirtualClock:
+    """
+    Advance time without sleeping, so retries and waits cost nothing.
+
+    Time is shared by every branch and item, so concurrent waits add up
+    rather than overlap.
+    """
+
+    def __init__(self, start: Optional[float] = None):
+
+        self._now = time.time() if start is None else start
+
+        self._lock = threading.Lock()
+
+    def now(self) -> float:
+        return self._now
+
+    def sleep(self, seconds: float):
+
+        with self._lock:
+
+            self._now += max(seconds, 0)
+
+
+@dataclass
+class StateTiming:
+    """
+    When a state was entered, and how long it took.
+
+    Args:
+        path: the names of the states containing this one, then its own,
+            with map items by index
+        type: the state's Type
+        started: the clock's time on entering the state
+        duration: seconds on the clock, including retries and waits
+        wall_duration: seconds actually spent
+        attempts: how many times a task was tried
+    """
+
+    path: Tuple[Union[str, int], ...]
+    type: str
+    started: float
+    duration: float
+    wall_duration: float
+    attempts: int = 1
+
+    @property
+    def name(self) -> str:
+        return str(self.path[-1])
+
+
+class _StatesError(Exception):
+    """An error in a state, to be retried, caught, or failed on."""
+
+    def __init__(self, error: str, cause: str = ""):
+
+        super().__init__(error, cause)
+
+        self.error = error
+
+        self.cause = cause
+
+    @property
+    def output(self) -> dict:
+        return {"Error": self.error, "Cause": self.cause}
+
+
+def _parse_path(path: str) -> List[Union[str, int]]:
+
+    if path in ("$", "$$"):
+        return []
+
+    root = "$$" if path.startswith("$$") else "$"
+
+    rest = path[len(root) :]
+
+    parts = []
+
+    position = 0
+
+    for match in _PATH_PART.finditer(rest):
+
+        if match.start() != position:
+            break
+
+        name, index, quoted = match.groups()
+
+        parts.append(int(index) if index is not None else name or quoted)
+
+        position = match.end()
+
+    if position != len(rest):
+
+        raise _StatesError("States.Runtime", f"unsupported JSONPath {path!r}")
+
+    return parts
+
+
+def _select(path: str, data, context: Optional[dict] = None):
+    """Return the value at path, a JSONPath into data or, for $$, context."""
+
+    value = context if path.startswith("$$") else data
+
+    for part in _parse_path(path):
+
+        try:
+            value = value[part]
+        except (KeyError, IndexError, TypeError):
+            raise _StatesError(
+                "States.Runtime", f"{path!r} matched nothing in the input"
+            )
+
+    return value
+
+
+def _is_present(path: str, data) -> bool:
+
+    try:
+        _select(path, data)
+    except _StatesError:
+        return False
+
+    return True
+
+
+def _assign(data, path: Optional[str], value):
+    """Return data with value placed at path, as ResultPath does."""
+
+    if path is _MISSING or path == "$":
+        return value
+
+    if path is None:
+        return data
+
+    parts = _parse_path(path)
+
+    result = json.loads(json.dumps(data)) if isinstance(data, dict) else {}
+
+    target = result
+
+    for part in parts[:-1]:
+
+        if not isinstance(target.get(part), dict):
+            target[part] = {}
+
+        target = target[part]
+
+    target[parts[-1]] = value
+
+    return result
+
+
+def _render(template, data, context: Optional[dict] = None):
+    """Render Parameters, ResultSelector, or ItemSelector against data."""
+
+    if isinstance(template, dict):
+
+        rendered = {}
+
+        for key, value in template.items():
+
+            if key.endswith(".$"):
+
+                if value.startswith("States."):
+
+                    raise _StatesError(
+                        "States.Runtime",
+                        f"intrinsic functions aren't supported: {value}",
+                    )
+
+                rendered[key[:-2]] = _select(value, data, context)
+
+            else:
+
+                rendered[key] = _render(value, data, context)
+
+        return rendered
+
+    if isinstance(template, list):
+
+        return [_render(v, data, context) for v in template]
+
+    return template
+
+
+def _matches(error: str, error_equals: List[str]) -> bool:
+
+    return any(
+        e == error
+        or e == "States.ALL"
+        or (e == "States.TaskFailed" and error != "States.Timeout")
+        for e in error_equals
+    )
+
+
+_COMPARISONS = {
+    "Equals": lambda a, b: a == b,
+    "LessThan": lambda a, b: a < b,
+    "LessThanEquals": lambda a, b: a <= b,
+    "GreaterThan": lambda a, b: a > b,
+    "GreaterThanEquals": lambda a, b: a >= b,
+}
+
+_TYPES = {
+    "String": str,
+    "Numeric": (int, float),
+    "Boolean": bool,
+    "Timestamp": str,
+}
+
+
+def _choose(rule: dict, data) -> bool:
+    """Whether data satisfies a choice rule."""
+
+    if "And" in rule:
+        return all(_choose(r, data) for r in rule["And"])
+
+    if "Or" in rule:
+        return any(_choose(r, data) for r in rule["Or"])
+
+    if "Not" in rule:
+        return not _choose(rule["Not"], data)
+
+    variable = rule["Variable"]
+
+    if "IsPresent" in rule:
+        return _is_present(variable, data) == rule["IsPresent"]
+
+    if not _is_present(variable, data):
+        return False
+
+    value = _select(variable, data)
+
+    for key, expected in rule.items():
+
+        if key == "IsNull":
+            return (value is None) == expected
+
+        for type_name, types in _TYPES.items():
+
+            if key == f"Is{type_name}":
+
+                is_type = isinstance(value, types) and not (
+                    type_name == "Numeric" and isinstance(value, bool)
+                )
+
+                return is_type == expected
+
+            if not key.startswith(type_name):
+                continue
+
+            operator = key[len(type_name) :]
+
+            if operator.endswith("Path"):
+
+                operator = operator[: -len("Path")]
+
+                expected = _select(expected, data)
+
+            if operator in _COMPARISONS:
+
+                return isinstance(value, types) and _COMPARISONS[operator](
+                    value, expected
+                )
+
+            if operator == "Matches":
+
+                pattern = re.escape(expected).replace(r"\*", ".*")
+
+                return bool(re.fullmatch(pattern, value))
+
+    raise _StatesError("States.Runtime", f"unsupported choice rule {rule}")
+
+
+def _seconds_until(timestamp: str, now: float) -> float:
+
+    moment = datetime.datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+
+    return moment.timestamp() - now
+
+
+class Interpreter:
+    """
+    Execute a state machine definition, invoking local callables for its tasks.
+
+    Task states are bound to callables by their Resource or, for
+    arn:aws:states:::lambda:invoke, their FunctionName. Each callable is
+    called with the task's input and a lambda context.
+    """
+
+    def __init__(
+        self,
+        definition: Union[dict, str],
+        resources: Mapping[Any, Callable],
+        context=None,
+        clock: Optional[Union[RealClock, VirtualClock]] = None,
+        max_workers: Optional[int] = None,
+        s3_root: Optional[str] = None,
+    ):
+        """
+        Args:
+            definition: the definition, as a dict or json
+            resources: callables by Resource or FunctionName. Resources that
+                aren't strings, such as {"Fn::GetAtt": ...}, are keyed by
+                their json with sorted keys
+            context: the lambda context passed to each callable
+            clock: how to wait between retries and in wait states.
+                Default: a VirtualClock
+            max_workers: upper bound on the threads any one map or parallel
+                state uses
+            s3_root: a directory to stand in for s3, for distributed map states
+        """
+
+        self.definition = (
+            json.loads(definition)
+            if isinstance(definition, str)
+            else definition
+        )
+
+        self.resources = {self._key(k): v for k, v in resources.items()}
+
+        self.context = context if context is not None else generic_context
+
+        self.clock = clock if clock is not None else VirtualClock()
+
+        self.max_workers = max_workers
+
+        self.s3_root = s3_root
+
+        self.trace: List[StateTiming] = []
+
+    @classmethod
+    def from_composition(
+        cls,
+        composable: "Compose",
+        fuse: bool = False,
+        **kwargs,
+    ) -> "Interpreter":
+        """
+        Interpret composable's definition, as rendered by Compose.to_asl.
+
+        Args:
+            composable: the first step
+            fuse: as in Compose.definition
+            **kwargs: passed to Interpreter
+        """
+
+        from orkestra.asl import Placeholders
+
+        placeholders = Placeholders()
+
+        definition = composable.to_asl(fuse=fuse, function_arn=placeholders)
+
+        resources = {}
+
+        for name, function in placeholders.functions.items():
+
+            # a fused task is rendered with the first function of its chain
+
+            chain = function.fusible_chain() if fuse else [function]
+
+            resources["${%s}" % name] = (
+                _fused(chain) if len(chain) > 1 else function
+            )
+
+        return cls(definition, resources, **kwargs)
+
+    @staticmethod
+    def _key(resource) -> str:
+
+        if isinstance(resource, str):
+            return resource
+
+        return json.dumps(resource, sort_keys=True)
+
+    def run(self, input=None):
+        """
+        Execute the definition with input.
+
+        Returns: the output of the execution
+
+        Raises: ExecutionFailed if the execution fails
+        """
+
+        self.trace = []
+
+        with local_s3(self.s3_root):
+
+            try:
+
+                return self._run_graph(self.definition, input, ())
+
+            except _StatesError as e:
+
+                raise ExecutionFailed(e.error, e.cause) from e
+
+    def _run_graph(self, graph: dict, input, path: tuple):
+
+        states = graph["States"]
+
+        name = graph["StartAt"]
+
+        data = input
+
+        while True:
+
+            state = states[name]
+
+            next_name, data = self._run_state(name, state, data, path)
+
+            if next_name is None:
+                return data
+
+            name = next_name
+
+    def _run_state(self, name: str, state: dict, input, path: tuple):
+        """Run a state, returning the name of the next state and its input."""
+
+        started, wall_started = self.clock.now(), time.perf_counter()
+
+        attempts = 0
+
+        retries = [0] * len(state.get("Retry", ()))
+
+        while True:
+
+            attempts += 1
+
+            try:
+
+                output = self._execute(name, state, input, path)
+
+                break
+
+            except _StatesError as e:
+
+                if self._retry(state, e, retries):
+                    continue
+
+                self._record(
+                    path + (name,), state, started, wall_started, attempts
+                )
+
+                for catcher in state.get("Catch", ()):
+
+                    if _matches(e.error, catcher["ErrorEquals"]):
+
+                        return catcher["Next"], _assign(
+                            input,
+                            catcher.get("ResultPath", _MISSING),
+                            e.output,
+                        )
+
+                raise
+
+        self._record(path + (name,), state, started, wall_started, attempts)
+
+        if state["Type"] == "Choice":
+            return output
+
+        if state.get("End") or state["Type"] in ("Succeed", "Fail"):
+            return None, output
+
+        return state["Next"], output
+
+    def _retry(self, state: dict, error: _StatesError, retries: List[int]):
+        """Wait before retrying error if a retrier allows it."""
+
+        for i, retrier in enumerate(state.get("Retry", ())):
+
+            if not _matches(error.error, retrier["ErrorEquals"]):
+                continue
+
+            if retries[i] >= retrier.get("MaxAttempts", 3):
+                return False
+
+            interval = retrier.get("IntervalSeconds", 1) * (
+                retrier.get("BackoffRate", 2.0) ** retries[i]
+            )
+
+            if "MaxDelaySeconds" in retrier:
+                interval = min(interval, retrier["MaxDelaySeconds"])
+
+            retries[i] += 1
+
+            self.clock.sleep(interval)
+
+            return True
+
+        return False
+
+    def _record(self, path, state, started, wall_started, attempts):
+
+        self.trace.append(
+            StateTiming(
+                path=path,
+                type=state["Type"],
+                started=started,
+                duration=self.clock.now() - started,
+                wall_duration=time.perf_counter() - wall_started,
+                attempts=attempts,
+            )
+        )
+
+    def _execute(self, name: str, state: dict, input, path: tuple):
+        """Apply a state's input and output processing around its work."""
+
+        state_type = state["Type"]
+
+        if state_type == "Fail":
+
+            raise _StatesError(
+                state.get("Error", "States.Fail"), state.get("Cause", "")
+            )
+
+        data = _select(state.get("InputPath", "$"), input)
+
+        if state_type == "Choice":
+
+            output = _select(state.get("OutputPath", "$"), data)
+
+            for rule in state.get("Choices", ()):
+
+                if _choose(rule, data):
+                    return rule["Next"], output
+
+            if "Default" not in state:
+
+                raise _StatesError(
+                    "States.NoChoiceMatched", f"no choice matched in {name}"
+                )
+
+            return state["Default"], output
+
+        if state_type in ("Succeed", "Wait"):
+
+            if state_type == "Wait":
+                self._wait(state, data)
+
+            return _select(state.get("OutputPath", "$"), data)
+
+        if state_type in ("Task", "Pass", "Parallel") and (
+            "Parameters" in state
+        ):
+
+            data = _render(state["Parameters"], data)
+
+        if state_type == "Task":
+
+            result = self._invoke(state, data)
+
+        elif state_type == "Pass":
+
+            result = state.get("Result", data)
+
+        elif state_type == "Parallel":
+
+            result = self._parallel(name, state, data, path)
+
+        elif state_type == "Map":
+
+            result = self._map(name, state, data, path)
+
+        else:
+
+            raise _StatesError(
+                "States.Runtime", f"unsupported state type {state_type}"
+            )
+
+        if "ResultSelector" in state:
+
+            result = _render(state["ResultSelector"], result)
+
+        output = _assign(input, state.get("ResultPath", _MISSING), result)
+
+        return _select(state.get("OutputPath", "$"), output)
+
+    def _invoke(self, state: dict, input):
+
+        resource = state["Resource"]
+
+        integration = isinstance(resource, str) and resource.startswith(
+            _LAMBDA_INVOKE
+        )
+
+        if integration:
+
+            resource, input = input["FunctionName"], input.get("Payload")
+
+        try:
+
+            function = self.resources[self._key(resource)]
+
+        except KeyError:
+
+            raise _StatesError(
+                "States.Runtime", f"no callable bound to {resource}"
+            )
+
+        try:
+
+            result = function(input, self.context)
+
+        except Exception as e:
+
+            error = _error_output(e)
+
+            raise _StatesError(error["Error"], error["Cause"]) from e
+
+        # the result must survive being passed between states as json
+
+        result = json.loads(json.dumps(result))
+
+        if integration:
+
+            return {
+                "ExecutedVersion": "$LATEST",
+                "Payload": result,
+                "StatusCode": 200,
+            }
+
+        return result
+
+    def _wait(self, state: dict, input):
+
+        if "Seconds" in state:
+
+            seconds = state["Seconds"]
+
+        elif "SecondsPath" in state:
+
+            seconds = _select(state["SecondsPath"], input)
+
+        else:
+
+            timestamp = state.get("Timestamp") or _select(
+                state["TimestampPath"], input
+            )
+
+            seconds = _seconds_until(timestamp, self.clock.now())
+
+        self.clock.sleep(seconds)
+
+    def _workers(self, tasks: int, max_concurrency: Optional[int]) -> int:
+
+        limits = [max(tasks, 1)]
+
+        if self.max_workers:
+            limits.append(self.max_workers)
+
+        # zero means unlimited to step functions
+
+        if max_concurrency:
+            limits.append(int(max_concurrency))
+
+        return min(limits)
+
+    def _run_all(self, runs: List[Callable], max_concurrency=None) -> list:
+        """Run each of runs on a bounded pool, returning results in order."""
+
+        if not runs:
+            return []
+
+        with ThreadPoolExecutor(
+            self._workers(len(runs), max_concurrency)
+        ) as pool:
+
+            futures = [pool.submit(run) for run in runs]
+
+            return [f.result() for f in futures]
+
+    def _parallel(self, name: str, state: dict, input, path: tuple) -> list:
+
+        return self._run_all(
+            [
+                (
+                    lambda branch=branch, i=i: self._run_graph(
+                        branch, input, path + (name, i)
+                    )
+                )
+                for i, branch in enumerate(state["Branches"])
+            ]
+        )
+
+    def _map(self, name: str, state: dict, input, path: tuple):
+
+        processor = state.get("ItemProcessor") or state["Iterator"]
+
+        reader = state.get("ItemReader")
+
+        if reader is not None:
+
+            parameters = _render(reader.get("Parameters", {}), input)
+
+            items = list(
+                load_items(
+                    S3Location(parameters["Bucket"], parameters["Key"]),
+                    _READER_FORMATS[
+                        reader.get("ReaderConfig", {}).get("InputType", "JSON")
+                    ],
+                )
+            )
+
+        else:
+
+            items = _select(state.get("ItemsPath", "$"), input)
+
+        selector = state.get("ItemSelector", state.get("Parameters"))
+
+        items = [
+            (
+                _render(
+                    selector,
+                    input,
+                    {"Map": {"Item": {"Index": i, "Value": item}}},
+                )
+                if selector is not None
+                else item
+            )
+            for i, item in enumerate(items)
+        ]
+
+        batcher = state.get("ItemBatcher")
+
+        if batcher is not None:
+
+            size = batcher["MaxItemsPerBatch"]
+
+            items = [
+                {
+                    "BatchInput": batcher.get("BatchInput", {}),
+                    "Items": items[i : i + size],
+                }
+                for i in range(0, len(items), size)
+            ]
+
+        results = self._run_all(
+            [
+                (
+                    lambda item=item, i=i: in_map_item(
+                        i, self._run_graph, processor, item, path + (name, i)
+                    )
+                )
+                for i, item in enumerate(items)
+            ],
+            state.get("MaxConcurrency"),
+        )
+
+        writer = state.get("ResultWriter")
+
+        if writer is None:
+            return results
+
+        parameters = writer["Parameters"]
+
+        location = S3Location(parameters["Bucket"], parameters["Prefix"]).join(
+            str(uuid.uuid4()), "results.jsonl"
+        )
+
+        location.put(dump_items(results))
+
+        return {
+            "ResultWriterDetails": {
+                "Bucket": location.bucket,
+                "Key": location.key,
+            }
+        }
+
+
+def _fused(chain: List["Compose"]) -> Callable:
+    """Run a fused chain the way its lambda does, each step in turn."""
+
+    def run(event, context):
+
+        for composable in chain:
+            event = composable(event, context)
+
+        return event
+
+    return run
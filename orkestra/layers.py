@@ -0,0 +1,242 @@
+"""
+Install the requirements a stack's functions have in common in one layer.
+
+Each function's bundle then only installs the requirements particular to
+its entry, so bundles are smaller and the common ones are published once.
+"""
+
+import hashlib
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+from typing import *
+
+from orkestra.graph import Graph
+from orkestra.interfaces import PythonLayerVersion
+from orkestra.utils import _coalesce, _stack_state
+
+REQUIREMENTS_FILE = "requirements.txt"
+
+# not part of the function, or regenerated by bundling
+
+_IGNORED = shutil.ignore_patterns(
+    "__pycache__", "*.pyc", ".git", ".venv", "node_modules", "cdk.out"
+)
+
+
+@dataclass
+class SharedDependencies:
+    """
+    A layer of the requirements common to a stack's entry directories.
+
+    Args:
+        requirements: the common requirements, installed in the layer
+        layer: the layer's cdk construct
+        entries: the generated directory standing in for each entry
+            directory, whose requirements.txt only lists its own requirements
+    """
+
+    requirements: List[str]
+    layer: "aws_cdk.aws_lambda_python.PythonLayerVersion"
+    entries: Dict[str, str]
+
+
+def read_requirements(entry: Union[str, Path]) -> List[str]:
+    """The requirements in entry's requirements.txt, without comments."""
+
+    path = Path(entry, REQUIREMENTS_FILE)
+
+    if not path.exists():
+        return []
+
+    requirements = []
+
+    for line in path.read_text().splitlines():
+
+        line = line.split(" #", 1)[0].strip()
+
+        if line and not line.startswith("#"):
+
+            requirements.append(line)
+
+    return requirements
+
+
+def common_requirements(entries: Iterable[Union[str, Path]]) -> List[str]:
+    """
+    The requirements listed in every one of entries' requirements files.
+
+    Requirements are compared as written, so differently pinned versions
+    of a package aren't common to both.
+    """
+
+    first, *rest = [read_requirements(e) for e in entries] or [[]]
+
+    return [r for r in first if all(r in other for other in rest)]
+
+
+def _functions(composables: Iterable["Compose"]) -> List["Compose"]:
+    """The functions rendered by composables and everything downstream of them."""
+
+    functions = []
+
+    for root in composables:
+
+        for node in Graph(root):
+
+            if isinstance(node.func, (list, tuple)):
+
+                functions.extend(node.func)
+
+            else:
+
+                functions.append(node)
+
+    return functions
+
+
+def _ignoring(*directories: Union[str, Path]) -> Callable:
+    """
+    Ignore what _IGNORED does, and directories themselves, when copying.
+
+    An app's output directory needn't be called cdk.out, and may be inside
+    an entry directory, as may the directory the entries are generated in.
+    """
+
+    excluded = {Path(d).resolve() for d in directories}
+
+    def ignore(root: str, names: List[str]) -> Set[str]:
+
+        return {
+            *_IGNORED(root, names),
+            *(n for n in names if Path(root, n).resolve() in excluded),
+        }
+
+    return ignore
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()[:16]
+
+
+def share_dependencies(
+    scope,
+    *composables: "Compose",
+    directory: Optional[Union[str, Path]] = None,
+) -> Optional[SharedDependencies]:
+    """
+    Move the requirements common to composables' entries into a layer.
+
+    Call this before rendering any of the functions, i.e. before any
+    state_machine, schedule, or aws_lambda call in the stack. Functions
+    rendered afterwards get the layer, and an entry whose requirements.txt
+    only lists their own requirements.
+
+    Args:
+        scope: cdk construct; dependencies are shared across its stack
+        composables: the first steps of the stack's compositions
+        directory: where to generate the layer and entries. Default: under the app's cdk.out
+
+    Returns: the shared dependencies, or None if there are none to share
+
+    """
+
+    from aws_cdk import core as cdk
+
+    stack = cdk.Stack.of(scope)
+
+    state = _stack_state(stack, "shared_dependencies")
+
+    if state:
+
+        raise ValueError(f"dependencies are already shared in {stack}")
+
+    functions = _functions(composables)
+
+    rendered = _stack_state(stack, "lambda_functions")
+
+    for function in functions:
+
+        if any(key[0] is function for key in rendered):
+
+            raise ValueError(
+                f"{function} was rendered before its dependencies were shared"
+            )
+
+    entries = sorted(
+        {
+            f.aws_lambda_constructor_kwargs["entry"]
+            for f in functions
+            if read_requirements(f.aws_lambda_constructor_kwargs["entry"])
+        }
+    )
+
+    requirements = common_requirements(entries)
+
+    if len(entries) < 2 or not requirements:
+        return None
+
+    outdir = cdk.Stage.of(scope).asset_outdir
+
+    directory = Path(directory or Path(outdir, "orkestra"))
+
+    ignore = _ignoring(outdir, directory)
+
+    layer_entry = directory / f"layer-{_digest(*requirements)}"
+
+    layer_entry.mkdir(parents=True, exist_ok=True)
+
+    (layer_entry / REQUIREMENTS_FILE).write_text("\n".join(requirements))
+
+    runtimes = {}
+
+    for function in functions:
+
+        runtime = _coalesce(
+            function._aws_lambda_defaults,
+            function.aws_lambda_constructor_kwargs,
+        )["runtime"]
+
+        runtimes.setdefault(runtime.name, runtime)
+
+    layer = PythonLayerVersion(
+        entry=str(layer_entry),
+        description="dependencies shared by the stack's functions",
+    ).cdk_construct(
+        stack,
+        "orkestra_shared_dependencies",
+        compatible_runtimes=list(runtimes.values()),
+    )
+
+    generated = {}
+
+    for entry in entries:
+
+        extras = [r for r in read_requirements(entry) if r not in requirements]
+
+        target = (
+            directory
+            / f"{Path(entry).resolve().name}-{_digest(entry, *extras)}"
+        )
+
+        shutil.rmtree(target, ignore_errors=True)
+
+        shutil.copytree(entry, target, ignore=ignore)
+
+        (target / REQUIREMENTS_FILE).write_text("\n".join(extras))
+
+        generated[entry] = str(target)
+
+    state["shared"] = SharedDependencies(
+        requirements=requirements,
+        layer=layer,
+        entries=generated,
+    )
+
+    return state["shared"]
+
+
+def shared_dependencies(scope) -> Optional[SharedDependencies]:
+    """The dependencies shared in scope's stack, if any."""
+
+    return _stack_state(scope, "shared_dependencies").get("shared")
@@ -0,0 +1,498 @@
+"""
+Run compositions in-process, without deploying them to step functions.
+"""
+
+import asyncio
+import functools
+import importlib
+import itertools
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from logging import getLogger
+from typing import *
+
+from orkestra.decorators import (
+    _BATCH_KEY,
+    _ITEMS_KEY,
+    _event_loop,
+    _importable,
+    _is_item_location,
+    _unwrap,
+)
+from orkestra.exceptions import CompositionError
+from orkestra.metrics import in_map_item, map_item_index
+from orkestra.storage import (
+    S3Location,
+    dump_items,
+    load_items,
+    local_s3,
+)
+from orkestra.utils import _error_output, generic_context
+
+logger = getLogger(__name__)
+
+MAP_BACKENDS = ("thread", "process")
+
+# how many items a distributed map job reads from s3 at a time
+
+_DISTRIBUTED_WINDOW = 10_000
+
+
+@dataclass(frozen=True)
+class _StepReference:
+    """Picklable stand-in for a step, resolved by import in worker processes."""
+
+    module: str
+    name: str
+
+    def resolve(self):
+        return getattr(importlib.import_module(self.module), self.name)
+
+
+def _step_reference(step) -> Optional[_StepReference]:
+    """
+    Return a reference to step if a worker process can import it.
+
+    Steps defined in a function body, or otherwise not reachable as an
+    attribute of their module, can't be sent to a worker process.
+    """
+
+    if not _importable(step):
+        return None
+
+    return _StepReference(
+        module=step.func.__module__, name=step.func.__qualname__
+    )
+
+
+def _run_stages(stages, context, event):
+    """Run an item through each of a chain of map jobs."""
+
+    for stage in stages:
+        try:
+            event = stage(event, context)
+        except Exception as e:
+            if not stage.capture_map_errors:
+                raise
+            event = _error_output(e)
+
+    return event
+
+
+def _run_referenced_stages(references, context, event):
+    return _run_stages([r.resolve() for r in references], context, event)
+
+
+def _coroutine_function(step) -> Optional[Callable]:
+    """
+    Return a coroutine function running step, if it can be awaited directly.
+
+    Steps that need more than their input decoded and output encoded, e.g.
+    to batch or record metrics, are called as usual, on a thread.
+    """
+
+    if (
+        getattr(step, "is_async", False)
+        and not step.enable_powertools
+        and not step.batch_size
+        and step.item_source != "auto"
+        and not step.metrics
+        and not step.profile_sample_rate
+    ):
+
+        return step._invoke_async
+
+
+class LocalExecutor:
+    """
+    Walk a composition the way Compose.definition does and run each step locally.
+
+    Parallel branches and map items are run concurrently on a thread pool,
+    or awaited concurrently on an event loop when they are all async.
+    Map items can instead be sent to a process pool for CPU-bound work.
+    JSONPath fields such as input_path or items_path are not applied.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        context=None,
+        map_backend: str = "thread",
+        chunksize: Optional[int] = None,
+        s3_root: Optional[str] = None,
+    ):
+        """
+        Args:
+            max_workers: upper bound on threads or processes used by any one parallel or map step
+            context: the lambda context passed to each function
+            map_backend: "thread" or "process"; how to run map jobs
+            chunksize: how many map items to send to a worker process at once. Default: a few chunks per worker
+            s3_root: a directory to stand in for s3, laid out as <s3_root>/<bucket>/<key>
+        """
+
+        if map_backend not in MAP_BACKENDS:
+
+            raise ValueError(
+                f"map_backend must be one of {MAP_BACKENDS}, not {map_backend!r}"
+            )
+
+        self.max_workers = max_workers
+        self.context = context if context is not None else generic_context
+        self.map_backend = map_backend
+        self.chunksize = chunksize
+        self.s3_root = s3_root
+
+    def run(self, composable: "Compose", event):
+        """
+        Run composable and everything downstream of it.
+
+        Args:
+            composable: the first step
+            event: its input
+
+        Returns: the output of the last step
+
+        """
+
+        with local_s3(self.s3_root):
+
+            return self._run(composable, event)
+
+    def _run(self, composable: "Compose", event):
+
+        visited = set()
+
+        output = event
+
+        step = composable
+
+        while step is not None:
+
+            # map jobs that share a map state are run item by item
+
+            chain = step.fusible_maps() if step.is_map_job else [step]
+
+            for s in chain:
+
+                if s in visited:
+
+                    raise CompositionError(
+                        f"Failed to compose {s}. Composition using >> must be acyclic."
+                    )
+
+                visited.add(s)
+
+            step = chain[-1]
+
+            if len(step.downstream) > 1:
+
+                raise CompositionError(
+                    f"{step} has more than one downstream step. "
+                    f"Group them in a list or tuple to run them in parallel."
+                )
+
+            if len(chain) > 1:
+
+                output = self._map(chain, _unwrap(output))
+
+            else:
+
+                output = self.run_step(step, output)
+
+            step = step.downstream[0] if step.downstream else None
+
+        return output
+
+    def run_step(self, composable: "Compose", event):
+        """Run a single step, without following its downstream."""
+
+        if composable.is_map_job:
+
+            return self.run_map(composable, event)
+
+        elif isinstance(composable.func, (list, tuple)):
+
+            return self.run_parallel(composable, event)
+
+        else:
+
+            return composable(event, self.context)
+
+    def run_map(self, composable: "Compose", items: Union[list, dict]):
+        """
+        Run composable once per item, like a map state.
+
+        Batched map jobs are split, run once per batch, and flattened, the
+        same way their state machine invokes them. Distributed map jobs
+        stream their items from s3, or its local stand-in.
+        """
+
+        items = _unwrap(items)
+
+        if composable.is_distributed:
+
+            return self._run_distributed(composable, items)
+
+        return self._run_inline(composable, items)
+
+    def _run_distributed(
+        self, composable: "Compose", event: Union[list, dict]
+    ):
+
+        if composable.item_source == "auto":
+
+            event = composable(
+                {_ITEMS_KEY: "stage", "items": event}, self.context
+            )
+
+            if not _is_item_location(event):
+
+                return self._run_inline(composable, event)
+
+        items = load_items(
+            S3Location(bucket=event["bucket"], key=event["key"]),
+            composable.item_format,
+        )
+
+        # read a window of items at a time, keeping whole batches together
+
+        window = composable.batch_size or 1
+
+        window *= max(1, _DISTRIBUTED_WINDOW // window)
+
+        outputs = []
+
+        while True:
+
+            chunk = list(itertools.islice(items, window))
+
+            if not chunk:
+                break
+
+            outputs.extend(self._run_inline(composable, chunk))
+
+        if composable.result_location is None:
+
+            return outputs
+
+        results = S3Location.from_uri(composable.result_location).join(
+            str(uuid.uuid4()),
+            "results.jsonl",
+        )
+
+        results.put(dump_items(outputs))
+
+        return {
+            "ResultWriterDetails": {
+                "Bucket": results.bucket,
+                "Key": results.key,
+            }
+        }
+
+    def _run_inline(self, composable: "Compose", items: list) -> list:
+
+        if composable.batch_size:
+
+            batches = composable(
+                {_BATCH_KEY: "split", "items": items},
+                self.context,
+            )
+
+            return composable(
+                {
+                    _BATCH_KEY: "flatten",
+                    "items": self._map([composable], batches),
+                },
+                self.context,
+            )
+
+        return self._map([composable], items)
+
+    def _map(self, stages: List["Compose"], items: list) -> list:
+        """Run each item through each stage, like one map state's iterator."""
+
+        max_concurrency = min(
+            (
+                s.map_job_kwargs["max_concurrency"]
+                for s in stages
+                if s.map_job_kwargs.get("max_concurrency")
+            ),
+            default=None,
+        )
+
+        if self.map_backend == "process":
+
+            references = [_step_reference(s) for s in stages]
+
+            if all(references):
+
+                return self._run_in_processes(
+                    references,
+                    items,
+                    self._workers(len(items), max_concurrency, os.cpu_count()),
+                )
+
+            logger.warning(
+                f"{stages[0]} can't be imported by a worker process; "
+                f"running its map job on threads instead"
+            )
+
+        workers = self._workers(len(items), max_concurrency)
+
+        if len(stages) > 1:
+
+            pipeline = functools.partial(_run_stages, stages)
+
+            return self._run_concurrently(
+                itertools.repeat(
+                    lambda event, context: pipeline(context, event),
+                    len(items),
+                ),
+                items,
+                workers,
+                capture_errors=False,
+                indexed=True,
+            )
+
+        [composable] = stages
+
+        return self._run_concurrently(
+            itertools.repeat(composable, len(items)),
+            items,
+            workers,
+            capture_errors=composable.capture_map_errors,
+            indexed=True,
+        )
+
+    def run_parallel(self, composable: "Compose", event) -> list:
+        """
+        Run each branch with the same input, like a parallel state.
+
+        Errors in tuple branches are returned as the branch's output
+        rather than raised.
+        """
+
+        branches = composable.func
+
+        return self._run_concurrently(
+            branches,
+            itertools.repeat(event, len(branches)),
+            self._workers(len(branches)),
+            capture_errors=isinstance(branches, tuple),
+        )
+
+    def _run_concurrently(
+        self,
+        steps: Iterable["Compose"],
+        events: Iterable,
+        workers: int,
+        capture_errors: bool,
+        indexed: bool = False,
+    ) -> list:
+        """
+        Run each step on its event, returning outputs in order.
+
+        If indexed, each is run as the map item at its position, so that its
+        metrics are recorded with that index.
+        """
+
+        steps, events = list(steps), list(events)
+
+        coroutine_functions = [_coroutine_function(s) for s in steps]
+
+        if coroutine_functions and all(coroutine_functions):
+
+            return _event_loop().run_until_complete(
+                self._gather(
+                    coroutine_functions,
+                    events,
+                    workers,
+                    capture_errors,
+                    indexed,
+                )
+            )
+
+        def run(index, step, event):
+            try:
+                if indexed:
+                    return in_map_item(index, step, event, self.context)
+                return step(event, self.context)
+            except Exception as e:
+                if capture_errors:
+                    return _error_output(e)
+                raise
+
+        with ThreadPoolExecutor(workers) as pool:
+
+            return list(pool.map(run, itertools.count(), steps, events))
+
+    def _run_in_processes(
+        self,
+        references: List[_StepReference],
+        items: list,
+        workers: int,
+    ) -> list:
+        """Run each item through the referenced steps in a process pool, returning outputs in order."""
+
+        chunksize = self.chunksize or max(1, len(items) // (workers * 4))
+
+        run = functools.partial(
+            _run_referenced_stages,
+            references,
+            self.context,
+        )
+
+        with ProcessPoolExecutor(workers) as pool:
+
+            return list(pool.map(run, items, chunksize=chunksize))
+
+    async def _gather(
+        self,
+        coroutine_functions: List[Callable],
+        events: list,
+        workers: int,
+        capture_errors: bool,
+        indexed: bool = False,
+    ) -> list:
+
+        semaphore = asyncio.Semaphore(workers)
+
+        async def run(index, coroutine_function, event):
+            async with semaphore:
+                try:
+                    if indexed:
+                        # each task runs in a copy of the context
+                        map_item_index.set(index)
+                    return await coroutine_function(event, self.context)
+                except Exception as e:
+                    if capture_errors:
+                        return _error_output(e)
+                    raise
+
+        return await asyncio.gather(
+            *map(run, itertools.count(), coroutine_functions, events)
+        )
+
+    def _workers(
+        self,
+        tasks: int,
+        max_concurrency: Optional[int] = None,
+        default: Optional[int] = None,
+    ) -> int:
+
+        limits = [max(tasks, 1)]
+
+        # same default as ThreadPoolExecutor
+
+        default = default or min(32, (os.cpu_count() or 1) + 4)
+
+        limits.append(self.max_workers or default)
+
+        # zero means unlimited to step functions
+
+        if max_concurrency:
+            limits.append(int(max_concurrency))
+
+        return min(limits)
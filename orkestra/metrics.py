@@ -0,0 +1,359 @@
+"""
+Per-step latency and payload metrics, without powertools.
+
+Composed functions with metrics=True record, on each invocation,
+
+* Duration: milliseconds spent in the function
+* EventBytes and ResponseBytes: the size of the input and output json
+* ColdStart: 1 on the container's first invocation, 0 after
+* Errors: 1 if the function raised, 0 otherwise
+
+with the dimensions Dag (the function the composition starts with) and Step.
+In map jobs, the item's MapItemIndex is a property of the record, searchable
+in CloudWatch logs, rather than a dimension, which would make a metric of
+every item. Records are written once per invocation, in
+CloudWatch Embedded Metric Format, so CloudWatch turns the log lines into
+metrics without any calls to its api.
+
+In a lambda, they're printed to stdout. Elsewhere, they're kept in memory,
+
+    from orkestra import metrics
+
+    double.run_local([1, 2, 3])
+
+    metrics.sink().values("Duration", Step="double")
+"""
+
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import *
+
+NAMESPACE_ENV = "ORKESTRA_METRICS_NAMESPACE"
+
+DEFAULT_NAMESPACE = "Orkestra"
+
+UNITS = {
+    "Duration": "Milliseconds",
+    "EventBytes": "Bytes",
+    "ResponseBytes": "Bytes",
+    "ColdStart": "Count",
+    "Errors": "Count",
+}
+
+# CloudWatch accepts at most 100 values per metric in a single document
+_MAX_VALUES = 100
+
+_DEFINITIONS = {
+    name: {"Name": name, "Unit": unit} for name, unit in UNITS.items()
+}
+
+_encoder = json.JSONEncoder(default=str)
+
+map_item_index: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar(
+    "map_item_index", default=None
+)
+
+_pending = threading.local()
+
+_cold_start = True
+
+_cold_start_lock = threading.Lock()
+
+_sink = None
+
+
+class MemorySink:
+    """Keeps the documents written to it, for tests to inspect."""
+
+    def __init__(self):
+
+        self.documents: List[dict] = []
+
+        self._lock = threading.Lock()
+
+    def write(self, documents: List[dict]):
+
+        with self._lock:
+            self.documents.extend(documents)
+
+    def clear(self):
+
+        with self._lock:
+            self.documents.clear()
+
+    def values(self, metric: str, **dimensions) -> list:
+        """
+        Return the values recorded for metric, in the order they were written.
+
+        Args:
+            metric: e.g. "Duration"
+            **dimensions: only include documents with these dimensions, e.g. Step="double"
+
+        Returns: a list of values
+
+        """
+
+        values = []
+
+        with self._lock:
+            documents = list(self.documents)
+
+        for document in documents:
+
+            if metric not in document:
+                continue
+
+            if any(document.get(k) != v for k, v in dimensions.items()):
+                continue
+
+            value = document[metric]
+
+            values.extend(value if isinstance(value, list) else [value])
+
+        return values
+
+
+class StdoutSink:
+    """Prints each document as a line of json, for CloudWatch logs to pick up."""
+
+    def write(self, documents: List[dict]):
+
+        sys.stdout.write(
+            "".join(
+                json.dumps(d, separators=(",", ":")) + "\n" for d in documents
+            )
+        )
+
+        sys.stdout.flush()
+
+
+def sink() -> Union[MemorySink, StdoutSink]:
+    """The sink metrics are written to: stdout in a lambda, memory elsewhere."""
+
+    global _sink
+
+    if _sink is None:
+
+        _sink = (
+            StdoutSink()
+            if "AWS_LAMBDA_FUNCTION_NAME" in os.environ
+            else MemorySink()
+        )
+
+    return _sink
+
+
+def set_sink(new_sink):
+    """Write metrics to new_sink, anything with a write(documents) method."""
+
+    global _sink
+
+    _sink = new_sink
+
+
+def _size(value) -> int:
+
+    try:
+        return len(_encoder.encode(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _name(composable) -> str:
+    return getattr(composable.func, "__name__", None) or repr(composable)
+
+
+def dag_name(composable) -> str:
+    """The name of the function the composition containing composable starts with."""
+
+    seen = set()
+
+    while composable.upstream and id(composable) not in seen:
+
+        seen.add(id(composable))
+
+        composable = composable.upstream[0]
+
+    return _name(composable)
+
+
+def _is_cold_start() -> bool:
+
+    global _cold_start
+
+    with _cold_start_lock:
+
+        cold, _cold_start = _cold_start, False
+
+    return cold
+
+
+def measure(composable, call: Callable, event, context):
+    """
+    Call call(event, context) on behalf of composable, recording its metrics.
+
+    Records made while call runs, e.g. by the steps fused after composable,
+    are written along with composable's own, once call returns.
+    """
+
+    outermost = getattr(_pending, "records", None) is None
+
+    if outermost:
+        _pending.records = []
+
+    record = {
+        "Dag": dag_name(composable),
+        "Step": _name(composable),
+        "MapItemIndex": map_item_index.get(),
+        "ColdStart": int(_is_cold_start()),
+        "EventBytes": _size(event),
+    }
+
+    start = time.perf_counter()
+
+    try:
+
+        output = call(event, context)
+
+        record.update(Errors=0, ResponseBytes=_size(output))
+
+        return output
+
+    except Exception:
+
+        record["Errors"] = 1
+
+        raise
+
+    finally:
+
+        record["Duration"] = (time.perf_counter() - start) * 1e3
+
+        _pending.records.append(record)
+
+        if outermost:
+
+            records, _pending.records = _pending.records, None
+
+            sink().write(emf(records))
+
+
+def emf(records: List[dict], timestamp: Optional[float] = None) -> List[dict]:
+    """
+    Return records as Embedded Metric Format documents.
+
+    Records with the same dimensions share a document, with a list of
+    values for each metric.
+
+    Args:
+        records: dicts of dimensions and metric values
+        timestamp: seconds since the epoch. Default: now
+
+    Returns: a list of documents
+
+    """
+
+    timestamp = int((time.time() if timestamp is None else timestamp) * 1e3)
+
+    namespace = os.environ.get(NAMESPACE_ENV, DEFAULT_NAMESPACE)
+
+    if len(records) == 1:
+
+        # the usual case, one step invoked once
+
+        [record] = records
+
+        return [
+            _document(
+                namespace,
+                timestamp,
+                record,
+                {m: record[m] for m in UNITS if m in record},
+            )
+        ]
+
+    grouped = defaultdict(lambda: defaultdict(list))
+
+    for record in records:
+
+        dimensions = (record["Dag"], record["Step"], record["MapItemIndex"])
+
+        for metric in UNITS:
+
+            if metric in record:
+                grouped[dimensions][metric].append(record[metric])
+
+    documents = []
+
+    for (dag, step, index), metrics in grouped.items():
+
+        dimensions = {"Dag": dag, "Step": step, "MapItemIndex": index}
+
+        for offset in range(0, max(map(len, metrics.values())), _MAX_VALUES):
+
+            chunk = {
+                metric: values[offset : offset + _MAX_VALUES]
+                for metric, values in metrics.items()
+                if values[offset : offset + _MAX_VALUES]
+            }
+
+            documents.append(
+                _document(
+                    namespace,
+                    timestamp,
+                    dimensions,
+                    {
+                        metric: values[0] if len(values) == 1 else values
+                        for metric, values in chunk.items()
+                    },
+                )
+            )
+
+    return documents
+
+
+def _document(
+    namespace: str, timestamp: int, dimensions: dict, values: dict
+) -> dict:
+
+    index = dimensions["MapItemIndex"]
+
+    document = {
+        "_aws": {
+            "Timestamp": timestamp,
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": namespace,
+                    "Dimensions": [["Dag", "Step"]],
+                    "Metrics": [_DEFINITIONS[metric] for metric in values],
+                }
+            ],
+        },
+        "Dag": dimensions["Dag"],
+        "Step": dimensions["Step"],
+    }
+
+    # a property, not a dimension
+
+    if index is not None:
+        document["MapItemIndex"] = index
+
+    document.update(values)
+
+    return document
+
+
+def in_map_item(index: int, call: Callable, *args, **kwargs):
+    """Call call(*args, **kwargs), recording metrics as those of map item index."""
+
+    token = map_item_index.set(index)
+
+    try:
+        return call(*args, **kwargs)
+    finally:
+        map_item_index.reset(token)
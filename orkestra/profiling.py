@@ -0,0 +1,197 @@
+"""
+Profile a sample of a composed function's invocations.
+
+A sampled invocation runs under a statistical profiler, which records the
+calling thread's stack every few milliseconds, and under tracemalloc. Two
+reports are then written to the function's profile_location, under
+<step>/<request id>/,
+
+* stacks.txt: collapsed stacks, one "outer;inner;innermost count" per line,
+  as read by flamegraph.pl, speedscope and the like
+* allocations.txt: the lines that allocated the most memory still held when
+  the function returned, and the peak traced memory
+
+Invocations that aren't sampled only pay for a call to random.random().
+"""
+
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from logging import getLogger
+from typing import *
+
+from orkestra.storage import S3Location
+
+logger = getLogger(__name__)
+
+SAMPLE_INTERVAL = 0.005
+
+TOP_ALLOCATIONS = 25
+
+
+def _label(frame) -> str:
+
+    code = frame.f_code
+
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Count the stacks a thread is seen in, sampled every interval seconds."""
+
+    def __init__(
+        self,
+        thread_id: Optional[int] = None,
+        interval: float = SAMPLE_INTERVAL,
+    ):
+
+        self.thread_id = (
+            threading.get_ident() if thread_id is None else thread_id
+        )
+
+        self.interval = interval
+
+        self.stacks = Counter()
+
+        self._stop = threading.Event()
+
+        self._thread = threading.Thread(
+            target=self._run, name="orkestra-profiler", daemon=True
+        )
+
+    def _run(self):
+
+        while not self._stop.wait(self.interval):
+
+            frame = sys._current_frames().get(self.thread_id)
+
+            labels = []
+
+            while frame is not None:
+
+                labels.append(_label(frame))
+
+                frame = frame.f_back
+
+            if labels:
+                self.stacks[";".join(reversed(labels))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+
+        self._stop.set()
+
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        """The stacks in collapsed format, most frequent first."""
+
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+
+@dataclass
+class Allocations:
+    statistics: List[tracemalloc.Statistic]
+    peak: int
+
+    def report(self) -> str:
+
+        lines = [f"peak traced memory: {self.peak / 2 ** 20:.2f} MiB", ""]
+
+        lines.extend(map(str, self.statistics))
+
+        return "\n".join(lines) + "\n"
+
+
+def _allocations(top: int = TOP_ALLOCATIONS) -> Allocations:
+
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ]
+    )
+
+    _, peak = tracemalloc.get_traced_memory()
+
+    return Allocations(
+        statistics=snapshot.statistics("lineno")[:top],
+        peak=peak,
+    )
+
+
+def _name(composable) -> str:
+    return getattr(composable.func, "__name__", None) or repr(composable)
+
+
+def report_location(composable, context) -> S3Location:
+    """Where the reports for an invocation of composable are written."""
+
+    request_id = getattr(context, "aws_request_id", None) or str(uuid.uuid4())
+
+    return S3Location.from_uri(composable.profile_location).join(
+        _name(composable),
+        request_id,
+    )
+
+
+def profile(composable, call: Callable, event, context):
+    """
+    Call call(event, context) under the profiler and tracemalloc.
+
+    The reports are written to composable.profile_location whether or not
+    call raises. Failing to write them is logged rather than raised.
+    """
+
+    tracing = tracemalloc.is_tracing()
+
+    if not tracing:
+        tracemalloc.start()
+
+    sampler = StackSampler()
+
+    sampler.start()
+
+    start = time.perf_counter()
+
+    try:
+
+        return call(event, context)
+
+    finally:
+
+        duration = time.perf_counter() - start
+
+        sampler.stop()
+
+        allocations = _allocations()
+
+        if not tracing:
+            tracemalloc.stop()
+
+        location = report_location(composable, context)
+
+        try:
+
+            location.join("stacks.txt").put(sampler.collapsed().encode())
+
+            location.join("allocations.txt").put(
+                (
+                    f"duration: {duration * 1e3:.1f} ms\n"
+                    + allocations.report()
+                ).encode()
+            )
+
+        except Exception:
+
+            logger.warning(
+                f"couldn't write profile to {location.uri}", exc_info=True
+            )
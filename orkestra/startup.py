@@ -0,0 +1,184 @@
+"""
+Report the import cost of modules, as paid during a lambda's INIT phase.
+
+    python -m orkestra.startup orkestra examples.hello_orkestra
+"""
+
+import functools
+import re
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import *
+
+DEFAULT_MODULES = (
+    "orkestra",
+    "orkestra.decorators",
+    "aws_lambda_powertools",
+    "aws_lambda_powertools.utilities.parser",
+)
+
+_IMPORTTIME_LINE = re.compile(
+    r"^import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \|"
+    r"(?P<indent>\s+)(?P<module>\S+)$"
+)
+
+
+@dataclass
+class ImportCost:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+@dataclass
+class ModuleReport:
+    module: str
+    costs: List[ImportCost]
+    error: Optional[str] = None
+
+    @property
+    def total_us(self) -> int:
+        """Cumulative import time of the module and its parent packages."""
+
+        parts = self.module.split(".")
+
+        packages = {".".join(parts[:i]) for i in range(1, len(parts) + 1)}
+
+        return sum(
+            c.cumulative_us
+            for c in self.costs
+            if c.depth == 0 and c.module in packages
+        )
+
+
+def _importtime(python: str, source: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [python, "-X", "importtime", "-c", source],
+        capture_output=True,
+        text=True,
+    )
+
+
+@functools.lru_cache()
+def _interpreter_modules(python: str) -> FrozenSet[str]:
+    """Modules imported by the interpreter before any user code runs."""
+
+    stderr = _importtime(python, "pass").stderr
+
+    return frozenset(
+        match["module"]
+        for match in map(_IMPORTTIME_LINE.match, stderr.splitlines())
+        if match is not None
+    )
+
+
+def import_costs(
+    module: str,
+    python: str = sys.executable,
+) -> ModuleReport:
+    """
+    Import module in a fresh interpreter and return the cost of every module it pulled in.
+
+    Modules the interpreter imports on its own at startup are left out.
+
+    Args:
+        module: dotted module name
+        python: the interpreter to measure with
+
+    Returns: ModuleReport, with error set if the import failed
+
+    """
+
+    process = _importtime(python, f"import {module}")
+
+    interpreter_modules = _interpreter_modules(python)
+
+    costs = []
+
+    errors = []
+
+    for line in process.stderr.splitlines():
+
+        match = _IMPORTTIME_LINE.match(line)
+
+        if match is None:
+
+            if not line.startswith("import time:"):
+                errors.append(line)
+
+            continue
+
+        if match["module"] in interpreter_modules:
+            continue
+
+        costs.append(
+            ImportCost(
+                module=match["module"],
+                self_us=int(match["self"]),
+                cumulative_us=int(match["cumulative"]),
+                depth=(len(match["indent"]) - 1) // 2,
+            )
+        )
+
+    error = "\n".join(errors) if process.returncode else None
+
+    return ModuleReport(module=module, costs=costs, error=error)
+
+
+def report(
+    modules: Iterable[str] = DEFAULT_MODULES,
+    top: int = 10,
+    python: str = sys.executable,
+) -> str:
+    """
+    Return a table of the import cost of each module and its heaviest dependencies.
+
+    Args:
+        modules: dotted module names, each measured in a fresh interpreter
+        top: how many of the most expensive transitive imports to list
+        python: the interpreter to measure with
+
+    Returns: the report as a string
+
+    """
+
+    lines = []
+
+    for module_report in (import_costs(m, python=python) for m in modules):
+
+        if module_report.error is not None:
+
+            lines.append(f"{module_report.module}: failed to import")
+
+            lines.append("")
+
+            continue
+
+        lines.append(
+            f"{module_report.module}: "
+            f"{module_report.total_us / 1000:.1f} ms"
+        )
+
+        heaviest = sorted(
+            module_report.costs,
+            key=lambda c: c.self_us,
+            reverse=True,
+        )[:top]
+
+        for cost in heaviest:
+
+            lines.append(
+                f"  {cost.self_us / 1000:8.1f} ms self "
+                f"{cost.cumulative_us / 1000:8.1f} ms cumulative  "
+                f"{cost.module}"
+            )
+
+        lines.append("")
+
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(report(sys.argv[1:] or DEFAULT_MODULES))
@@ -0,0 +1,224 @@
+"""
+Read and write objects in s3, or in a local directory standing in for it.
+
+When the ORKESTRA_LOCAL_S3 environment variable is set to a directory,
+s3://bucket/key is read from and written to <directory>/bucket/key instead.
+"""
+
+import csv
+import functools
+import io
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import *
+
+LOCAL_S3_ENV = "ORKESTRA_LOCAL_S3"
+
+ITEM_FORMATS = ("jsonl", "csv", "json")
+
+POINTER_KEY = "__orkestra_pointer__"
+
+
+@functools.lru_cache()
+def _s3_client():
+    import boto3
+
+    return boto3.client("s3")
+
+
+@contextmanager
+def local_s3(directory: Optional[Union[str, Path]]):
+    """Stand directory in for s3 while the context is active."""
+
+    if directory is None:
+        yield
+        return
+
+    previous = os.environ.get(LOCAL_S3_ENV)
+
+    os.environ[LOCAL_S3_ENV] = str(directory)
+
+    try:
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop(LOCAL_S3_ENV, None)
+        else:
+            os.environ[LOCAL_S3_ENV] = previous
+
+
+@dataclass(frozen=True)
+class S3Location:
+    bucket: str
+    key: str = ""
+
+    @classmethod
+    def from_uri(cls, uri: str) -> "S3Location":
+        """Parse s3://bucket/key."""
+
+        if not uri.startswith("s3://"):
+
+            raise ValueError(f"{uri!r} is not an s3:// uri")
+
+        bucket, _, key = uri[len("s3://") :].partition("/")
+
+        return cls(bucket=bucket, key=key)
+
+    @property
+    def uri(self) -> str:
+        return f"s3://{self.bucket}/{self.key}"
+
+    def join(self, *parts: str) -> "S3Location":
+        """Return the location of a key under this one."""
+
+        key = "/".join(p.strip("/") for p in (self.key, *parts) if p)
+
+        return S3Location(bucket=self.bucket, key=key)
+
+    @property
+    def _local_path(self) -> Optional[Path]:
+
+        root = os.environ.get(LOCAL_S3_ENV)
+
+        return Path(root, self.bucket, self.key) if root else None
+
+    def put(self, body: bytes):
+
+        path = self._local_path
+
+        if path is not None:
+
+            path.parent.mkdir(parents=True, exist_ok=True)
+
+            path.write_bytes(body)
+
+        else:
+
+            _s3_client().put_object(
+                Bucket=self.bucket, Key=self.key, Body=body
+            )
+
+    def get(self) -> bytes:
+
+        path = self._local_path
+
+        if path is not None:
+
+            return path.read_bytes()
+
+        response = _s3_client().get_object(Bucket=self.bucket, Key=self.key)
+
+        return response["Body"].read()
+
+    def lines(self) -> Iterator[str]:
+        """Stream the object's lines without reading it all into memory."""
+
+        path = self._local_path
+
+        if path is not None:
+
+            with path.open() as f:
+                yield from (line.rstrip("\n") for line in f)
+
+            return
+
+        response = _s3_client().get_object(Bucket=self.bucket, Key=self.key)
+
+        for line in response["Body"].iter_lines():
+            yield line.decode()
+
+
+def dump_items(items: Sequence, item_format: str = "jsonl") -> bytes:
+    """Serialize items the way a map state's item reader expects them."""
+
+    if item_format == "jsonl":
+
+        return "".join(json.dumps(item) + "\n" for item in items).encode()
+
+    elif item_format == "csv":
+
+        buffer = io.StringIO()
+
+        fieldnames = list(items[0]) if items else []
+
+        writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+
+        writer.writeheader()
+
+        writer.writerows(items)
+
+        return buffer.getvalue().encode()
+
+    elif item_format == "json":
+
+        return json.dumps(list(items)).encode()
+
+    raise ValueError(f"item_format must be one of {ITEM_FORMATS}")
+
+
+def load_items(location: S3Location, item_format: str = "jsonl") -> Iterator:
+    """Stream the items stored at location."""
+
+    if item_format == "jsonl":
+
+        return (json.loads(line) for line in location.lines() if line)
+
+    elif item_format == "csv":
+
+        # like the item reader, the first row is the header
+        # and each item is a mapping of strings
+
+        return iter(csv.DictReader(location.lines()))
+
+    elif item_format == "json":
+
+        return iter(json.loads(location.get()))
+
+    raise ValueError(f"item_format must be one of {ITEM_FORMATS}")
+
+
+def offload(value, location: S3Location, threshold: int):
+    """
+    Write value under location if its json is larger than threshold bytes.
+
+    Returns value, or a pointer to the object it was written to.
+    """
+
+    body = json.dumps(value).encode()
+
+    if len(body) <= threshold:
+
+        return value
+
+    pointer = location.join(f"{uuid.uuid4()}.json")
+
+    pointer.put(body)
+
+    return {POINTER_KEY: pointer.uri}
+
+
+def is_pointer(value) -> bool:
+    return isinstance(value, dict) and POINTER_KEY in value
+
+
+def resolve(value):
+    """
+    Replace a pointer, or pointers in a list, with the values they point to.
+
+    Lists are the outputs of parallel and map states, any of whose
+    branches or items may have been offloaded.
+    """
+
+    if is_pointer(value):
+
+        return json.loads(S3Location.from_uri(value[POINTER_KEY]).get())
+
+    if isinstance(value, list) and any(map(is_pointer, value)):
+
+        return [resolve(v) if is_pointer(v) else v for v in value]
+
+    return value
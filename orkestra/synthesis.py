@@ -0,0 +1,246 @@
+"""
+Synthesize independent stacks in parallel, in a pool of processes.
+
+Each stack is constructed in an app of its own, in a worker with its own
+jsii runtime, and the cloud assemblies they're synthesized to are merged
+into one. Stacks are synthesized the same way, and merged in the same
+order, whatever the number of workers, so the assembly doesn't depend on it.
+
+    from orkestra.synthesis import StackSpec, synth_in_parallel
+
+    synth_in_parallel(
+        [
+            StackSpec("helloOrkestra", HelloOrkestra),
+            StackSpec("map", MapJob, {"env": env}),
+        ]
+    )
+
+Stacks can't refer to each other, since they're in different apps.
+"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import *
+
+# the assembly's own files, merged rather than copied
+
+_MANIFEST = "manifest.json"
+
+_TREE = "tree.json"
+
+_VERSION = "cdk.out"
+
+
+@dataclass(frozen=True)
+class StackSpec:
+    """
+    A stack to synthesize, constructed as factory(app, id, **kwargs).
+
+    Args:
+        id: the stack's construct id
+        factory: e.g. a Stack subclass. It's sent to a worker, so it must be
+            importable, as must kwargs be picklable
+        kwargs: passed to factory
+    """
+
+    id: str
+    factory: Callable[..., "aws_cdk.core.Stack"]
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+
+
+def _synth(spec: StackSpec, outdir: str, context: dict) -> str:
+    """Synthesize spec, in an app of its own, to outdir."""
+
+    from aws_cdk import core as cdk
+
+    app = cdk.App(outdir=outdir, context=context)
+
+    spec.factory(app, spec.id, **spec.kwargs)
+
+    app.synth()
+
+    return outdir
+
+
+def _merge_manifests(manifests: List[dict]) -> dict:
+
+    merged = {**manifests[0], "artifacts": {}}
+
+    missing = []
+
+    for manifest in manifests:
+
+        for id, artifact in manifest.get("artifacts", {}).items():
+
+            if id in merged["artifacts"] and artifact["type"] != "cdk:tree":
+                raise ValueError(f"more than one stack synthesized {id}")
+
+            merged["artifacts"].setdefault(id, artifact)
+
+        for entry in manifest.get("missing", []):
+
+            if entry not in missing:
+                missing.append(entry)
+
+    if missing:
+        merged["missing"] = sorted(missing, key=lambda entry: entry["key"])
+
+    return merged
+
+
+def _merge_trees(trees: List[dict]) -> dict:
+
+    merged = {**trees[0], "tree": {**trees[0]["tree"], "children": {}}}
+
+    for tree in trees:
+        merged["tree"]["children"].update(tree["tree"].get("children", {}))
+
+    return merged
+
+
+def merge_assemblies(assemblies: Sequence[Union[str, Path]], outdir):
+    """
+    Move the cloud assemblies in assemblies into one, in outdir.
+
+    Artifacts are listed in the order of assemblies. Assets are named for
+    their contents, so those synthesized by more than one app are kept once.
+
+    Args:
+        assemblies: directories apps were synthesized to
+        outdir: where to put the merged assembly
+    """
+
+    outdir = Path(outdir)
+
+    outdir.mkdir(parents=True, exist_ok=True)
+
+    manifests, trees = [], []
+
+    for assembly in map(Path, assemblies):
+
+        manifests.append(json.loads((assembly / _MANIFEST).read_text()))
+
+        if (assembly / _TREE).exists():
+            trees.append(json.loads((assembly / _TREE).read_text()))
+
+        for path in sorted(assembly.iterdir()):
+
+            if path.name in (_MANIFEST, _TREE, _VERSION):
+                continue
+
+            destination = outdir / path.name
+
+            if path.is_dir() and destination.is_dir():
+
+                # the same asset, already staged by an earlier app
+
+                continue
+
+            if destination.is_dir():
+                shutil.rmtree(destination)
+
+            os.replace(path, destination)
+
+    (outdir / _MANIFEST).write_text(
+        json.dumps(_merge_manifests(manifests), indent=2)
+    )
+
+    if trees:
+        (outdir / _TREE).write_text(json.dumps(_merge_trees(trees), indent=2))
+
+    shutil.copyfile(Path(assemblies[0], _VERSION), outdir / _VERSION)
+
+
+def synth_in_parallel(
+    stacks: Sequence[StackSpec],
+    outdir: Optional[Union[str, Path]] = None,
+    workers: Optional[int] = None,
+    context: Optional[dict] = None,
+) -> Path:
+    """
+    Synthesize each of stacks in a pool of processes, to one cloud assembly.
+
+    Args:
+        stacks: the stacks to synthesize
+        outdir: where to put the assembly. Default: $CDK_OUTDIR, as set by
+            the cdk cli, or cdk.out
+        workers: how many processes to synthesize in. Default: one per cpu.
+            With one, stacks are synthesized in this process
+        context: cdk context for every app, along with $CDK_CONTEXT_JSON.
+            Stack traces are left out of the assembly's metadata unless it
+            sets aws:cdk:disable-stack-trace, since they differ by process
+
+    Returns: outdir
+
+    """
+
+    ids = [spec.id for spec in stacks]
+
+    if not ids:
+        raise ValueError("there are no stacks to synthesize")
+
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"stack ids must be unique, not {ids}")
+
+    workers = workers or os.cpu_count() or 1
+
+    if workers < 1:
+        raise ValueError(f"workers must be at least 1, not {workers}")
+
+    outdir = Path(outdir or os.environ.get("CDK_OUTDIR") or "cdk.out")
+
+    outdir.parent.mkdir(parents=True, exist_ok=True)
+
+    # a jsii runtime only reads $CDK_CONTEXT_JSON when it starts, which for
+    # this process may have been before it was set, so it's passed explicitly
+
+    context = {
+        "aws:cdk:disable-stack-trace": True,
+        **json.loads(os.environ.get("CDK_CONTEXT_JSON") or "{}"),
+        **(context or {}),
+    }
+
+    staging = Path(
+        tempfile.mkdtemp(prefix=f".{outdir.name}-", dir=outdir.parent)
+    )
+
+    try:
+
+        outdirs = [str(staging / str(i)) for i in range(len(stacks))]
+
+        if workers == 1:
+
+            for spec, assembly in zip(stacks, outdirs):
+                _synth(spec, assembly, context)
+
+        else:
+
+            # forking a process that's already started a jsii runtime would
+            # share the runtime's pipes with the child
+
+            with ProcessPoolExecutor(
+                max_workers=min(workers, len(stacks)),
+                mp_context=multiprocessing.get_context("spawn"),
+            ) as pool:
+
+                futures = [
+                    pool.submit(_synth, spec, assembly, context)
+                    for spec, assembly in zip(stacks, outdirs)
+                ]
+
+                for future in futures:
+                    future.result()
+
+        merge_assemblies(outdirs, outdir)
+
+    finally:
+
+        shutil.rmtree(staging, ignore_errors=True)
+
+    return outdir
@@ -1,3 +1,6 @@
+import json
+import traceback
+import weakref
 from dataclasses import dataclass
 
 from orkestra.interfaces import Nextable
@@ -34,6 +37,23 @@ def coerce(obj: Nextable) -> Nextable:
     return obj
 
 
+# what's been rendered in each stack, released along with the stack
+
+_stack_states: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def _stack_state(scope, name: str) -> dict:
+    """
+    Return the dict kept under name for scope's stack, e.g. of constructs to reuse.
+    """
+
+    from aws_cdk import core as cdk
+
+    state = _stack_states.setdefault(cdk.Stack.of(scope), {})
+
+    return state.setdefault(name, {})
+
+
 def _cdk_patch(kwargs: dict):
     """
     Replace interface elements in kwargs with their cdk counterpart.
@@ -71,4 +91,22 @@ def _coalesce(*dictionaries: dict, **kwargs):
     return result
 
 
+def _error_output(error: BaseException) -> dict:
+    """
+    Return the output a step functions catch would forward for error.
+
+    The Cause mirrors the payload lambda reports for unhandled exceptions.
+    """
+
+    error_type = type(error).__name__
+
+    cause = {
+        "errorMessage": str(error),
+        "errorType": error_type,
+        "stackTrace": traceback.format_tb(error.__traceback__),
+    }
+
+    return {"Error": error_type, "Cause": json.dumps(cause)}
+
+
 generic_context = GenericLambdaContext()
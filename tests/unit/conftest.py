@@ -11,6 +11,12 @@ def disable_powertools(monkeypatch):
     monkeypatch.setenv("POWERTOOLS_LOG_DEDUPLICATION_DISABLED", "1")
 
 
+@pytest.fixture(autouse=True)
+def asset_cache(monkeypatch, tmp_path):
+    # keep the bundles a test's synth caches out of the home directory
+    monkeypatch.setenv("ORKESTRA_ASSET_CACHE", str(tmp_path / "assets"))
+
+
 @pytest.fixture
 def generic_event():
     return Item.random().dict()
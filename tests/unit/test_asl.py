@@ -0,0 +1,212 @@
+import json
+import subprocess
+import sys
+from typing import List
+
+import pytest
+from aws_cdk import aws_stepfunctions as sfn, core as cdk
+
+from examples.for_testing import (
+    auto_invert,
+    batched_double,
+    distributed_double,
+    invalid_composition,
+    large_output,
+    select_items,
+)
+from examples.map_job import ones_and_zeros
+from examples.orchestration import make_person, random_food
+from orkestra import compose, decorators
+from orkestra.asl import Placeholders
+from orkestra.exceptions import CompositionError
+from orkestra.interfaces import Duration, LambdaInvocationType
+
+
+@pytest.mark.parametrize("fuse", [False, True])
+@pytest.mark.parametrize(
+    "root",
+    [
+        ones_and_zeros,
+        random_food,
+        make_person,
+        batched_double,
+        distributed_double,
+        auto_invert,
+        large_output,
+        select_items,
+    ],
+    ids=lambda root: root.func.__name__,
+)
+def test_same_as_definition(root, fuse):
+    stack = cdk.Stack(cdk.App(), "asl")
+
+    definition = root.definition(stack, fuse=fuse)
+
+    expected = stack.resolve(
+        sfn.StateGraph(
+            getattr(definition, "start_state", definition), "graph"
+        ).to_graph_json()
+    )
+
+    assert expected == root.to_asl(
+        fuse=fuse,
+        function_arn=lambda c: stack.resolve(c._lambda_function.function_arn),
+    )
+
+
+def test_placeholders():
+    asl = ones_and_zeros.to_asl()
+
+    assert asl["StartAt"] == "ones_and_zeros"
+
+    assert asl["States"]["ones_and_zeros"] == {
+        "Type": "Task",
+        "Resource": "${ones_and_zeros}",
+        "Retry": [decorators._LAMBDA_SERVICE_RETRY],
+        "Next": "divide_by_filter_division_errors",
+    }
+
+    assert json.loads(json.dumps(asl)) == asl
+
+
+def test_placeholders_are_unique():
+    def first(event, context):
+        ...
+
+    def second(event, context):
+        ...
+
+    first.__name__ = second.__name__ = "handler"
+
+    a, b = compose(first), compose(second)
+
+    a >> b
+
+    placeholders = Placeholders()
+
+    asl = a.to_asl(function_arn=placeholders)
+
+    assert placeholders.functions == {"handler": a, "handler2": b}
+
+    assert [state["Resource"] for state in asl["States"].values()] == [
+        "${handler}",
+        "${handler2}",
+    ]
+
+
+def _state_names(graph: dict) -> List[str]:
+    names = []
+
+    for name, state in graph["States"].items():
+        names.append(name)
+
+        for nested in [*state.get("Branches", []), state.get("Iterator")]:
+            if nested is not None:
+                names.extend(_state_names(nested))
+
+    return names
+
+
+@pytest.mark.parametrize("fuse", [False, True])
+def test_state_names_match_definition(fuse):
+    def function():
+        def handler(event, context):
+            ...
+
+        # an entry directory cdk can find, for the function's lambda
+
+        handler.__module__ = "examples.for_testing"
+
+        return compose(handler)
+
+    a, b, c, d = (function() for _ in range(4))
+
+    a >> (b, c) >> d
+
+    stack = cdk.Stack(cdk.App(), "asl")
+
+    # lambdas rendered before the definition don't change its state names
+
+    d.aws_lambda(stack)
+
+    definition = a.definition(stack, fuse=fuse)
+
+    expected = stack.resolve(
+        sfn.StateGraph(definition.start_state, "graph").to_graph_json()
+    )
+
+    asl = a.to_asl(fuse=fuse)
+
+    assert _state_names(expected) == _state_names(asl)
+
+    assert _state_names(asl) == [
+        "handler",
+        "parallelize handlerhandler",
+        "handler2",
+        "handler2_failed",
+        "handler3",
+        "handler3_failed",
+        "handler4",
+    ]
+
+
+def test_lambda_invoke_kwargs():
+    @compose(
+        sfn_timeout=Duration.seconds(30),
+        heartbeat=Duration.seconds(10),
+        invocation_type=LambdaInvocationType.EVENT,
+        qualifier="live",
+        result_path="$.result",
+    )
+    def notify(event, context):
+        ...
+
+    assert notify.to_asl(payload_response_only=False)["States"]["notify"] == {
+        "Type": "Task",
+        "Resource": "arn:aws:states:::lambda:invoke",
+        "Parameters": {
+            "FunctionName": "${notify}",
+            "Payload.$": "$",
+            "InvocationType": "Event",
+            "Qualifier": "live",
+        },
+        "TimeoutSeconds": 30,
+        "HeartbeatSeconds": 10,
+        "ResultPath": "$.result",
+        "Retry": [decorators._LAMBDA_SERVICE_RETRY],
+        "End": True,
+    }
+
+
+def test_invalid_compositions():
+    with pytest.raises(CompositionError):
+        invalid_composition.to_asl()
+
+    @compose
+    def a(event, context):
+        ...
+
+    @compose
+    def b(event, context):
+        ...
+
+    @compose
+    def c(event, context):
+        ...
+
+    a >> b
+    a >> c
+
+    with pytest.raises(CompositionError):
+        a.to_asl()
+
+
+def test_does_not_import_cdk():
+    source = (
+        "import sys\n"
+        "from examples.map_job import ones_and_zeros\n"
+        "ones_and_zeros.to_asl()\n"
+        "assert not any(m.startswith('aws_cdk') for m in sys.modules)\n"
+    )
+
+    subprocess.run([sys.executable, "-c", source], check=True)
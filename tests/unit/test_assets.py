@@ -0,0 +1,111 @@
+import pytest
+
+from orkestra.assets import (
+    ASSET_CACHE_ENV,
+    AssetCache,
+    bundle_hash,
+    entry_hash,
+)
+
+
+@pytest.fixture
+def entry(tmp_path):
+    entry = tmp_path / "entry"
+    entry.mkdir()
+    (entry / "main.py").write_text("def handler(event, context): ...\n")
+    (entry / "requirements.txt").write_text("orkestra\n")
+    return entry
+
+
+def test_entry_hash_is_stable(entry, tmp_path):
+    copy = tmp_path / "copy"
+    copy.mkdir()
+    for path in entry.iterdir():
+        (copy / path.name).write_bytes(path.read_bytes())
+
+    assert entry_hash(entry) == entry_hash(str(entry)) == entry_hash(copy)
+
+
+def test_entry_hash_ignores_bytecode(entry):
+    before = entry_hash(entry)
+
+    (entry / "__pycache__").mkdir()
+    (entry / "__pycache__" / "main.cpython-38.pyc").write_bytes(b"\0")
+    (entry / "other.pyc").write_bytes(b"\0")
+
+    assert entry_hash(entry) == before
+
+
+@pytest.mark.parametrize("name", ["main.py", "requirements.txt"])
+def test_entry_hash_changes_with_contents(entry, name):
+    before = entry_hash(entry)
+
+    (entry / name).write_text((entry / name).read_text() + "# changed\n")
+
+    assert entry_hash(entry) != before
+
+
+def test_entry_hash_changes_with_new_files(entry):
+    before = entry_hash(entry)
+
+    (entry / "package").mkdir()
+    (entry / "package" / "module.py").write_text("")
+
+    assert entry_hash(entry) != before
+
+
+def test_bundle_hash_changes_with_runtime(entry):
+    from aws_cdk import aws_lambda
+
+    python38 = bundle_hash(entry, aws_lambda.Runtime.PYTHON_3_8)
+
+    assert python38 == bundle_hash(entry, aws_lambda.Runtime.PYTHON_3_8)
+    assert python38 != bundle_hash(entry, aws_lambda.Runtime.PYTHON_3_7)
+    assert python38 != entry_hash(entry)
+
+
+def test_bundle_hash_changes_with_dependencies(entry):
+    from aws_cdk import aws_lambda
+
+    before = bundle_hash(entry, aws_lambda.Runtime.PYTHON_3_8)
+
+    (entry / "requirements.txt").write_text("orkestra\npydantic\n")
+
+    assert bundle_hash(entry, aws_lambda.Runtime.PYTHON_3_8) != before
+
+
+def test_asset_cache_round_trip(tmp_path):
+    cache = AssetCache(tmp_path / "cache")
+
+    outdir = tmp_path / "cdk.out"
+    staged = outdir / "asset.1234"
+    staged.mkdir(parents=True)
+    (staged / "main.py").write_text("bundled")
+
+    assert not cache.restore("key", tmp_path / "next.out")
+
+    cache.save("key", staged, outdir)
+
+    assert cache.restore("key", tmp_path / "next.out")
+    assert (tmp_path / "next.out" / "asset.1234" / "main.py").read_text() == (
+        "bundled"
+    )
+
+
+def test_asset_cache_skips_unbundled_assets(tmp_path, entry):
+    cache = AssetCache(tmp_path / "cache")
+
+    # stacks that skip bundling are staged from their entry
+    cache.save("key", entry, tmp_path / "cdk.out")
+
+    assert not (tmp_path / "cache").exists()
+
+
+def test_asset_cache_is_opt_in(monkeypatch, tmp_path):
+    monkeypatch.delenv(ASSET_CACHE_ENV, raising=False)
+
+    assert AssetCache.from_environment() is None
+
+    monkeypatch.setenv(ASSET_CACHE_ENV, str(tmp_path))
+
+    assert AssetCache.from_environment().directory == tmp_path
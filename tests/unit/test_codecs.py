@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+from orkestra import compose
+from orkestra.codecs import CODEC_KEY, Codec, decode
+
+RECORDS = [
+    {"id": str(i), "name": "potato", "price": i / 3} for i in range(100)
+]
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "json",
+        "json+gzip",
+        "columnar+json+gzip",
+        "msgpack",
+        "msgpack+zstd",
+        "columnar+msgpack+zstd",
+    ],
+)
+def test_round_trip(name):
+    if "msgpack" in name:
+        pytest.importorskip("msgpack")
+
+    if "zstd" in name:
+        pytest.importorskip("zstandard")
+
+    codec = Codec.from_string(name)
+
+    assert codec.name == name
+
+    for value in (RECORDS, [1.5, 2.5], {"a": None}, "hello", None):
+        assert decode(codec.encode(value)) == value
+
+
+def test_columnar_compresses_records():
+    codec = Codec.from_string("columnar+json+gzip")
+
+    envelope = codec.encode(RECORDS)
+
+    assert len(json.dumps(envelope)) * 4 < len(json.dumps(RECORDS))
+
+
+def test_columnar_only_applies_to_records():
+    codec = Codec(columnar=True)
+
+    assert codec.encode(RECORDS)[CODEC_KEY] == "columnar+json"
+    assert codec.encode([{"a": 1}, {"b": 2}])[CODEC_KEY] == "json"
+    assert decode(codec.encode([{}])) == [{}]
+
+
+@pytest.mark.parametrize(
+    "name", ["msgpack+json", "gzip+zstd", "columnar+pickle", ""]
+)
+def test_invalid_codec(name):
+    with pytest.raises(ValueError):
+        Codec.from_string(name)
+
+
+def test_compose_encodes_and_decodes(generic_context):
+    @compose(codec="columnar+json+gzip")
+    def records(event, context):
+        return RECORDS[:event]
+
+    @compose
+    def names(event, context):
+        return [r["name"] for r in event]
+
+    records >> names
+
+    envelope = records(3, generic_context)
+
+    assert envelope[CODEC_KEY] == "columnar+json+gzip"
+    assert names(envelope, generic_context) == ["potato"] * 3
+    assert records.run_local(5) == ["potato"] * 5
+
+
+def test_encoded_map_outputs_are_decoded():
+    @compose(is_map_job=True, codec="json+gzip")
+    def square(n, context):
+        return n * n
+
+    @compose
+    def total(event, context):
+        return sum(event)
+
+    @compose
+    def numbers(event, context):
+        return list(range(event))
+
+    numbers >> square >> total
+
+    assert numbers.run_local(4) == 0 + 1 + 4 + 9
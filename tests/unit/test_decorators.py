@@ -1,6 +1,11 @@
+import asyncio
+from typing import List
+
 import pytest
 
+from orkestra import decorators
 from orkestra.decorators import compose, powertools
+from orkestra.storage import local_s3
 
 
 def test_call_list_raises_error(generic_event, generic_context):
@@ -25,3 +30,347 @@ def test_powertools_decorator_order():
         @compose
         def f(event, context):
             ...
+
+
+def test_handler_compiled_once(monkeypatch, generic_event, generic_context):
+    wrapped = []
+
+    def fake_powertools(decorated=None, **kwargs):
+        wrapped.append(decorated)
+        return decorated
+
+    monkeypatch.setattr(decorators, "powertools", fake_powertools)
+
+    @compose(enable_powertools=True)
+    def f(event, context):
+        return event
+
+    for _ in range(3):
+        assert f(generic_event, generic_context) == generic_event
+
+    assert wrapped == [f.func]
+
+    assert f.handler is f.handler
+
+
+def test_async_handler_reuses_event_loop(generic_event, generic_context):
+    @compose
+    async def f(event, context):
+        await asyncio.sleep(0)
+        return asyncio.get_running_loop()
+
+    assert f.is_async
+
+    first, second = (f(generic_event, generic_context) for _ in range(2))
+
+    assert first is second
+    assert not first.is_running()
+
+
+def test_async_handler_with_powertools(generic_event, generic_context):
+    @compose(enable_powertools=True)
+    async def f(event, context):
+        await asyncio.sleep(0)
+        return event
+
+    @compose
+    @powertools
+    async def g(event, context):
+        return event
+
+    assert f(generic_event, generic_context) == generic_event
+    assert g(generic_event, generic_context) == generic_event
+
+
+def test_batched_map_job_protocol(generic_context):
+    @compose(is_map_job=True, batch_size=2)
+    def double(n, context):
+        return n * 2
+
+    batches = double(
+        {"__orkestra_batch__": "split", "items": [1, 2, 3]},
+        generic_context,
+    )
+
+    assert [b["items"] for b in batches] == [[1, 2], [3]]
+
+    processed = [double(b, generic_context) for b in batches]
+
+    assert processed == [[2, 4], [6]]
+
+    assert (
+        double(
+            {"__orkestra_batch__": "flatten", "items": processed},
+            generic_context,
+        )
+        == [2, 4, 6]
+    )
+
+    assert double(2, generic_context) == 4
+
+
+def test_batch_size_validation():
+    with pytest.raises(ValueError):
+        compose(batch_size=2)
+
+    with pytest.raises(ValueError):
+        compose(is_map_job=True, batch_size=0)
+
+    with pytest.raises(ValueError):
+        compose(is_map_job=True, batch_size=2, result_path="$.result")
+
+
+def test_item_source_validation():
+    with pytest.raises(ValueError):
+        compose(is_map_job=True, item_source="dynamodb", items_location="x")
+
+    with pytest.raises(ValueError):
+        compose(item_source="s3", items_location="s3://bucket/items")
+
+    with pytest.raises(ValueError):
+        compose(is_map_job=True, item_source="s3")
+
+    with pytest.raises(ValueError):
+        compose(
+            is_map_job=True,
+            item_source="auto",
+            items_location="s3://bucket/items",
+            result_path="$.result",
+        )
+
+
+def test_offloaded_output_is_resolved(tmp_path, generic_context):
+    @compose(offload_location="s3://bucket/prefix", offload_threshold=10)
+    def echo(event, context):
+        return event
+
+    @compose
+    def count(event, context):
+        return [len(e) for e in event]
+
+    with local_s3(tmp_path):
+        assert echo("short", generic_context) == "short"
+
+        pointer = echo("a" * 100, generic_context)
+
+        assert list(pointer) == ["__orkestra_pointer__"]
+        assert pointer["__orkestra_pointer__"].startswith(
+            "s3://bucket/prefix/"
+        )
+
+        assert count([pointer, "b"], generic_context) == [100, 1]
+
+
+def test_offload_location_validation():
+    with pytest.raises(ValueError):
+        compose(offload_location="bucket/prefix")
+
+
+def test_model_parser_is_cached():
+    from examples.hello_orkestra import Item
+
+    assert decorators._model_parser(Item) is decorators._model_parser(Item)
+    assert decorators._model_parser(Item) is not decorators._model_parser(
+        Item, trusted=True
+    )
+
+
+def test_model_outputs_are_serialized(generic_event, generic_context):
+    from examples.hello_orkestra import Item
+
+    @compose(enable_powertools=True, model=Item)
+    def copy(item: Item, context):
+        return [item] * 2
+
+    assert copy(generic_event, generic_context) == [generic_event] * 2
+
+
+def test_trust_upstream(generic_context):
+    from pydantic import ValidationError
+
+    from examples.hello_orkestra import Item
+
+    @compose(enable_powertools=True, model=Item)
+    def first(item: Item, context) -> Item:
+        return item
+
+    @compose(enable_powertools=True, model=Item, trust_upstream=True)
+    def trusting(item: Item, context):
+        return item
+
+    @compose(enable_powertools=True, model=Item, trust_upstream=True)
+    def orphan(item: Item, context):
+        return item
+
+    first >> trusting
+
+    # not a valid Item, so only a trusting function accepts it
+
+    unvalidated = {"id": "1", "name": "hat", "price": "free"}
+
+    assert trusting(unvalidated, generic_context) == unvalidated
+
+    for untrusting in (first, orphan):
+        with pytest.raises(ValidationError):
+            untrusting(unvalidated, generic_context)
+
+
+def test_trust_upstream_return_annotation():
+    from examples.hello_orkestra import Item
+
+    @compose(enable_powertools=True, model=Item)
+    def unannotated(item: Item, context):
+        return item
+
+    @compose(enable_powertools=True, model=Item)
+    def many(item: Item, context) -> List[Item]:
+        return [item]
+
+    @compose(enable_powertools=True, model=Item, trust_upstream=True)
+    def trusting(item: Item, context):
+        return item
+
+    @compose(
+        enable_powertools=True,
+        model=Item,
+        trust_upstream=True,
+        is_map_job=True,
+    )
+    def mapped(item: Item, context):
+        return item
+
+    unannotated >> trusting
+
+    many >> mapped
+
+    assert not trusting._trusts_upstream
+    assert mapped._trusts_upstream
+
+
+def test_trust_upstream_needs_a_flat_model():
+    from pydantic import BaseModel, Field
+
+    from examples.hello_orkestra import Item
+
+    class Order(BaseModel):
+        item: Item
+
+    class Aliased(BaseModel):
+        name: str = Field(alias="Name")
+
+    for model in (Order, Aliased):
+        with pytest.raises(ValueError):
+            compose(model=model, trust_upstream=True)
+
+
+def test_upstream():
+    @compose
+    def a(event, context):
+        ...
+
+    @compose
+    def b(event, context):
+        ...
+
+    @compose
+    def c(event, context):
+        ...
+
+    parallel = a >> [b, c]
+
+    assert b.upstream == c.upstream == parallel.upstream == [a]
+
+
+def test_construct_ids_are_scope_local():
+    from aws_cdk import aws_stepfunctions as sfn, core as cdk
+
+    from examples.map_job import divide_by
+
+    def states():
+        stack = cdk.Stack(cdk.App(), "ids")
+
+        definition = divide_by.definition(stack)
+
+        graph = stack.resolve(
+            sfn.StateGraph(definition.start_state, "graph").to_graph_json()
+        )
+
+        return graph, [child.node.id for child in stack.node.children]
+
+    first = states()
+
+    assert states() == first
+
+    stack = cdk.Stack(cdk.App(), "ids")
+
+    assert decorators._incremental_id(stack, "sum_up") == "sum_up"
+
+    cdk.Construct(stack, "sum_up")
+    cdk.Construct(stack, "sum_up2")
+
+    assert decorators._incremental_id(stack, "sum_up") == "sum_up3"
+
+
+def test_fusible_chain():
+    from examples import orchestration
+
+    # noop is also downstream of two parallel steps, so it isn't fused
+
+    assert orchestration.make_person.fusible_chain() == [
+        orchestration.make_person,
+        orchestration.greet,
+    ]
+
+    assert orchestration.generate_ints.fusible_chain() == [
+        orchestration.generate_ints
+    ]
+
+    @compose
+    def local(event, context):
+        ...
+
+    assert local.fusible_chain() == [local]
+
+
+def test_fused_lambda_runs_chain(monkeypatch, generic_context):
+    from examples import orchestration
+
+    monkeypatch.setenv(
+        decorators._FUSED_STEPS_ENV,
+        "orchestration:make_person,orchestration:greet",
+    )
+
+    monkeypatch.setattr(orchestration.make_person, "_fused", None)
+
+    assert orchestration.make_person({}, generic_context).startswith("Hello")
+
+    # other handlers in the same lambda aren't affected
+
+    assert orchestration.noop({}, generic_context) == {}
+
+    monkeypatch.setattr(orchestration.make_person, "_fused", None)
+
+
+def test_fusible_maps():
+    from examples import map_job, orchestration
+
+    assert map_job.divide_by.fusible_maps() == [
+        map_job.divide_by,
+        map_job.filter_division_errors,
+    ]
+
+    # generate_floats sits between halve and double
+
+    assert orchestration.halve.fusible_maps() == [orchestration.halve]
+
+    @compose(is_map_job=True)
+    def first(n, context):
+        ...
+
+    @compose(is_map_job=True, items_path="$.items")
+    def second(n, context):
+        ...
+
+    first >> second
+
+    assert first.fusible_maps() == [first]
@@ -0,0 +1,96 @@
+import pytest
+
+from examples.for_testing import invalid_composition
+from orkestra import compose
+from orkestra.exceptions import CompositionError
+from orkestra.graph import Graph
+
+
+def make(name):
+    def func(event, context):
+        ...
+
+    func.__name__ = name
+
+    return compose(func)
+
+
+def test_topological_order():
+    a, b, c, d = map(make, "abcd")
+
+    # a diamond, which >> alone can't render, but the graph can represent
+
+    a.downstream.extend([b, c])
+    b >> d
+    c >> d
+
+    graph = Graph(a)
+
+    order = list(graph)
+
+    assert len(graph) == 4
+    assert order[0] is a and order[-1] is d
+    assert graph.upstream[d] == [b, c]
+    assert set(graph.edges) == {(a, b), (a, c), (b, d), (c, d)}
+
+
+def test_cycles():
+    with pytest.raises(CompositionError):
+        Graph(invalid_composition)
+
+    a, b, c = map(make, "abc")
+
+    a >> b >> c >> a
+
+    with pytest.raises(CompositionError):
+        Graph(a)
+
+
+def test_long_chains_are_not_recursive():
+    steps = [make(f"step{i}") for i in range(5000)]
+
+    for upstream, downstream in zip(steps, steps[1:]):
+        upstream >> downstream
+
+    assert list(Graph(steps[0])) == steps
+
+
+def test_parallel_branches_are_part_of_their_node():
+    a, b, c, d = map(make, "abcd")
+
+    parallel = a >> [b, c]
+
+    parallel >> d
+
+    assert list(Graph(a)) == [a, parallel, d]
+
+
+def test_composing_twice_adds_no_edges():
+    a, b, c, d = map(make, "abcd")
+
+    def dag():
+        return a >> [b, c] >> d
+
+    dag()
+    dag()
+
+    [parallel] = a.downstream
+
+    assert list(Graph(a)) == [a, parallel, d]
+    assert b.upstream == c.upstream == parallel.upstream == [a]
+    assert d.upstream == [parallel]
+
+    # a parallel step of other functions is another edge
+
+    assert a >> (b, c) is not parallel
+    assert len(a.downstream) == 2
+
+
+def test_definition_rejects_multiple_downstream():
+    a, b, c = map(make, "abc")
+
+    a >> b
+    a >> c
+
+    with pytest.raises(CompositionError):
+        a.definition(scope=None)
@@ -8,14 +8,22 @@ from aws_cdk import (
     aws_stepfunctions as sfn,
     aws_lambda,
     aws_stepfunctions_tasks as sfn_tasks,
+    aws_iam as iam,
 )
 from aws_cdk.cx_api import CloudAssembly
 
 from app import Stacks
+from examples.map_job import ones_and_zeros
+from examples.orchestration import make_person
 from examples.for_testing import (
     invalid_composition,
     hello_world,
     fetch_layer,
+    batched_double,
+    distributed_double,
+    auto_invert,
+    large_output,
+    offloaded_numbers,
 )
 from orkestra import interfaces
 from orkestra.exceptions import CompositionError
@@ -218,3 +226,221 @@ class TestApplication:
         stack_name = "LayerTestStack"
 
         StateMachineTest(app, stack_name)
+
+    @staticmethod
+    def test_batched_map_job(app):
+        stack = cdk.Stack(app, "batchedMapJob")
+
+        definition = batched_double.definition(stack)
+
+        graph = stack.resolve(
+            sfn.StateGraph(definition.start_state, "batched").to_graph_json()
+        )
+
+        split = graph["States"][graph["StartAt"]]
+
+        assert split["Parameters"] == {
+            "__orkestra_batch__": "split",
+            "items.$": "$.items",
+        }
+
+        map_state = graph["States"][split["Next"]]
+
+        assert map_state["Type"] == "Map"
+
+        flatten = graph["States"][map_state["Next"]]
+
+        assert flatten["Parameters"]["__orkestra_batch__"] == "flatten"
+
+    @staticmethod
+    def test_distributed_map_job(app):
+        stack = cdk.Stack(app, "distributedMapJob")
+
+        definition = distributed_double.definition(stack)
+
+        graph = stack.resolve(
+            sfn.StateGraph(
+                definition.start_state, "distributed"
+            ).to_graph_json()
+        )
+
+        map_state = graph["States"][graph["StartAt"]]
+
+        assert map_state["Type"] == "Map"
+        assert map_state["ItemProcessor"]["ProcessorConfig"]["Mode"] == (
+            "DISTRIBUTED"
+        )
+        assert map_state["ItemReader"]["Parameters"] == {
+            "Bucket.$": "$.bucket",
+            "Key.$": "$.key",
+        }
+        assert map_state["ResultWriter"]["Parameters"]["Prefix"] == "results"
+        assert map_state["MaxConcurrency"] == 1000
+
+    @staticmethod
+    def test_auto_map_job(app):
+        stack = cdk.Stack(app, "autoMapJob")
+
+        definition = auto_invert.definition(stack)
+
+        graph = stack.resolve(
+            sfn.StateGraph(definition.start_state, "auto").to_graph_json()
+        )
+
+        stage = graph["States"][graph["StartAt"]]
+
+        assert stage["Parameters"]["__orkestra_items__"] == "stage"
+
+        choice = graph["States"][stage["Next"]]
+
+        assert choice["Type"] == "Choice"
+
+        [rule] = choice["Choices"]
+
+        distributed = graph["States"][rule["Next"]]
+
+        assert distributed["ItemProcessor"]["ProcessorConfig"]["Mode"] == (
+            "DISTRIBUTED"
+        )
+        assert distributed["ItemBatcher"]["MaxItemsPerBatch"] == 2
+
+        inline = graph["States"][choice["Default"]]
+
+        assert inline["Parameters"]["__orkestra_batch__"] == "split"
+
+    @staticmethod
+    def test_offloading_grants(app):
+        stack = cdk.Stack(app, "offloading")
+
+        large_output.state_machine(stack)
+
+        statements = [
+            statement
+            for construct in stack.node.find_all()
+            if isinstance(construct, iam.CfnPolicy)
+            for statement in stack.resolve(construct.policy_document)[
+                "Statement"
+            ]
+        ]
+
+        s3_actions = [
+            statement["Action"]
+            for statement in statements
+            if any(a.startswith("s3:") for a in statement["Action"])
+        ]
+
+        # large_output writes and reads, output_size only reads
+
+        assert len(s3_actions) == 2
+        assert sum("s3:PutObject*" in a for a in s3_actions) == 1
+
+    @staticmethod
+    def test_map_over_offloaded_output(app):
+        with pytest.raises(CompositionError):
+            offloaded_numbers.definition(cdk.Stack(app, "mapOverOffloaded"))
+
+    @staticmethod
+    def test_fused_chain():
+        app = cdk.App()
+
+        stack = cdk.Stack(app, "fusedChain")
+
+        definition = make_person.definition(stack, fuse=True)
+
+        graph = stack.resolve(
+            sfn.StateGraph(definition.start_state, "fused").to_graph_json()
+        )
+
+        fused = graph["States"][graph["StartAt"]]
+
+        # make_person and greet share a lambda, followed by noop's
+
+        assert graph["StartAt"].startswith("make_person_greet")
+        assert len(graph["States"]) == 2
+        assert graph["States"][fused["Next"]]["End"]
+
+        template = app.synth().get_stack_by_name("fusedChain").template
+
+        [fused_function] = [
+            resource["Properties"]
+            for resource in template["Resources"].values()
+            if resource["Type"] == "AWS::Lambda::Function"
+            and "Environment" in resource["Properties"]
+        ]
+
+        assert fused_function["Environment"]["Variables"] == {
+            "ORKESTRA_FUSED_STEPS": (
+                "orchestration:make_person,orchestration:greet"
+            )
+        }
+        assert fused_function["Timeout"] == 6
+
+    @staticmethod
+    def test_fused_map_jobs(app):
+        stack = cdk.Stack(app, "fusedMaps")
+
+        definition = ones_and_zeros.definition(stack)
+
+        graph = stack.resolve(
+            sfn.StateGraph(definition.start_state, "maps").to_graph_json()
+        )
+
+        maps = [s for s in graph["States"].values() if s["Type"] == "Map"]
+
+        [fused] = maps
+
+        iterator = fused["Iterator"]
+
+        divide = iterator["States"][iterator["StartAt"]]
+
+        [catch] = divide["Catch"]
+
+        # a captured error is passed on to the next map job
+
+        assert iterator["States"][catch["Next"]]["Next"] == divide["Next"]
+        assert iterator["States"][divide["Next"]]["End"]
+
+    @staticmethod
+    def test_lambda_is_shared_within_stack(app):
+        stack = cdk.Stack(app, "sharedLambda")
+
+        lmb = hello_world.aws_lambda(stack)
+
+        hello_world.state_machine(stack)
+        hello_world.schedule(stack, expression="rate(1 hour)")
+
+        functions = [
+            c
+            for c in stack.node.find_all()
+            if isinstance(c, aws_lambda.CfnFunction)
+        ]
+
+        assert len(functions) == 1
+        assert hello_world.aws_lambda(stack) is lmb
+
+        # a different stack, function name, or id gets its own function
+
+        other = cdk.Stack(app, "otherSharedLambda")
+
+        assert hello_world.aws_lambda(other) is not lmb
+        assert hello_world.aws_lambda(stack, function_name="other") is not lmb
+        assert hello_world.aws_lambda(stack, "explicitId") is not lmb
+
+        # functions are kept with their stack, not on the composition
+
+        assert not any(
+            isinstance(v, cdk.Stack) for v in vars(hello_world).values()
+        )
+
+    @staticmethod
+    def test_lambdas_with_the_same_entry_share_an_asset(app):
+        stack = cdk.Stack(app, "sharedAsset")
+
+        staging = [
+            composable.aws_lambda(stack)
+            .node.find_child("Code")
+            .node.find_child("Stage")
+            for composable in (batched_double, distributed_double)
+        ]
+
+        assert len({s.asset_hash for s in staging}) == 1
@@ -0,0 +1,109 @@
+import json
+import os
+import subprocess
+import sys
+
+from aws_cdk import core as cdk
+
+from examples.for_testing import hello_world
+from examples.map_job import ones_and_zeros
+from orkestra import utils
+from orkestra.decorators import Compose
+from orkestra.instrumentation import SYNTH_TRACE_ENV, SynthTracer
+
+
+def test_synth_trace(tmp_path):
+    path = tmp_path / "trace.json"
+
+    app = cdk.App()
+
+    with SynthTracer(path) as tracer:
+        stack = cdk.Stack(app, "traced")
+        ones_and_zeros.state_machine(stack, "machine")
+        hello_world.task(stack)
+
+    # the originals are put back
+
+    assert "traced" not in Compose.definition.__qualname__
+    assert (
+        vars(Compose)["_render_lambda"].__func__.__name__ == "_render_lambda"
+    )
+    assert utils._coalesce.__module__ == "orkestra.utils"
+
+    stats = tracer.stats
+
+    assert stats["definition"].calls == 1
+    assert stats["_task"].calls > 1
+    assert stats["_render_lambda"].calls == 6
+    assert stats["cdk_construct"].calls == 1
+    assert stats["_coalesce"].calls > stats["_render_lambda"].calls
+
+    # the state machine itself isn't rendered by a traced function
+
+    created = tracer.stack_constructs["traced"]
+
+    assert list(tracer.stack_constructs) == ["traced"]
+    assert 0 < created < len(stack.node.find_all())
+    assert sum(tracer.dag_constructs.values()) == created
+    assert set(tracer.dag_constructs) == {"ones_and_zeros", "hello_world"}
+
+    trace = json.loads(path.read_text())
+
+    names = {event["name"] for event in trace["traceEvents"]}
+
+    assert names == {"definition", "_task", "_render_lambda", "cdk_construct"}
+
+    [definition] = [
+        e for e in trace["traceEvents"] if e["name"] == "definition"
+    ]
+
+    assert definition["args"]["dag"] == "ones_and_zeros"
+
+    # traced calls are drawn inside the outermost calls that made them
+
+    outermost = [e for e in trace["traceEvents"] if "dag" in e["args"]]
+
+    assert all(
+        any(
+            o["ts"] <= e["ts"] and e["ts"] + e["dur"] <= o["ts"] + o["dur"] + 1
+            for o in outermost
+        )
+        for e in trace["traceEvents"]
+    )
+
+    summary = tracer.summary().splitlines()
+
+    assert summary[0].split() == [
+        "function",
+        "calls",
+        "total",
+        "ms",
+        "self",
+        "ms",
+        "constructs",
+    ]
+    assert any(line.startswith("ones_and_zeros ") for line in summary)
+
+
+def test_synth_trace_from_environment(tmp_path):
+    path = tmp_path / "trace.json"
+
+    script = (
+        "from aws_cdk import core as cdk\n"
+        "from examples.map_job import ones_and_zeros\n"
+        "from orkestra.instrumentation import trace_from_environment\n"
+        "trace_from_environment()\n"
+        "stack = cdk.Stack(cdk.App(), 'traced')\n"
+        "ones_and_zeros.definition(stack)\n"
+    )
+
+    process = subprocess.run(
+        [sys.executable, "-c", script],
+        env={**os.environ, SYNTH_TRACE_ENV: str(path)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert "definition" in process.stderr
+    assert json.loads(path.read_text())["traceEvents"]
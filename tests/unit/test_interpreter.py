@@ -0,0 +1,242 @@
+import json
+import threading
+
+import pytest
+from aws_cdk import aws_stepfunctions as sfn, core as cdk
+
+from examples.for_testing import auto_invert, batched_double
+from examples.map_job import divide_by
+from examples.orchestration import make_person
+from orkestra import compose
+from orkestra.exceptions import ExecutionFailed
+from orkestra.graph import Graph
+from orkestra.interpreter import Interpreter, VirtualClock
+
+
+def task(resource="fn", **fields):
+    return {"Type": "Task", "Resource": resource, **fields}
+
+
+def machine(*states, **resources):
+    """A definition running states in order, the first named a, then b..."""
+
+    names = "abcdefgh"
+
+    definition = {"StartAt": "a", "States": {}}
+
+    for name, following, state in zip(names, names[1:], states):
+        definition["States"][name] = {**state, "Next": following}
+
+    del definition["States"][names[len(states) - 1]]["Next"]
+
+    if definition["States"][names[len(states) - 1]]["Type"] != "Fail":
+        definition["States"][names[len(states) - 1]]["End"] = True
+
+    return Interpreter(definition, resources)
+
+
+def flaky(failures):
+    calls = []
+
+    def fn(event, context):
+        calls.append(event)
+        if len(calls) <= failures:
+            raise ConnectionError("try again")
+        return len(calls)
+
+    return fn
+
+
+@pytest.mark.parametrize(
+    "composable, event",
+    [
+        (divide_by, [0, 1, 2, 4]),
+        (auto_invert, [0, 1, 2]),
+        (make_person, {}),
+    ],
+    ids=lambda c: getattr(getattr(c, "func", None), "__name__", ""),
+)
+@pytest.mark.parametrize("fuse", [False, True])
+def test_same_as_run_local(composable, event, fuse, tmp_path):
+    interpreter = Interpreter.from_composition(
+        composable, fuse=fuse, s3_root=tmp_path
+    )
+
+    output = interpreter.run(event)
+
+    expected = composable.run_local(event, s3_root=tmp_path)
+
+    if isinstance(output, list):
+        output = [o if not isinstance(o, dict) else o["Error"] for o in output]
+        expected = [
+            e if not isinstance(e, dict) else e["Error"] for e in expected
+        ]
+
+    assert output == expected
+
+
+def handler_in(module):
+    def handler(event, context):
+        return f"{module}:{event}" if event else module
+
+    handler.__module__ = module
+
+    return compose(handler)
+
+
+@pytest.mark.parametrize("fuse", [False, True])
+def test_functions_with_the_same_name(fuse):
+    a, b = handler_in("a"), handler_in("b")
+
+    a >> b
+
+    interpreter = Interpreter.from_composition(a, fuse=fuse)
+
+    assert interpreter.run({}) == a.run_local({}) == "b:a"
+
+
+def test_batches():
+    interpreter = Interpreter.from_composition(batched_double)
+
+    assert interpreter.run({"items": list(range(250))}) == [
+        n * 2 for n in range(250)
+    ]
+
+
+def test_retry_with_backoff():
+    clock = VirtualClock(start=0)
+
+    retry = {
+        "ErrorEquals": ["ConnectionError"],
+        "IntervalSeconds": 1,
+        "BackoffRate": 2,
+        "MaxAttempts": 3,
+    }
+
+    interpreter = machine(task(Retry=[retry]), fn=flaky(2))
+    interpreter.clock = clock
+
+    assert interpreter.run({}) == 3
+    assert clock.now() == 1 + 2
+
+    [timing] = interpreter.trace
+    assert timing.attempts == 3
+    assert timing.duration == 3
+
+    interpreter = machine(task(Retry=[retry]), fn=flaky(4))
+
+    with pytest.raises(ExecutionFailed) as e:
+        interpreter.run({})
+
+    assert e.value.error == "ConnectionError"
+
+
+def test_catch():
+    catch = {
+        "ErrorEquals": ["States.TaskFailed"],
+        "ResultPath": "$.error",
+        "Next": "recover",
+    }
+
+    interpreter = machine(task(Catch=[catch]), fn=flaky(1))
+
+    interpreter.definition["States"]["recover"] = {"Type": "Pass", "End": True}
+
+    output = interpreter.run({"id": 1})
+
+    assert output["id"] == 1
+    assert output["error"]["Error"] == "ConnectionError"
+
+
+def test_input_and_output_processing():
+    interpreter = machine(
+        task(
+            InputPath="$.order",
+            Parameters={"items.$": "$.items", "currency": "usd"},
+            ResultSelector={"total.$": "$.total"},
+            ResultPath="$.summary",
+            OutputPath="$.summary",
+        ),
+        fn=lambda event, context: {
+            "total": sum(event["items"]),
+            "currency": event["currency"],
+        },
+    )
+
+    assert interpreter.run({"order": {"items": [1, 2, 3]}}) == {"total": 6}
+
+
+def test_map_concurrency():
+    active, peak = [], []
+    lock = threading.Lock()
+
+    def track(n, context):
+        with lock:
+            active.append(n)
+            peak.append(len(active))
+        with lock:
+            active.remove(n)
+        return n * 2
+
+    interpreter = machine(
+        {
+            "Type": "Map",
+            "ItemsPath": "$.numbers",
+            "MaxConcurrency": 2,
+            "Iterator": {
+                "StartAt": "double",
+                "States": {"double": task(End=True)},
+            },
+        },
+        fn=track,
+    )
+
+    assert interpreter.run({"numbers": list(range(20))}) == list(
+        range(0, 40, 2)
+    )
+    assert max(peak) <= 2
+    assert {t.path[:2] for t in interpreter.trace if len(t.path) == 3} == {
+        ("a", i) for i in range(20)
+    }
+
+
+def test_choice_wait_and_fail():
+    interpreter = machine(
+        {"Type": "Wait", "SecondsPath": "$.delay"},
+        {
+            "Type": "Choice",
+            "Choices": [
+                {"Variable": "$.delay", "NumericGreaterThan": 10, "Next": "c"}
+            ],
+            "Default": "d",
+        },
+        {"Type": "Fail", "Error": "TooSlow"},
+        {"Type": "Succeed"},
+    )
+    interpreter.clock = clock = VirtualClock(start=0)
+
+    assert interpreter.run({"delay": 5}) == {"delay": 5}
+    assert clock.now() == 5
+
+    with pytest.raises(ExecutionFailed, match="TooSlow"):
+        interpreter.run({"delay": 60})
+
+
+def test_unbound_resource():
+    with pytest.raises(ExecutionFailed, match="States.Runtime"):
+        machine(task()).run({})
+
+
+def test_cdk_definition():
+    stack = cdk.Stack(cdk.App(), "interpreted")
+
+    definition = stack.resolve(
+        sfn.StateGraph(divide_by.definition(stack), "graph").to_graph_json()
+    )
+
+    resources = {
+        json.dumps(stack.resolve(c._lambda_function.function_arn)): c
+        for c in Graph(divide_by)
+    }
+
+    assert Interpreter(definition, resources).run([0, 1, 2]) == 4.5
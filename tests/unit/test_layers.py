@@ -0,0 +1,152 @@
+from pathlib import Path
+
+import pytest
+from aws_cdk import aws_lambda, core as cdk
+
+from examples.for_testing import hello_world
+from orkestra import compose
+from orkestra.layers import (
+    common_requirements,
+    read_requirements,
+    share_dependencies,
+    shared_dependencies,
+)
+
+
+def cfn(stack, cls):
+    return [c for c in stack.node.find_all() if isinstance(c, cls)]
+
+
+def make_entry(path, *requirements):
+    path.mkdir()
+    (path / "requirements.txt").write_text(
+        "# requirements\n" + "\n".join(requirements) + "\n"
+    )
+    (path / "test_layers.py").write_text("")
+    return str(path)
+
+
+@pytest.fixture
+def entries(tmp_path):
+    return (
+        make_entry(tmp_path / "one", "boto3==1.17.18", "fastapi  # web"),
+        make_entry(tmp_path / "two", "numpy", "boto3==1.17.18"),
+    )
+
+
+@pytest.fixture
+def composed(entries):
+    @compose
+    def first(event, context):
+        ...
+
+    @compose
+    def second(event, context):
+        ...
+
+    @compose
+    def third(event, context):
+        ...
+
+    first >> [second, third]
+
+    first.aws_lambda_constructor_kwargs["entry"] = entries[0]
+    second.aws_lambda_constructor_kwargs["entry"] = entries[1]
+    third.aws_lambda_constructor_kwargs["entry"] = entries[1]
+
+    return first, second, third
+
+
+def test_read_requirements(entries):
+    assert read_requirements(entries[0]) == ["boto3==1.17.18", "fastapi"]
+    assert read_requirements("nowhere") == []
+
+
+def test_common_requirements(entries):
+    assert common_requirements(entries) == ["boto3==1.17.18"]
+    assert common_requirements([]) == []
+
+
+def test_layers_are_rendered_once_per_stack():
+    stack = cdk.Stack(cdk.App(), "layers")
+
+    hello_world.aws_lambda(stack, "first")
+    hello_world.aws_lambda(stack, "second")
+
+    assert len(cfn(stack, aws_lambda.CfnLayerVersion)) == 1
+
+
+def test_share_dependencies(composed, tmp_path):
+    first, second, third = composed
+
+    stack = cdk.Stack(cdk.App(), "sharedDependencies")
+
+    shared = share_dependencies(stack, first, directory=tmp_path / "gen")
+
+    assert shared is shared_dependencies(stack)
+    assert shared.requirements == ["boto3==1.17.18"]
+
+    [layer_entry] = (tmp_path / "gen").glob("layer-*")
+    assert read_requirements(layer_entry) == ["boto3==1.17.18"]
+
+    generated = [shared.entries[e] for e in sorted(shared.entries)]
+    assert [read_requirements(e) for e in generated] == [
+        ["fastapi"],
+        ["numpy"],
+    ]
+
+    for composable in composed:
+        composable.aws_lambda(stack)
+
+    [layer] = cfn(stack, aws_lambda.CfnLayerVersion)
+
+    functions = cfn(stack, aws_lambda.CfnFunction)
+
+    assert len(functions) == 3
+
+    for function in functions:
+        assert stack.resolve(function.layers) == [stack.resolve(layer.ref)]
+
+    with pytest.raises(ValueError):
+        share_dependencies(stack, first)
+
+
+def test_share_dependencies_inside_an_entry(composed, entries):
+    first, *_ = composed
+
+    outdir = Path(entries[0], "synthesized")
+
+    stack = cdk.Stack(cdk.App(outdir=str(outdir)), "outdirInEntry")
+
+    shared = share_dependencies(stack, first)
+
+    generated = Path(shared.entries[entries[0]])
+
+    assert outdir in generated.parents
+
+    assert sorted(p.name for p in generated.iterdir()) == [
+        "requirements.txt",
+        "test_layers.py",
+    ]
+
+
+def test_share_dependencies_after_rendering(composed, tmp_path):
+    first, second, _ = composed
+
+    stack = cdk.Stack(cdk.App(), "renderedTooSoon")
+
+    second.aws_lambda(stack)
+
+    with pytest.raises(ValueError):
+        share_dependencies(stack, first, directory=tmp_path)
+
+
+def test_nothing_to_share(composed, tmp_path):
+    first, *_ = composed
+
+    stack = cdk.Stack(cdk.App(), "nothingShared")
+
+    first.downstream.clear()
+
+    assert share_dependencies(stack, first, directory=tmp_path) is None
+    assert shared_dependencies(stack) is None
@@ -0,0 +1,421 @@
+import asyncio
+import json
+import threading
+from unittest.mock import ANY
+
+import pytest
+
+from examples import map_job, orchestration
+from examples.for_testing import (
+    auto_invert,
+    distributed_double,
+    invalid_composition,
+)
+from orkestra import compose
+from orkestra.exceptions import CompositionError
+from orkestra.storage import (
+    POINTER_KEY,
+    S3Location,
+    dump_items,
+    load_items,
+    local_s3,
+    resolve,
+)
+
+
+def test_chain():
+    assert orchestration.make_person.run_local({}) == {}
+
+
+def test_map_job_example():
+    result = map_job.ones_and_zeros.run_local({})
+    assert isinstance(result, float)
+
+
+def test_resilient_parallelism():
+    assert orchestration.random_food.run_local({}) == {}
+
+
+def test_capture_map_errors():
+    result = map_job.divide_by.run_local([0, 1, 2])
+    # filter_division_errors >> sum_up >> times_3
+    assert result == (1 + 0.5) * 3
+
+
+def test_map_errors_are_error_outputs():
+    @compose(is_map_job=True, capture_map_errors=True)
+    def invert(n, context):
+        return 1 / n
+
+    error, one = invert.run_local([0, 1])
+
+    assert error["Error"] == "ZeroDivisionError"
+    assert json.loads(error["Cause"])["errorType"] == "ZeroDivisionError"
+    assert one == 1
+
+
+def test_map_errors_raise_when_not_captured():
+    @compose(is_map_job=True)
+    def invert(n, context):
+        return 1 / n
+
+    with pytest.raises(ZeroDivisionError):
+        invert.run_local([1, 0])
+
+
+def test_parallel_branches_run_concurrently_and_in_order():
+    barrier = threading.Barrier(3, timeout=5)
+
+    def branch(i):
+        @compose
+        def wait(event, context):
+            barrier.wait()
+            return i
+
+        return wait
+
+    @compose
+    def start(event, context):
+        return event
+
+    start >> [branch(i) for i in range(3)]
+
+    assert start.run_local(None) == [0, 1, 2]
+
+
+def test_list_branch_errors_raise():
+    @compose
+    def start(event, context):
+        return event
+
+    start >> [orchestration.random_animal, orchestration.random_error]
+
+    with pytest.raises((ValueError, TypeError, OSError)):
+        start.run_local({})
+
+
+def test_max_concurrency():
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    @compose(is_map_job=True, max_concurrency=2)
+    def track(n, context):
+        with lock:
+            active.append(n)
+            peak.append(len(active))
+        with lock:
+            active.remove(n)
+        return n
+
+    assert track.run_local(list(range(20)), max_workers=8) == list(range(20))
+    assert max(peak) <= 2
+
+
+def test_cycle():
+    with pytest.raises(CompositionError):
+        invalid_composition.run_local({})
+
+
+def test_multiple_downstream():
+    @compose
+    def a(event, context):
+        ...
+
+    @compose
+    def b(event, context):
+        ...
+
+    @compose
+    def c(event, context):
+        ...
+
+    a >> b
+    a >> c
+
+    with pytest.raises(CompositionError):
+        a.run_local({})
+
+
+def test_async_map_items_are_awaited_concurrently():
+    started = []
+
+    @compose(is_map_job=True)
+    async def wait_for_all(n, context):
+        started.append(threading.get_ident())
+        for _ in range(1000):
+            if len(started) == 5:
+                break
+            await asyncio.sleep(0)
+        assert len(started) == 5
+        return n * 2
+
+    @compose
+    def start(event, context):
+        return list(range(5))
+
+    start >> wait_for_all
+
+    assert start.run_local({}) == [0, 2, 4, 6, 8]
+    assert len(set(started)) == 1
+
+
+def test_async_parallel_branches():
+    @compose
+    async def one(event, context):
+        return 1
+
+    @compose
+    async def fail(event, context):
+        raise ValueError("nope")
+
+    @compose
+    def start(event, context):
+        return event
+
+    start >> (one, fail)
+
+    one_, error = start.run_local({})
+
+    assert one_ == 1
+    assert error["Error"] == "ValueError"
+
+
+def test_process_map_backend():
+    result = map_job.divide_by.run_local(
+        [0, 1, 2, 4],
+        map_backend="process",
+        max_workers=2,
+        chunksize=1,
+    )
+    assert result == (1 + 0.5 + 0.25) * 3
+
+
+@compose(is_map_job=True)
+def square(n, context):
+    return n * n
+
+
+def test_process_map_backend_keeps_order():
+    result = square.run_local(
+        list(range(1000)),
+        map_backend="process",
+        max_workers=2,
+    )
+    assert result == [n * n for n in range(1000)]
+
+
+def test_process_map_backend_falls_back_to_threads(caplog):
+    @compose(is_map_job=True)
+    def triple(n, context):
+        return n * 3
+
+    assert triple.run_local([1, 2], map_backend="process") == [3, 6]
+    assert "running its map job on threads" in caplog.text
+
+
+def test_invalid_map_backend():
+    with pytest.raises(ValueError):
+        map_job.divide_by.run_local([1], map_backend="gpu")
+
+
+def test_async_batched_map_job():
+    @compose(is_map_job=True, batch_size=2)
+    async def double(n, context):
+        return n * 2
+
+    assert double.run_local([1, 2, 3]) == [2, 4, 6]
+
+
+def test_async_steps_decode_and_encode():
+    @compose(codec="json+gzip")
+    def start(event, context):
+        return event
+
+    @compose
+    async def one(event, context):
+        return event["n"]
+
+    @compose(codec="json+gzip")
+    async def two(event, context):
+        return event["n"] * 2
+
+    @compose
+    def end(event, context):
+        return event
+
+    start >> [one, two] >> end
+
+    assert start.run_local({"n": 1}) == [1, 2]
+
+
+def test_async_metrics():
+    from orkestra import metrics
+
+    @compose(is_map_job=True, metrics=True)
+    async def measured(n, context):
+        return n
+
+    metrics.set_sink(metrics.MemorySink())
+
+    try:
+        assert measured.run_local([1, 2]) == [1, 2]
+        assert len(metrics.sink().values("Duration", Step="measured")) == 2
+    finally:
+        metrics.set_sink(None)
+
+
+@compose(is_map_job=True, batch_size=3, capture_map_errors=True)
+def batched_invert(n, context):
+    return 1 / n
+
+
+@pytest.mark.parametrize("map_backend", ["thread", "process"])
+def test_batched_map_job(map_backend):
+    calls = []
+
+    @compose(is_map_job=True, batch_size=4)
+    def count_calls(n, context):
+        calls.append(n)
+        return n + 1
+
+    assert count_calls.run_local(list(range(10))) == list(range(1, 11))
+    assert len(calls) == 10
+
+    error, *rest = batched_invert.run_local(
+        [0, 1, 2, 4], map_backend=map_backend
+    )
+    assert error["Error"] == "ZeroDivisionError"
+    assert rest == [1, 0.5, 0.25]
+
+
+def test_distributed_map_job(tmp_path):
+    items = S3Location.from_uri("s3://orkestra-example-items/items/ints.jsonl")
+
+    with local_s3(tmp_path):
+        items.put(dump_items(list(range(25_000))))
+
+    output = distributed_double.run_local(
+        {"bucket": items.bucket, "key": items.key},
+        s3_root=tmp_path,
+    )
+
+    details = output["ResultWriterDetails"]
+
+    assert details["Bucket"] == "orkestra-example-items"
+
+    with local_s3(tmp_path):
+        results = list(
+            load_items(S3Location(details["Bucket"], details["Key"]))
+        )
+
+    assert results == [n * 2 for n in range(25_000)]
+
+
+def test_auto_map_job_inline(tmp_path):
+    error, *rest = auto_invert.run_local([0, 1, 2], s3_root=tmp_path)
+
+    assert error["Error"] == "ZeroDivisionError"
+    assert rest == [1, 0.5]
+    assert not any(tmp_path.iterdir())
+
+
+def test_auto_map_job_distributed(tmp_path):
+    error, *rest = auto_invert.run_local([0, 1, 2, 4, 5, 10], s3_root=tmp_path)
+
+    assert error["Error"] == "ZeroDivisionError"
+    assert rest == [1, 0.5, 0.25, 0.2, 0.1]
+
+    [staged] = (tmp_path / "orkestra-example-items" / "staged").iterdir()
+
+    assert staged.read_text().splitlines() == ["0", "1", "2", "4", "5", "10"]
+
+
+def test_csv_items(tmp_path):
+    @compose(
+        is_map_job=True,
+        item_source="s3",
+        item_format="csv",
+        items_location="s3://bucket/people",
+    )
+    def name(person, context):
+        return person["name"]
+
+    location = S3Location("bucket", "people/people.csv")
+
+    with local_s3(tmp_path):
+        location.put(
+            dump_items(
+                [{"name": "sam", "age": 1}, {"name": "jay", "age": 2}], "csv"
+            )
+        )
+
+    assert (
+        name.run_local(
+            {"bucket": location.bucket, "key": location.key},
+            s3_root=tmp_path,
+        )
+        == ["sam", "jay"]
+    )
+
+
+def test_offloaded_outputs(tmp_path):
+    @compose(offload_location="s3://bucket/offloaded", offload_threshold=100)
+    def numbers(event, context):
+        return list(range(event))
+
+    @compose
+    def total(event, context):
+        return sum(event)
+
+    numbers >> total
+
+    assert numbers.run_local(10, s3_root=tmp_path) == 45
+    assert not (tmp_path / "bucket").exists()
+
+    assert numbers.run_local(1000, s3_root=tmp_path) == sum(range(1000))
+
+    [offloaded] = (tmp_path / "bucket" / "offloaded").iterdir()
+
+    assert json.loads(offloaded.read_text()) == list(range(1000))
+
+
+def test_offloaded_batches(tmp_path):
+    @compose(
+        is_map_job=True,
+        batch_size=10,
+        offload_location="s3://bucket/batches",
+        offload_threshold=0,
+    )
+    def halve(n, context):
+        return n / 2
+
+    assert halve.run_local(list(range(25)), s3_root=tmp_path) == {
+        POINTER_KEY: ANY
+    }
+
+    with local_s3(tmp_path):
+        assert resolve(halve.run_local(list(range(25)))) == [
+            n / 2 for n in range(25)
+        ]
+
+
+def test_back_to_back_map_jobs_are_pipelined():
+    second_stage_started = threading.Event()
+
+    @compose(is_map_job=True)
+    def straggle(n, context):
+        # the first item can only finish once another has reached stage two
+        if n == 0:
+            assert second_stage_started.wait(timeout=5)
+        return n
+
+    @compose(is_map_job=True)
+    def stage_two(n, context):
+        second_stage_started.set()
+        return n + 1
+
+    straggle >> stage_two
+
+    assert straggle.fusible_maps() == [straggle, stage_two]
+    assert straggle.run_local([0, 1, 2], max_workers=3) == [1, 2, 3]
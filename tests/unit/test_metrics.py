@@ -0,0 +1,174 @@
+import json
+
+import pytest
+
+from orkestra import compose, metrics
+
+
+@pytest.fixture
+def sink(monkeypatch):
+    sink = metrics.MemorySink()
+
+    monkeypatch.setattr(metrics, "_sink", sink)
+
+    monkeypatch.setattr(metrics, "_cold_start", True)
+
+    return sink
+
+
+def test_records(sink):
+    @compose(metrics=True)
+    def greet(event, context):
+        return {"greeting": f"hello, {event['name']}"}
+
+    event = {"name": "sam"}
+
+    greet(event)
+    greet(event)
+
+    first, second = sink.documents
+
+    assert first["_aws"]["CloudWatchMetrics"] == [
+        {
+            "Namespace": "Orkestra",
+            "Dimensions": [["Dag", "Step"]],
+            "Metrics": [
+                {"Name": name, "Unit": unit}
+                for name, unit in metrics.UNITS.items()
+            ],
+        }
+    ]
+
+    assert first["Dag"] == first["Step"] == "greet"
+    assert first["EventBytes"] == len(json.dumps(event))
+    assert first["ResponseBytes"] == len(json.dumps(greet.func(event, None)))
+    assert first["Duration"] >= 0
+    assert first["Errors"] == 0
+    assert sink.values("ColdStart") == [1, 0]
+
+
+def test_errors(sink):
+    @compose(metrics=True)
+    def fail(event, context):
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        fail({})
+
+    [document] = sink.documents
+
+    assert document["Errors"] == 1
+    assert "ResponseBytes" not in document
+
+
+def test_disabled(sink, monkeypatch):
+    @compose
+    def noop(event, context):
+        ...
+
+    # payloads aren't encoded to be measured, either
+
+    monkeypatch.setattr(metrics, "_size", None)
+
+    noop({})
+
+    assert sink.documents == []
+
+
+def test_map_item_index(sink):
+    @compose(metrics=True)
+    def start(event, context):
+        return event
+
+    @compose(is_map_job=True, metrics=True)
+    def double(n, context):
+        return n * 2
+
+    start >> double
+
+    start.run_local([1, 2, 3])
+
+    assert sink.values("Dag", Step="double") == ["start"] * 3
+
+    assert sorted(
+        d["MapItemIndex"] for d in sink.documents if d["Step"] == "double"
+    ) == [0, 1, 2]
+
+    # one metric per step, not per item
+
+    [document] = [d for d in sink.documents if d.get("MapItemIndex") == 1]
+
+    assert document["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [
+        ["Dag", "Step"],
+    ]
+
+
+def test_map_item_index_from_the_map_state(sink):
+    from orkestra.asl import render
+
+    @compose(is_map_job=True, metrics=True)
+    def double(n, context):
+        return n * 2
+
+    [state] = render(double)["States"].values()
+
+    assert state["Parameters"] == {
+        "__orkestra_map_item__.$": "$$.Map.Item.Value",
+        "__orkestra_map_item_index__.$": "$$.Map.Item.Index",
+    }
+
+    # as a deployed lambda is invoked by the map state
+
+    event = {"__orkestra_map_item__": 4, "__orkestra_map_item_index__": 7}
+
+    assert double(event) == 8
+
+    [document] = sink.documents
+
+    assert document["MapItemIndex"] == 7
+    assert document["EventBytes"] == 1
+
+
+def test_one_document_per_dimensions():
+    records = [
+        {
+            "Dag": "a",
+            "Step": "b",
+            "MapItemIndex": None,
+            "Duration": float(i),
+            "ColdStart": 0,
+        }
+        for i in range(150)
+    ]
+
+    first, second = metrics.emf(records)
+
+    assert first["Duration"] == [float(i) for i in range(100)]
+    assert second["Duration"] == [float(i) for i in range(100, 150)]
+    assert [
+        m["Name"] for m in first["_aws"]["CloudWatchMetrics"][0]["Metrics"]
+    ] == [
+        "Duration",
+        "ColdStart",
+    ]
+
+
+def test_stdout(monkeypatch, capsys):
+    monkeypatch.setattr(metrics, "_sink", None)
+
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_NAME", "greet")
+
+    monkeypatch.setenv(metrics.NAMESPACE_ENV, "Greetings")
+
+    @compose(metrics=True)
+    def greet(event, context):
+        return "hello"
+
+    greet({})
+
+    [line] = capsys.readouterr().out.splitlines()
+
+    document = json.loads(line)
+
+    assert document["_aws"]["CloudWatchMetrics"][0]["Namespace"] == "Greetings"
+    assert document["Step"] == "greet"
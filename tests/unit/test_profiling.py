@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from orkestra import compose, generic_context
+from orkestra.storage import local_s3
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+@compose(profile_sample_rate=1, profile_location="s3://profiles/orkestra")
+def spin(event, context):
+    busy(0.05)
+    return [0] * 100_000
+
+
+def test_profile(tmp_path):
+    with local_s3(tmp_path):
+        assert spin({}, generic_context) == [0] * 100_000
+
+    reports = tmp_path / "profiles" / "orkestra" / "spin"
+
+    [directory] = reports.iterdir()
+
+    assert directory.name == generic_context.aws_request_id
+
+    stacks = (directory / "stacks.txt").read_text().splitlines()
+
+    assert stacks
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in stacks)
+    assert any(";busy (" in line for line in stacks)
+
+    allocations = (directory / "allocations.txt").read_text()
+
+    assert "peak traced memory" in allocations
+
+    # the returned list is the largest allocation still held
+    top = allocations.splitlines()[3]
+    assert "size=78" in top and "KiB" in top
+
+
+def test_profile_on_error(tmp_path):
+    @compose(profile_sample_rate=1, profile_location="s3://profiles")
+    def fail(event, context):
+        raise ValueError
+
+    with local_s3(tmp_path), pytest.raises(ValueError):
+        fail({}, generic_context)
+
+    assert (tmp_path / "profiles" / "fail").exists()
+
+
+def test_unsampled(tmp_path):
+    @compose(profile_sample_rate=0, profile_location="s3://profiles")
+    def noop(event, context):
+        ...
+
+    with local_s3(tmp_path):
+        noop({}, generic_context)
+
+    assert not any(tmp_path.iterdir())
+
+
+def test_validation():
+    with pytest.raises(ValueError):
+        compose(profile_sample_rate=0.5)
+
+    with pytest.raises(ValueError):
+        compose(profile_sample_rate=2, profile_location="s3://profiles")
+
+    with pytest.raises(ValueError):
+        compose(profile_sample_rate=0.5, profile_location="profiles")
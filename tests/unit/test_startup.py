@@ -0,0 +1,67 @@
+import subprocess
+import sys
+
+import orkestra
+from orkestra import startup
+
+
+def run(source: str) -> str:
+    return subprocess.run(
+        [sys.executable, "-c", source],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+
+
+def test_import_is_lazy():
+    assert (
+        run(
+            "import sys, orkestra; "
+            "print('orkestra.decorators' in sys.modules)"
+        )
+        == "False"
+    )
+
+
+def test_lazy_attributes():
+    from orkestra.decorators import compose
+
+    assert orkestra.compose is compose
+    assert "compose" in dir(orkestra)
+
+
+def test_powertools_not_imported_without_model():
+    source = """
+import sys
+from orkestra import compose
+
+@compose(enable_powertools=True)
+def handler(event, context):
+    return event
+
+handler({}, None)
+
+print("aws_lambda_powertools" in sys.modules)
+"""
+
+    assert run(source) == "False"
+
+
+def test_import_costs():
+    module_report = startup.import_costs("orkestra.decorators")
+
+    assert module_report.error is None
+
+    modules = [c.module for c in module_report.costs]
+
+    assert "orkestra.decorators" in modules
+    assert "orkestra.interfaces" in modules
+    assert module_report.total_us > 0
+
+
+def test_report():
+    result = startup.report(["orkestra", "orkestra.does_not_exist"])
+
+    assert "orkestra:" in result
+    assert "orkestra.does_not_exist: failed to import" in result
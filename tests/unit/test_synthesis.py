@@ -0,0 +1,79 @@
+import json
+
+import pytest
+from aws_cdk import core as cdk
+
+from examples.for_testing import state_machine_stack
+from orkestra.synthesis import StackSpec, synth_in_parallel
+
+STACKS = [
+    StackSpec("large", state_machine_stack),
+    StackSpec("batched", state_machine_stack, {"root": "batched_double"}),
+    StackSpec("auto", state_machine_stack, {"root": "auto_invert"}),
+]
+
+
+def contents(outdir):
+    return {
+        path.relative_to(outdir).as_posix(): path.read_text()
+        for path in sorted(outdir.rglob("*"))
+        if path.is_file()
+    }
+
+
+@pytest.fixture
+def bundling_skipped(monkeypatch):
+    # start this process's jsii runtime first, as earlier tests would have,
+    # so serial synthesis can't rely on it reading the environment
+
+    cdk.App()
+
+    monkeypatch.setenv(
+        "CDK_CONTEXT_JSON", json.dumps({"aws:cdk:bundling-stacks": []})
+    )
+
+
+def test_same_whatever_the_workers(tmp_path, bundling_skipped):
+    serial = synth_in_parallel(STACKS, tmp_path / "serial", workers=1)
+
+    parallel = synth_in_parallel(STACKS, tmp_path / "parallel", workers=2)
+
+    assert contents(serial) == contents(parallel)
+
+    manifest = json.loads((parallel / "manifest.json").read_text())
+
+    assert list(manifest["artifacts"]) == [
+        "Tree",
+        "large",
+        "batched",
+        "auto",
+    ]
+
+    tree = json.loads((parallel / "tree.json").read_text())
+
+    assert list(tree["tree"]["children"]) == list(manifest["artifacts"])
+
+    template = json.loads((parallel / "auto.template.json").read_text())
+
+    assert any(
+        resource["Type"] == "AWS::StepFunctions::StateMachine"
+        for resource in template["Resources"].values()
+    )
+
+    # nothing is left beside the assembly
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "parallel",
+        "serial",
+    ]
+
+
+def test_validation(tmp_path):
+    with pytest.raises(ValueError):
+        synth_in_parallel([], tmp_path)
+
+    with pytest.raises(ValueError):
+        synth_in_parallel(STACKS[:1] * 2, tmp_path)
+
+    with pytest.raises(ValueError):
+        synth_in_parallel(STACKS, tmp_path, workers=-1)